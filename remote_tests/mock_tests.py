@@ -65,16 +65,20 @@ class MockSimulationModelTests(unittest.TestCase):
         :param expected_statuses: List of statuses that will stop the wait.
         """
         MAX_WAIT_TIME = 3  # Seconds
-        QUERY_INTERVAL = 0.2 # Seconds between queries
-        time_waited = 0
-        while time_waited <= MAX_WAIT_TIME:
-            resp = requests.get(resource_url, headers=self.headers)
+        deadline = time.time() + MAX_WAIT_TIME
+        resp = requests.get(resource_url, headers=self.headers)
+        self.assertEqual(resp.status_code, 200)
+        resource_status = resp.json()[status_field]
+        while resource_status not in expected_statuses:
+            time_left = deadline - time.time()
+            if time_left <= 0:
+                return None
+            # Wait on the server for the status to change (long poll) instead of polling repeatedly
+            resp = requests.get(resource_url + 'watch/', headers=self.headers,
+                                params={'status': resource_status, 'timeout': time_left})
             self.assertEqual(resp.status_code, 200)
             resource_status = resp.json()[status_field]
-            if resource_status in expected_statuses:
-                return resource_status
-            time.sleep(QUERY_INTERVAL)
-            time_waited += QUERY_INTERVAL
+        return resource_status
 
     def get_simulations(self, group_id):
         """
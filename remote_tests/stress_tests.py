@@ -0,0 +1,97 @@
+# This file is part of the Simulation Manager project for VecNet.
+# For copyright and licensing information about this project, see the
+# NOTICE.txt and LICENSE.md files in its top-level directory; they are
+# available at https://github.com/vecnet/simulation-manager
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import time
+import unittest
+from multiprocessing.pool import ThreadPool
+
+import requests
+from vecnet.simulation import ExecutionRequest, SimulationGroup, sim_status
+
+from conf import Api, Settings
+
+
+class StatusUpdateStressTests(unittest.TestCase):
+    """
+    Stress test of the server's database: many clients update simulation statuses at the same time, like the
+    run_simulation.py scripts of many cluster jobs.  The test reports the write throughput that the server sustained.
+    """
+
+    SIMULATIONS = 200
+    CLIENTS = 32  # Number of concurrent clients
+    STATUSES = (sim_status.STARTED_SCRIPT, sim_status.STAGING_INPUT, sim_status.RUNNING_MODEL,
+                sim_status.STAGING_OUTPUT, sim_status.SCRIPT_DONE)
+
+    @classmethod
+    def setUpClass(cls):
+        super(StatusUpdateStressTests, cls).setUpClass()
+        cls.headers = {
+            'Authorization': "ApiKey %s:%s" % (Settings.user, Settings.api_key),
+            'Content-type': "application/json",
+        }
+
+    def create_simulations(self):
+        """
+        Create a group (with no simulations to run) and then add the test's simulations to it.
+
+        :return list: The URLs of the new simulations.
+        """
+        execution_request = ExecutionRequest(simulation_group=SimulationGroup())
+        resp = requests.post(Api.make_url(Api.make_full_url_path('sim-groups')), headers=self.headers,
+                             data=json.dumps(execution_request.to_dict()))
+        self.assertEqual(resp.status_code, 201)
+        group_path = resp.headers['Location'][len(Api.make_url('')):]
+
+        body = {
+            'group': group_path,
+            'objects': [{'id_on_client': 'stress-%d' % i} for i in range(self.SIMULATIONS)],
+        }
+        resp = requests.post(Api.make_url(Api.make_full_url_path('simulations', 'bulk')), headers=self.headers,
+                             data=json.dumps(body))
+        self.assertEqual(resp.status_code, 201)
+        return [Api.make_url(x['resource_uri']) for x in resp.json()['objects']]
+
+    def update_statuses(self, simulation_url):
+        """
+        Update a simulation through all its statuses, one request at a time.
+
+        :return list: The HTTP status codes of the requests.
+        """
+        session = requests.Session()
+        status_codes = []
+        for status in self.STATUSES:
+            resp = session.patch(simulation_url, headers=self.headers, data=json.dumps({'status': status}))
+            status_codes.append(resp.status_code)
+        return status_codes
+
+    def test_concurrent_status_updates(self):
+        simulation_urls = self.create_simulations()
+
+        pool = ThreadPool(self.CLIENTS)
+        try:
+            start = time.time()
+            results = pool.map(self.update_statuses, simulation_urls)
+            elapsed = time.time() - start
+        finally:
+            pool.close()
+            pool.join()
+
+        updates = len(simulation_urls) * len(self.STATUSES)
+        print '\n  %d status updates by %d clients in %.2f seconds: %.1f updates/second' % (
+            updates, self.CLIENTS, elapsed, updates / elapsed)
+
+        failures = [code for codes in results for code in codes if code not in (200, 202)]
+        self.assertEqual(failures, [])
+
+        # No updates were lost
+        for simulation_url in simulation_urls:
+            resp = requests.get(simulation_url, headers=self.headers)
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.json()['status'], sim_status.SCRIPT_DONE)
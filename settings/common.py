@@ -64,9 +64,22 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': PROJECT_ROOT / 'db' / 'db.sqlite3',
+        'OPTIONS': {
+            'timeout': 30,  # Seconds to wait for a lock held by another connection before "database is locked"
+        },
     }
 }
 
+# SQLite's journal mode.  In WAL mode, readers and the writer don't block each other (see sim_manager/sqlite.py).
+SQLITE_JOURNAL_MODE = 'WAL'
+
+# Coalesce concurrent simulation status updates (PATCH requests) into batched transactions, so SQLite commits fewer,
+# larger transactions (see sim_manager/write_queue.py).  The batch size is the maximum number of updates in a
+# transaction, and the delay is how long (seconds) to wait for more updates before starting a transaction.
+COALESCE_STATUS_WRITES = DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3'
+WRITE_BATCH_SIZE = 100
+WRITE_BATCH_DELAY = 0.002
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.6/topics/i18n/
 
@@ -95,6 +108,15 @@ GROUP_WORKING_DIRS = PROJECT_ROOT / 'working-dirs' / 'sim-groups'
 # Where working directories for individual simulations
 SIMULATION_WORKING_DIRS = PROJECT_ROOT / 'working-dirs' / 'simulations'
 
+# Maximum number of seconds that a request to an API "watch" endpoint waits for a status change
+STATUS_WATCH_MAX_TIMEOUT = 60
+
+# Maximum number of seconds between database reads of a watched status (to catch changes made by other web processes)
+STATUS_WATCH_RECHECK_INTERVAL = 5
+
+# Number of seconds that validated API credentials are cached by each web process
+API_KEY_CACHE_TTL = 300
+
 # Path to the Python interpreter that's used to execute the command-line scripts.  For Apache/WSGI deployments, this
 # will be different than the system Python.
 if RUNNING_MANAGE_PY:
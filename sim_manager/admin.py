@@ -9,7 +9,8 @@
 
 from django.contrib import admin
 
-from sim_manager.models import Simulation, SimulationGroup
+from sim_manager.models import Simulation, SimulationGroup, SimulationStatusEvent
 
 admin.site.register(Simulation)
-admin.site.register(SimulationGroup)
\ No newline at end of file
+admin.site.register(SimulationGroup)
+admin.site.register(SimulationStatusEvent)
@@ -7,19 +7,173 @@
 # License (MPL), version 2.0. If a copy of the MPL was not distributed
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
-from tastypie import fields
+import json
+import logging
+import shutil
+import sys
+import tempfile
+import zlib
+
+from django.conf import settings
+from django.conf.urls import url
+from django.core.exceptions import MultipleObjectsReturned, ObjectDoesNotExist, ValidationError
+from django.db import DatabaseError, transaction
+from tastypie import fields, http
 from tastypie.api import Api
-from tastypie.authentication import ApiKeyAuthentication
 from tastypie.authorization import Authorization
 from tastypie.bundle import Bundle
 from tastypie.exceptions import BadRequest, NotFound, ImmediateHttpResponse
 from tastypie.http import HttpApplicationError
 from tastypie.resources import ALL, ModelResource, Resource
+from tastypie.utils import dict_strip_unicode_keys, trailing_slash
 
-from vecnet.simulation import DictConvertible, ExecutionRequest
+from vecnet.simulation import DictConvertible, ExecutionRequest, Simulation as SimulationDefinition
 
+from sim_manager import latency, write_queue
+from sim_manager.auth import CachedApiKeyAuthentication, credential_cache
 from sim_manager.models import Simulation, SimulationGroup
-from sim_manager.scripts import api_urls
+from sim_manager.pagination import CursorPaginator
+from sim_manager.status_watch import StatusWatcher, watcher
+from sim_manager.scripts import api_urls, execution_requests
+from sim_manager.scripts.streaming_json import GzipReader, JsonStreamParser
+
+logger = logging.getLogger(__name__)
+
+
+class ForeignKeyById(fields.ForeignKey):
+    """
+    A foreign key whose resource URI is built from the raw id in the model's column (e.g., group_id), so the related
+    object isn't fetched from the database for each object in a list.
+    """
+
+    def dehydrate(self, bundle, for_list=True):
+        related_id = getattr(bundle.obj, '%s_id' % self.attribute, None)
+        if related_id is None or self.full:
+            return super(ForeignKeyById, self).dehydrate(bundle, for_list=for_list)
+        related_resource = self.get_related_resource(None)
+        related_obj = related_resource._meta.object_class(pk=related_id)
+        return related_resource.get_resource_uri(related_obj)
+
+
+class SparseFieldsMixin(object):
+    """
+    Lets a client choose the fields in the objects it gets, and get a list in a compact form.
+
+    The "fields" parameter is a comma-separated list of the fields to include (e.g., "fields=id,status"); only those
+    fields are dehydrated.  With the "compact=true" parameter, a list's objects are returned as rows of values, with the
+    names of the fields listed once:
+
+        {
+          "meta": {...},
+          "columns": ["id", "status"],
+          "rows": [[1, "done"], [2, "model"], ...]
+        }
+    """
+
+    def get_requested_fields(self, request):
+        """
+        Get the fields in the request's "fields" parameter.
+
+        :return: The list of field names, or None if the parameter wasn't given.
+        :raises BadRequest: if there's an unknown field in the list.
+        """
+        if request is None or not request.GET.get('fields'):
+            return None
+        field_names = [x.strip() for x in request.GET['fields'].split(',') if x.strip()]
+        unknown_fields = [x for x in field_names if x not in self.fields]
+        if unknown_fields:
+            raise BadRequest('Unknown fields: %s' % ', '.join(unknown_fields))
+        return field_names
+
+    def full_dehydrate(self, bundle, for_list=False):
+        field_names = self.get_requested_fields(bundle.request)
+        if field_names is None:
+            return super(SparseFieldsMixin, self).full_dehydrate(bundle, for_list=for_list)
+
+        # Same as Tastypie's method, but only for the requested fields (the use_in settings are ignored since the
+        # client asked for the fields explicitly)
+        for field_name in field_names:
+            field_object = self.fields[field_name]
+            if getattr(field_object, 'dehydrated_type', None) == 'related':
+                field_object.api_name = self._meta.api_name
+                field_object.resource_name = self._meta.resource_name
+            bundle.data[field_name] = field_object.dehydrate(bundle, for_list=for_list)
+            method = getattr(self, 'dehydrate_%s' % field_name, None)
+            if method:
+                bundle.data[field_name] = method(bundle)
+        return self.dehydrate(bundle)
+
+    def alter_list_data_to_serialize(self, request, data):
+        data = super(SparseFieldsMixin, self).alter_list_data_to_serialize(request, data)
+        if request.GET.get('compact', '').lower() not in ('true', '1'):
+            return data
+        columns = self.get_requested_fields(request)
+        if columns is None:
+            columns = sorted(name for name, field in self.fields.items()
+                             if getattr(field, 'use_in', 'all') in ('all', 'list'))
+        bundles = data.pop(self._meta.collection_name)
+        data['columns'] = columns
+        data['rows'] = [[bundle.data.get(name) for name in columns] for bundle in bundles]
+        return data
+
+
+class StatusWatchMixin(object):
+    """
+    Adds a long-poll "watch" endpoint to a resource, so a client can wait for an object's status to change without
+    polling:
+
+        GET {resource_uri}watch/?status={the status the client knows}&timeout={seconds}
+
+    The request returns as soon as the object's status differs from the given status, or when the timeout expires
+    (at most settings.STATUS_WATCH_MAX_TIMEOUT seconds, which is also the default).  The response has the current
+    status and whether it changed:
+
+        {"resource_uri": "...", "status": "...", "changed": true}
+
+    The name of the status field is given in the derived class' Meta.watch_status_field member.
+    """
+
+    def watch_url(self):
+        return url(r"^(?P<resource_name>%s)/(?P<%s>\w[\w/-]*)/watch%s$" % (self._meta.resource_name,
+                                                                       self._meta.detail_uri_name, trailing_slash()),
+                   self.wrap_view('watch'), name='api_watch')
+
+    def watch(self, request, **kwargs):
+        self.method_check(request, allowed=['get'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+
+        status = request.GET.get('status')
+        if status is None:
+            raise BadRequest('Missing status parameter')
+        timeout = request.GET.get('timeout', settings.STATUS_WATCH_MAX_TIMEOUT)
+        try:
+            timeout = float(timeout)
+        except ValueError:
+            raise BadRequest("Invalid timeout '%s' provided.  Please provide a number of seconds." % timeout)
+        timeout = min(max(timeout, 0), settings.STATUS_WATCH_MAX_TIMEOUT)
+
+        bundle = self.build_bundle(request=request)
+        try:
+            obj = self.cached_obj_get(bundle=bundle, **self.remove_api_resource_names(kwargs))
+        except ObjectDoesNotExist:
+            return http.HttpNotFound()
+
+        status_field = self._meta.watch_status_field
+        model_class = obj.__class__
+
+        def get_status():
+            statuses = model_class.objects.filter(pk=obj.pk).values_list(status_field, flat=True)
+            return statuses[0] if statuses else None
+
+        current_status = watcher.wait_for_change(StatusWatcher.make_key(model_class, obj.pk), get_status, status,
+                                                 timeout)
+        self.log_throttled_access(request)
+        return self.create_response(request, {
+            'resource_uri': self.get_resource_uri(obj),
+            status_field: current_status,
+            'changed': current_status != status,
+        })
 
 
 class ModelResourceWithRestrictedUpdate(ModelResource):
@@ -35,26 +189,137 @@ class ModelResourceWithRestrictedUpdate(ModelResource):
         fields (no restricted fields).
         """
         # Based on http://stackoverflow.com/q/13704344/1258514
+        self.check_update_fields(new_data)
+        return super(ModelResourceWithRestrictedUpdate, self).update_in_place(request, original_bundle, new_data)
+
+    def check_update_fields(self, new_data):
+        """
+        Check that the new data only has fields which are allowed to be updated.
+
+        :raises BadRequest: if there's a restricted field in the new data.
+        """
         if set(new_data.keys()) - set(self._meta.allowed_update_fields):
             raise BadRequest(
                 'Only these fields can be updated: %s' % ', '.join(
                     self._meta.allowed_update_fields
                 )
             )
-        return super(ModelResourceWithRestrictedUpdate, self).update_in_place(request, original_bundle, new_data)
 
 
-class SimulationGroupResource(ModelResourceWithRestrictedUpdate):
+class SpooledSimulations(object):
+    """
+    Simulations spooled to a temporary file as they're received, so they don't have to be kept in memory.  The
+    simulations can be iterated over more than once.  Use as a context manager to remove the file when done.
+    """
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+        self.count = 0
+
+    def append(self, simulation_dict):
+        """
+        Validate a simulation's dictionary and add it to the file.
+
+        :raises DictConvertible.Error: if the dictionary isn't a valid simulation.
+        """
+        SimulationDefinition.from_dict(simulation_dict)
+        self.file.write(json.dumps(simulation_dict) + '\n')
+        self.count += 1
+
+    def __iter__(self):
+        self.file.seek(0)
+        for line in self.file:
+            yield SimulationDefinition.from_dict(json.loads(line))
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.file.close()
+
+
+# Filters for fields with database indexes; other lookups (e.g., "contains") would not use the indexes
+EXACT_FILTERS = ('exact', 'in')
+DATETIME_FILTERS = ('exact', 'gt', 'gte', 'lt', 'lte', 'range')
+
+
+class SimulationGroupResource(SparseFieldsMixin, StatusWatchMixin, ModelResourceWithRestrictedUpdate):
+    submitter = fields.CharField(attribute='submitter__username', readonly=True)
+
     class Meta:
-        queryset = SimulationGroup.objects.all()
+        queryset = SimulationGroup.objects.select_related('submitter')
         resource_name = 'sim-groups'
         list_allowed_methods = ['get', 'post']
         detail_allowed_methods = ['get', 'patch']
-        authentication = ApiKeyAuthentication()
+        authentication = CachedApiKeyAuthentication()
         authorization = Authorization()
+        filtering = {
+            'submitter': EXACT_FILTERS,
+            'script_status': EXACT_FILTERS,
+            'submitted_when': DATETIME_FILTERS,
+        }
+        ordering = ['id', 'submitted_when', 'script_status']
 
         # Metadata not used by Tastypie
         allowed_update_fields = ['script_status']  # Used by ModelResourceWithRestrictedUpdate.update_in_place method
+        watch_status_field = 'script_status'  # Used by StatusWatchMixin.watch method
+
+    def prepend_urls(self):
+        return [
+            url(r"^(?P<resource_name>%s)/(?P<%s>\w[\w/-]*)/manifest%s$" % (self._meta.resource_name,
+                                                                        self._meta.detail_uri_name, trailing_slash()),
+                self.wrap_view('get_manifest'), name='api_get_manifest'),
+            url(r"^(?P<resource_name>%s)/(?P<%s>\w[\w/-]*)/progress%s$" % (self._meta.resource_name,
+                                                                        self._meta.detail_uri_name, trailing_slash()),
+                self.wrap_view('get_progress'), name='api_get_progress'),
+            self.watch_url(),
+        ]
+
+    def post_list(self, request, **kwargs):
+        """
+        Create a new group from an execution request.
+
+        A JSON request body is parsed incrementally: each simulation is validated as it arrives and spooled to a
+        temporary file, from which it's written to the group's working directory.  So the whole execution request is
+        never in memory.  The body may be gzip-compressed (with the header "Content-Encoding: gzip").  Bodies in other
+        formats are handled by Tastypie.
+        """
+        content_type = request.META.get('CONTENT_TYPE', 'application/json')
+        if not content_type.startswith('application/json'):
+            return super(SimulationGroupResource, self).post_list(request, **kwargs)
+
+        content_encoding = request.META.get('HTTP_CONTENT_ENCODING', 'identity').lower()
+        if content_encoding == 'gzip':
+            body = GzipReader(request)
+        elif content_encoding == 'identity':
+            body = request
+        else:
+            raise BadRequest('Unsupported content encoding: %s' % content_encoding)
+
+        with SpooledSimulations() as simulations:
+            header = dict()
+            try:
+                for simulation_dict in JsonStreamParser(body).iter_array(execution_requests.SIMULATIONS_PATH,
+                                                                          header):
+                    simulations.append(simulation_dict)
+                execution_request = ExecutionRequest.from_dict(header)
+            except DictConvertible.Error as exc:
+                raise ImmediateHttpResponse(self.execution_request_error(request, exc))
+            except (ValueError, zlib.error) as exc:
+                raise BadRequest('Invalid data sent: %s' % exc)
+
+            bundle = self.build_bundle(data=dict(), request=request)
+            bundle = self.create_group(bundle, execution_request, simulations)
+
+        location = self.get_resource_uri(bundle)
+        if not self._meta.always_return_data:
+            return http.HttpCreated(location=location)
+        bundle = self.full_dehydrate(bundle)
+        bundle = self.alter_detail_data_to_serialize(request, bundle)
+        return self.create_response(request, bundle, response_class=http.HttpCreated, location=location)
 
     def obj_create(self, bundle, **kwargs):
         """
@@ -64,19 +329,42 @@ class SimulationGroupResource(ModelResourceWithRestrictedUpdate):
         try:
             execution_request = ExecutionRequest.from_dict(bundle.data)
         except DictConvertible.Error as exc:
-            error_info = {
-                'error': exc.error,
-                'error_details': exc.details,
-            }
-            raise ImmediateHttpResponse(self.error_response(bundle.request, error_info))
+            raise ImmediateHttpResponse(self.execution_request_error(bundle.request, exc))
+
+        simulation_group = execution_request.simulation_group
+        simulations = simulation_group.simulations if simulation_group is not None else []
+        return self.create_group(bundle, execution_request, simulations, **kwargs)
+
+    def execution_request_error(self, request, exc):
+        """
+        The error response for an invalid execution request.
+
+        :param DictConvertible.Error exc: The error that occurred while converting the request from a dictionary.
+        """
+        error_info = {
+            'error': exc.error,
+            'error_details': exc.details,
+        }
+        return self.error_response(request, error_info)
+
+    def create_group(self, bundle, execution_request, simulations, **kwargs):
+        """
+        Create a new group with its working directory, and start its submission script.
 
+        If the request has the query parameter "create_simulations=true", then the database records and working
+        directories for all the group's simulations are created too.  The submission script gets them from the
+        group's manifest rather than creating them itself.
+
+        :param simulations: The group's simulations; an iterable that can be iterated more than once.
+        """
         kwargs['submitter'] = bundle.request.user
         bundle = super(SimulationGroupResource, self).obj_create(bundle, **kwargs)
         group = bundle.obj
 
         try:
-            group.setup_working_dir(execution_request)
+            group.setup_working_dir(execution_request, simulations)
         except Exception as e:
+            self.remove_group(group)
             error_info = {
                 'error': "problem occurred when setting up the group's working directory",
                 'error_details': "%s" % e,
@@ -89,6 +377,27 @@ class SimulationGroupResource(ModelResourceWithRestrictedUpdate):
         simulations_url = bundle.request.build_absolute_uri(SimulationResource().get_resource_uri())
         api_urls.write_for_group(group.working_dir, group_url, simulations_url)
 
+        if bundle.request.GET.get('create_simulations', '').lower() in ('true', '1'):
+            simulation_dirs = []
+            try:
+                simulation_resource = SimulationResource()
+                simulation_group = execution_request.simulation_group
+                with transaction.atomic():
+                    new_simulations = group.create_simulations(simulations, simulation_group.default_model,
+                                                               simulation_group.default_version)
+                    for simulation in new_simulations.iterator():
+                        simulation_dirs.append(simulation.working_dir)
+                        simulation_resource.setup_working_dir(bundle.request, simulation)
+            except Exception as e:
+                # The simulations' records were rolled back
+                self.remove_group(group, simulation_dirs)
+                error_info = {
+                    'error': "problem occurred when creating the group's simulations",
+                    'error_details': "%s" % e,
+                }
+                raise ImmediateHttpResponse(self.error_response(bundle.request, error_info,
+                                                                response_class=HttpApplicationError))
+
         # Start the background process with the submit_group.py script
         if not group.start_submission_script():
             error_info = {
@@ -100,24 +409,104 @@ class SimulationGroupResource(ModelResourceWithRestrictedUpdate):
 
         return bundle
 
+    @staticmethod
+    def remove_group(group, simulation_dirs=()):
+        """
+        Remove a new group that couldn't be set up, along with its working directory and the working directories
+        created for its simulations, so the client can submit it again without leaving a duplicate group behind.
+        """
+        for working_dir in list(simulation_dirs) + [group.working_dir]:
+            shutil.rmtree(working_dir, ignore_errors=True)
+        group.delete()
+
+    def get_progress(self, request, **kwargs):
+        """
+        Get a summary of the progress of a group's simulations: the number of simulations with each status, the
+        number that have finished and that had errors, and when the earliest and latest simulations were created.
+        It's computed with one aggregate query, so its cost depends on the number of statuses, not simulations.
+        """
+        self.method_check(request, allowed=['get'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+
+        bundle = self.build_bundle(request=request)
+        try:
+            group = self.cached_obj_get(bundle=bundle, **self.remove_api_resource_names(kwargs))
+        except ObjectDoesNotExist:
+            return http.HttpNotFound()
+
+        progress = group.get_progress()
+        progress['group'] = self.get_resource_uri(group)
+        progress['script_status'] = group.script_status
+
+        self.log_throttled_access(request)
+        return self.create_response(request, progress)
+
+    def get_manifest(self, request, **kwargs):
+        """
+        Get the manifest of a group's simulations: the id, id on client, resource URI, working directory, batch job id
+        and status of each simulation in the database, ordered by id (i.e., the order they were created in).
+        """
+        self.method_check(request, allowed=['get'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+
+        bundle = self.build_bundle(request=request)
+        try:
+            group = self.cached_obj_get(bundle=bundle, **self.remove_api_resource_names(kwargs))
+        except ObjectDoesNotExist:
+            return http.HttpNotFound()
+
+        simulation_resource = SimulationResource()
+        simulations = []
+        for simulation in group.simulation_set.order_by('id'):
+            simulations.append({
+                'id': simulation.id,
+                'id_on_client': simulation.id_on_client,
+                'resource_uri': simulation_resource.get_resource_uri(simulation),
+                'working_dir': simulation.working_dir,
+                'batch_job_id': simulation.batch_job_id,
+                'status': simulation.status,
+            })
 
-class SimulationResource(ModelResourceWithRestrictedUpdate):
-    group = fields.ForeignKey(SimulationGroupResource, 'group')
+        self.log_throttled_access(request)
+        return self.create_response(request, {self._meta.collection_name: simulations})
+
+
+class SimulationResource(SparseFieldsMixin, StatusWatchMixin, ModelResourceWithRestrictedUpdate):
+    group = ForeignKeyById(SimulationGroupResource, 'group')
 
     class Meta:
         queryset = Simulation.objects.all()
         resource_name = 'simulations'
-        list_allowed_methods = ['get', 'post']
+        list_allowed_methods = ['get', 'post', 'patch']
         detail_allowed_methods = ['get', 'patch']
-        authentication = ApiKeyAuthentication()
+        authentication = CachedApiKeyAuthentication()
         authorization = Authorization()
         always_return_data = True
         filtering = {
             'group': ALL,
+            'status': EXACT_FILTERS,
+            'id_on_client': EXACT_FILTERS,
+            'batch_job_id': EXACT_FILTERS,
+            'created_when': DATETIME_FILTERS,
         }
+        ordering = ['id', 'created_when', 'status', 'id_on_client', 'batch_job_id']
+        paginator_class = CursorPaginator
 
         # Metadata not used by Tastypie
         allowed_update_fields = ['batch_job_id', 'error_details', 'status']  # See the inherited update_in_place method
+        allowed_bulk_create_fields = ['id_on_client', 'model', 'model_version']  # Used by the bulk_create method
+        watch_status_field = 'status'  # Used by the inherited watch method
+
+    def prepend_urls(self):
+        return [
+            url(r"^(?P<resource_name>%s)/bulk%s$" % (self._meta.resource_name, trailing_slash()),
+                self.wrap_view('bulk_create'), name='api_bulk_create'),
+            url(r"^(?P<resource_name>%s)/latencies%s$" % (self._meta.resource_name, trailing_slash()),
+                self.wrap_view('get_latencies'), name='api_get_latencies'),
+            self.watch_url(),
+        ]
 
     def obj_create(self, bundle, **kwargs):
         """
@@ -126,14 +515,211 @@ class SimulationResource(ModelResourceWithRestrictedUpdate):
         bundle = super(SimulationResource, self).obj_create(bundle, **kwargs)
         simulation = bundle.obj
 
-        simulation.setup_working_dir()
+        self.setup_working_dir(bundle.request, simulation)
         bundle.data['working_dir'] = simulation.working_dir  # So it's included in the response
 
-        # Put the API URL for the simulation into a file in the working directory.
-        simulation_url = bundle.request.build_absolute_uri(self.get_resource_uri(bundle))
+        return bundle
+
+    def save(self, bundle, skip_errors=False):
+        """
+        Save a simulation.  An update (PATCH request) is run in a batched transaction with any concurrent updates
+        from other requests (see write_queue.py), so SQLite isn't swamped with commits when many jobs update their
+        statuses at once.
+        """
+        if bundle.obj.pk and bundle.request.method == 'PATCH' and write_queue.status_writes is not None:
+            return write_queue.status_writes.submit(lambda: super(SimulationResource, self).save(bundle, skip_errors))
+        return super(SimulationResource, self).save(bundle, skip_errors)
+
+    def setup_working_dir(self, request, simulation):
+        """
+        Set up the working directory for a new simulation, and put the simulation's API URL into a file there.
+        """
+        simulation.setup_working_dir()
+        simulation_url = request.build_absolute_uri(self.get_resource_uri(simulation))
         api_urls.write_for_simulation(simulation.working_dir, simulation_url)
 
-        return bundle
+    def get_latencies(self, request, **kwargs):
+        """
+        Get statistics about how long simulations spent in each phase (status), for each model version or each group,
+        to find where the time goes (queue wait, input staging, the model run, or output staging):
+
+            GET /api/v1/simulations/latencies/?by=model|group
+
+        The simulations can be limited with the "group", "model" and "model_version" parameters.  The response has the
+        statistics for each model version (or group) in the "objects" list:
+
+            {
+              "by": "model",
+              "objects": [
+                {
+                  "model": "EMOD", "model_version": "1.6", "simulations": 200,
+                  "phases": {"ready": {"count": 195, "mean": 12.5, "max": 60.1, "p50": 8.2, "p90": 30.7, "p99": 55.0},
+                             "input": {...}, ...}
+                },
+                ...
+              ]
+            }
+
+        The durations are in seconds; see the latency module.
+        """
+        self.method_check(request, allowed=['get'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+
+        by = request.GET.get('by', 'model')
+        if by not in ('model', 'group'):
+            raise BadRequest("Invalid by '%s' provided.  Please provide model or group." % by)
+        simulations = Simulation.objects.all()
+        filters = dict((name, request.GET[name]) for name in ('group', 'model', 'model_version') if name in request.GET)
+        try:
+            simulations = simulations.filter(**filters)
+        except ValueError:
+            raise BadRequest('Invalid group id: %s' % filters['group'])
+
+        group_resource = SimulationGroupResource()
+        if by == 'model':
+            latencies = latency.get_phase_latencies(simulations, lambda group_id, model, version: (model, version))
+        else:
+            latencies = latency.get_phase_latencies(simulations, lambda group_id, model, version: group_id)
+        objects = []
+        for key in sorted(latencies.keys()):
+            stats = latencies[key]
+            if by == 'model':
+                stats['model'], stats['model_version'] = key
+            else:
+                stats['group'] = group_resource.get_resource_uri(SimulationGroup(pk=key))
+            objects.append(stats)
+
+        self.log_throttled_access(request)
+        return self.create_response(request, {'by': by, 'objects': objects})
+
+    def bulk_create(self, request, **kwargs):
+        """
+        Create many simulations for a group with a single request.  The request body has the group's URI and the
+        field values for each new simulation:
+
+            {
+              "group": "/api/v1/sim-groups/{id}/",
+              "objects": [{"id_on_client": "..."}, {"id_on_client": "..."}, ...]
+            }
+
+        The simulations are created in a single database transaction, in the order given.  If any of them can't be
+        created, none are (and no working directories are left behind).  The response lists each
+        new simulation's id, resource URI and working directory in that same order.
+        """
+        self.method_check(request, allowed=['post'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+
+        data = self.deserialize(request, request.body, format=request.META.get('CONTENT_TYPE', 'application/json'))
+        collection_name = self._meta.collection_name
+        if 'group' not in data or not isinstance(data.get(collection_name), list):
+            raise BadRequest("Invalid data sent: expected 'group' and a list of '%s'" % collection_name)
+        bundle = self.build_bundle(request=request)
+        self.authorized_create_detail(self.get_object_list(request), bundle)
+        try:
+            group = SimulationGroupResource().get_via_uri(data['group'], request=request)
+        except (NotFound, ObjectDoesNotExist):
+            raise BadRequest('Unknown group: %s' % data['group'])
+
+        allowed_fields = set(self._meta.allowed_bulk_create_fields)
+        for field_values in data[collection_name]:
+            if not isinstance(field_values, dict) or set(field_values.keys()) - allowed_fields:
+                raise BadRequest('Only these fields can be set: %s' % ', '.join(self._meta.allowed_bulk_create_fields))
+
+        new_simulations = []
+        try:
+            with transaction.atomic():
+                for field_values in data[collection_name]:
+                    simulation = Simulation.objects.create(group=group, **dict_strip_unicode_keys(field_values))
+                    new_simulations.append({
+                        'id': simulation.id,
+                        'id_on_client': simulation.id_on_client,
+                        'resource_uri': self.get_resource_uri(simulation),
+                        'working_dir': simulation.working_dir,
+                    })
+                    self.setup_working_dir(request, simulation)
+        except:
+            # The new records were rolled back, so remove the working directories that were created for them
+            exc_info = sys.exc_info()
+            for simulation_data in new_simulations:
+                shutil.rmtree(simulation_data['working_dir'], ignore_errors=True)
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+        self.log_throttled_access(request)
+        return self.create_response(request, {collection_name: new_simulations}, response_class=http.HttpCreated)
+
+    def patch_list(self, request, **kwargs):
+        """
+        Update many simulations with a single request.  The request body has the resource URI and the new field values
+        for each simulation:
+
+            {
+              "objects": [
+                {"resource_uri": "/api/v1/simulations/{id}/", "status": "...", "error_details": "..."},
+                {"resource_uri": "/api/v1/simulations/{id}/", "batch_job_id": "..."},
+                ...
+              ]
+            }
+
+        Only the fields in Meta.allowed_update_fields can be updated.  The updates are applied in a single database
+        transaction, each in its own savepoint.  An update that fails (unknown simulation, restricted field, database
+        error) doesn't affect the others; the response reports the outcome of each update in the same order as the
+        request:
+
+            {"objects": [{"resource_uri": "...", "updated": true}, {"resource_uri": "...", "updated": false,
+                                                                     "error": "..."}, ...]}
+        """
+        data = self.deserialize(request, request.body, format=request.META.get('CONTENT_TYPE', 'application/json'))
+        collection_name = self._meta.collection_name
+        if not isinstance(data.get(collection_name), list):
+            raise BadRequest("Invalid data sent: expected a list of '%s'" % collection_name)
+        bundle = self.build_bundle(request=request)
+        self.authorized_update_detail(self.get_object_list(request), bundle)
+
+        results = []
+        with transaction.atomic():
+            for new_data in data[collection_name]:
+                results.append(self.apply_update(request, new_data))
+
+        return self.create_response(request, {collection_name: results}, response_class=http.HttpAccepted)
+
+    def apply_update(self, request, new_data):
+        """
+        Apply one of the updates in a list-level PATCH.
+
+        :return dict: The outcome of the update.
+        """
+        if not isinstance(new_data, dict) or 'resource_uri' not in new_data:
+            return {'resource_uri': None, 'updated': False, 'error': 'missing resource_uri'}
+        new_data = dict_strip_unicode_keys(new_data)
+        resource_uri = new_data.pop('resource_uri')
+        result = {'resource_uri': resource_uri, 'updated': False}
+        try:
+            self.check_update_fields(new_data)
+            simulation = self.get_via_uri(resource_uri, request=request)
+        except BadRequest as exc:
+            result['error'] = exc.args[0]
+            return result
+        except (NotFound, ObjectDoesNotExist, MultipleObjectsReturned, ValueError):
+            # A URI that isn't for a single simulation (e.g., the bulk endpoint's) matches none or many
+            result['error'] = 'unknown simulation'
+            return result
+
+        savepoint = transaction.savepoint()
+        try:
+            for field_name, value in new_data.items():
+                setattr(simulation, field_name, value)
+            simulation.save(update_fields=new_data.keys())
+            transaction.savepoint_commit(savepoint)
+        except (DatabaseError, ValidationError, ValueError):
+            transaction.savepoint_rollback(savepoint)
+            # The details stay in the server's log rather than being sent to the client
+            logger.exception('Update of %s failed', resource_uri)
+            result['error'] = 'update failed'
+            return result
+        result['updated'] = True
+        return result
 
 
 class Square:
@@ -153,7 +739,7 @@ class SquareResource(Resource):
         resource_name = 'squares'
         list_allowed_methods = []
         detail_allowed_methods = ['get']
-        authentication = ApiKeyAuthentication()
+        authentication = CachedApiKeyAuthentication()
 
     MIN_NUMBER = -8
     MAX_NUMBER = 10
@@ -192,7 +778,25 @@ class SquareResource(Resource):
         return []
 
 
-RESOURCES = (SimulationGroupResource, SimulationResource, SquareResource)
+class AuthCacheResource(Resource):
+    """
+    The counters of the cache of validated API credentials in this web process (see auth.CredentialCache).
+    """
+    class Meta:
+        resource_name = 'auth-cache'
+        list_allowed_methods = ['get']
+        detail_allowed_methods = []
+        authentication = CachedApiKeyAuthentication()
+
+    def get_list(self, request, **kwargs):
+        return self.create_response(request, credential_cache.get_stats())
+
+    def get_object_list(self, request):
+        # See the comment in SquareResource.get_object_list
+        return []
+
+
+RESOURCES = (SimulationGroupResource, SimulationResource, SquareResource, AuthCacheResource)
 
 v1_api = Api(api_name='v1')
 for resourceClass in RESOURCES:
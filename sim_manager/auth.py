@@ -7,9 +7,16 @@
 # License (MPL), version 2.0. If a copy of the MPL was not distributed
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import threading
+import time
+
 from crc_nd.utils.errors import CallerError
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db.models import signals
 from path import path
+from tastypie.authentication import ApiKeyAuthentication
+from tastypie.models import ApiKey
 
 from sim_manager.models import get_api_key
 
@@ -87,6 +94,112 @@ def delete_script_user():
                 file_path.unlink()
 
 
+class CredentialCache(object):
+    """
+    A cache of API credentials (username and API key) that have been validated, so requests with the same credentials
+    (e.g., from the many cluster jobs that use the script user) are authenticated without database queries.
+
+    Each entry expires after a time-to-live, and a user's entry is removed when the user or the user's API key is saved
+    or deleted in this process (e.g., when the key is rotated).  Changes made by other processes are picked up when
+    the entries expire.  Only valid credentials are cached.
+    """
+
+    def __init__(self, ttl, max_size=1000):
+        """
+        :param float ttl: Number of seconds that a validated credential is cached.
+        :param int max_size: Maximum number of entries; the cache is cleared when it's full.
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = dict()  # key = username, value = (API key, User object, expiration time)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username, api_key):
+        """
+        Get the user for validated credentials.
+
+        :return: The User object, or None if the credentials aren't in the cache (or have expired).
+        """
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and entry[0] == api_key and time.time() < entry[2]:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def add(self, username, api_key, user):
+        with self._lock:
+            if len(self._entries) >= self.max_size and username not in self._entries:
+                self._entries.clear()
+            self._entries[username] = (api_key, user, time.time() + self.ttl)
+
+    def invalidate_user(self, user_id):
+        """
+        Remove a user's entry.
+        """
+        with self._lock:
+            for username, entry in self._entries.items():
+                if entry[1].pk == user_id:
+                    del self._entries[username]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self):
+        """
+        Get the cache's counters.
+
+        :return dict: The number of hits, misses and entries, and the TTL (seconds).
+        """
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, entries=len(self._entries), ttl=self.ttl)
+
+
+# The cache of validated credentials for this web process
+credential_cache = CredentialCache(settings.API_KEY_CACHE_TTL)
+
+
+def invalidate_cached_user(sender, instance, **kwargs):
+    """
+    Remove a user's cached credentials when the user or the user's API key is saved or deleted.
+    """
+    credential_cache.invalidate_user(instance.user_id if sender is ApiKey else instance.pk)
+
+
+signals.post_save.connect(invalidate_cached_user, sender=User)
+signals.post_delete.connect(invalidate_cached_user, sender=User)
+signals.post_save.connect(invalidate_cached_user, sender=ApiKey)
+signals.post_delete.connect(invalidate_cached_user, sender=ApiKey)
+
+
+class CachedApiKeyAuthentication(ApiKeyAuthentication):
+    """
+    API-key authentication that checks the credential cache before the database.
+    """
+
+    def is_authenticated(self, request, **kwargs):
+        try:
+            username, api_key = self.extract_credentials(request)
+        except ValueError:
+            return self._unauthorized()
+        if username and api_key:
+            user = credential_cache.get(username, api_key)
+            if user is not None:
+                request.user = user
+                return True
+
+        result = super(CachedApiKeyAuthentication, self).is_authenticated(request, **kwargs)
+        if result is True:
+            credential_cache.add(username, api_key, request.user)
+        return result
+
+
 class TestingApi:
     """
     API for testing purposes.
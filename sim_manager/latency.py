@@ -0,0 +1,98 @@
+# This file is part of the Simulation Manager project for VecNet.
+# For copyright and licensing information about this project, see the
+# NOTICE.txt and LICENSE.md files in its top-level directory; they are
+# available at https://github.com/vecnet/simulation-manager
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Statistics about how long simulations spend in each phase (status), computed from their status histories.
+
+A simulation is in a phase from the time it enters the phase's status until its next status change.  Its first
+phase (READY_TO_RUN, i.e., waiting in the batch system's queue) starts when the simulation is created.  The phase a
+simulation is currently in (or the one it finished with) has no duration yet, so it isn't included.
+"""
+
+import math
+
+from vecnet.simulation import sim_status
+
+from sim_manager.models import SimulationStatusEvent
+
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(sorted_values, p):
+    """
+    Get a percentile of a list of values with the nearest-rank method.
+
+    :param list sorted_values: The values in ascending order (not empty).
+    :param p: The percentile (0-100).
+    """
+    index = int(math.ceil(p / 100.0 * len(sorted_values))) - 1
+    return sorted_values[max(index, 0)]
+
+
+def get_seconds(delta):
+    """
+    Get the number of seconds in a timedelta (timedelta.total_seconds is only in Python 2.7+).
+    """
+    return delta.days * 86400 + delta.seconds + delta.microseconds / 1e6
+
+
+def summarize(durations):
+    """
+    Summarize a list of durations (in seconds): their count, mean, maximum and percentiles (e.g., "p90").
+    """
+    durations = sorted(durations)
+    summary = {
+        'count': len(durations),
+        'mean': sum(durations) / len(durations),
+        'max': durations[-1],
+    }
+    for p in PERCENTILES:
+        summary['p%d' % p] = percentile(durations, p)
+    return summary
+
+
+def get_phase_latencies(simulations, get_key):
+    """
+    Compute statistics about how long a set of simulations spent in each phase, for subsets of the simulations (e.g.,
+    for each model version).  The simulations' status events are read in a single pass.
+
+    :param simulations: QuerySet of the simulations.
+    :param get_key: Function that gets the subset for a simulation; its arguments are the simulation's group id,
+                    model and model version.
+    :return dict: Key = subset key, value = dictionary with the number of simulations ("simulations") and a
+                  summary of the durations of each phase ("phases"; key = status, value = see the summarize function).
+    """
+    simulation_infos = dict()  # key = simulation id, value = (subset key, when the simulation was created)
+    results = dict()
+    fields = ('id', 'group_id', 'model', 'model_version', 'created_when')
+    for simulation_id, group_id, model, model_version, created_when in simulations.values_list(*fields).iterator():
+        key = get_key(group_id, model, model_version)
+        simulation_infos[simulation_id] = (key, created_when)
+        result = results.setdefault(key, dict(simulations=0, phases=dict()))
+        result['simulations'] += 1
+
+    events = SimulationStatusEvent.objects.filter(simulation__in=simulations).order_by('simulation', 'occurred_when',
+                                                                                        'id')
+    current_simulation = None
+    for simulation_id, status, occurred_when in events.values_list('simulation_id', 'status',
+                                                                   'occurred_when').iterator():
+        if simulation_id != current_simulation:
+            current_simulation = simulation_id
+            key, phase_start = simulation_infos.get(simulation_id, (None, None))  # None = created after the query
+            phase = sim_status.READY_TO_RUN
+        if key is None:
+            continue
+        duration = get_seconds(occurred_when - phase_start)
+        results[key]['phases'].setdefault(phase, []).append(max(duration, 0.0))
+        phase, phase_start = status, occurred_when
+
+    for result in results.values():
+        for phase, durations in result['phases'].items():
+            result['phases'][phase] = summarize(durations)
+    return results
@@ -0,0 +1,60 @@
+# This file is part of the Simulation Manager project for VecNet.
+# For copyright and licensing information about this project, see the
+# NOTICE.txt and LICENSE.md files in its top-level directory; they are
+# available at https://github.com/vecnet/simulation-manager
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from datetime import timedelta
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sim_manager.reconcile import reconcile_simulations
+from sim_manager.scripts import conf
+from sim_manager.scripts.batch.api import BatchSystemError
+from sim_manager.scripts.batch.utils import load_batch_system
+
+
+class Command(BaseCommand):
+    help = '\n'.join((
+        'Mark the simulations whose batch jobs have ended (e.g., killed for exceeding their walltime) without the',
+        'simulations finishing as errors.  Run it once (e.g., from cron), or with --interval to run it repeatedly.',
+    ))
+    option_list = BaseCommand.option_list + (
+        make_option('--interval', type='int', default=None,
+                    help='Reconcile every INTERVAL seconds until stopped (default: reconcile once)'),
+        make_option('--min-age', type='int', default=300,
+                    help='Skip simulations created less than MIN_AGE seconds ago (default: 300)'),
+        make_option('--batch-system', default=conf.BATCH_SYSTEM,
+                    help='The batch system that simulations are submitted to (default: %s)' % conf.BATCH_SYSTEM),
+    )
+
+    def handle(self, *args, **options):
+        if args:
+            raise CommandError('Unexpected arguments: %s' % ' '.join(args))
+        try:
+            batch_system = load_batch_system(options['batch_system'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        min_age = timedelta(seconds=options['min_age'])
+        interval = options['interval']
+        while True:
+            try:
+                self.reconcile(batch_system, min_age)
+            except BatchSystemError as exc:
+                if interval is None:
+                    raise CommandError(str(exc))
+                self.stderr.write(str(exc))
+            if interval is None:
+                break
+            time.sleep(interval)
+
+    def reconcile(self, batch_system, min_age):
+        checked, failed = reconcile_simulations(batch_system, min_age)
+        for simulation in failed:
+            self.stdout.write('Simulation %d: %s' % (simulation.id, simulation.error_details))
+        self.stdout.write('Checked %d batch jobs; %d simulations marked as errors' % (checked, len(failed)))
@@ -7,19 +7,26 @@
 # License (MPL), version 2.0. If a copy of the MPL was not distributed
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import itertools
+
 from crc_nd.utils.django import make_choices_tuple
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.db.backends.signals import connection_created
+from django.utils import timezone
 from tastypie.models import ApiKey, create_api_key
 from vecnet.simulation import sim_status, submission_status
 
-from sim_manager import async, working_dirs
+from sim_manager import async, sqlite, status_watch, working_dirs
 
 
 #  Hook in the Tastypie function to automatically create an API key for a new User
 models.signals.post_save.connect(create_api_key, sender=User)
 
+#  Configure SQLite connections for concurrent writers
+connection_created.connect(sqlite.configure_connection)
+
 
 def get_api_key(user):
     """
@@ -36,19 +43,31 @@ class SimulationGroup(models.Model):
     A group of 1 or more simulations that were submitted together.
     """
     submitter = models.ForeignKey(User)
-    submitted_when = models.DateTimeField(auto_now_add=True)
+    submitted_when = models.DateTimeField(auto_now_add=True, db_index=True)
     process_id = models.IntegerField(help_text='id of background process running the group script', null=True)
     script_status = models.CharField(choices=make_choices_tuple(submission_status.ALL,
                                                                 submission_status.get_description),
                                      default=submission_status.READY_TO_RUN,
-                                     max_length=submission_status.MAX_LENGTH)
+                                     max_length=submission_status.MAX_LENGTH,
+                                     db_index=True)
     script_error = models.CharField(max_length=255, blank=True)
 
-    def setup_working_dir(self, execution_request):
+    class Meta:
+        index_together = [
+            ['submitter', 'submitted_when'],  # A user's groups, most recent first
+        ]
+
+    # Number of simulation records inserted by each query when the group's simulations are created in bulk
+    BULK_CREATE_BATCH_SIZE = 500
+
+    def setup_working_dir(self, execution_request, simulations=None):
         """
         Setup the working directory for the simulation group.
+
+        :param simulations: The simulations to write into the group's execution request file, if they're not in the
+                            execution_request object.  See working_dirs.setup_for_group.
         """
-        working_dirs.setup_for_group(self.id, execution_request)
+        working_dirs.setup_for_group(self.id, execution_request, simulations)
 
     @property
     def working_dir(self):
@@ -57,6 +76,57 @@ class SimulationGroup(models.Model):
         """
         return working_dirs.get_dir_for_group(self.id)
 
+    def create_simulations(self, simulations, default_model=None, default_version=None):
+        """
+        Create the database records for the group's simulations with bulk inserts.
+
+        :param simulations: Iterable of the simulations' definitions (vecnet.simulation.Simulation objects).
+        :param default_model: The model for simulations whose definitions don't specify one (the group's default).
+        :param default_version: The model version for simulations whose definitions don't specify one.
+        :return: QuerySet of the new simulations, in the same order as the definitions.
+        """
+        iterator = iter(simulations)
+        with transaction.atomic():
+            while True:
+                batch = [Simulation(group=self, id_on_client=x.id_on_client, model=x.model or default_model or '',
+                                    model_version=x.model_version or default_version or '')
+                         for x in itertools.islice(iterator, SimulationGroup.BULK_CREATE_BATCH_SIZE)]
+                if not batch:
+                    break
+                Simulation.objects.bulk_create(batch)
+        # Bulk inserts don't set the primary keys of the model instances, so fetch the new records.
+        return self.simulation_set.order_by('id')
+
+    def get_progress(self):
+        """
+        Summarize the progress of the group's simulations with a single aggregate (GROUP BY status) query.
+
+        :return dict: The number of simulations ('total'), the number with each status ('counts'), the number that
+                      have finished ('finished') and the number that had errors ('errors'), and when the earliest
+                      and the latest simulations were created ('earliest_created', 'latest_created'; None if no
+                      simulations).
+        """
+        counts = dict((status, 0) for status in sim_status.ALL)
+        earliest_created = latest_created = None
+        rows = self.simulation_set.order_by().values('status').annotate(count=models.Count('id'),
+                                                                        earliest=models.Min('created_when'),
+                                                                        latest=models.Max('created_when'))
+        for row in rows:
+            counts[row['status']] = row['count']
+            if earliest_created is None or row['earliest'] < earliest_created:
+                earliest_created = row['earliest']
+            if latest_created is None or row['latest'] > latest_created:
+                latest_created = row['latest']
+        errors = sum(counts[status] for status in Simulation.ERROR_STATUSES)
+        return {
+            'total': sum(counts.values()),
+            'counts': counts,
+            'finished': counts[sim_status.SCRIPT_DONE] + errors,
+            'errors': errors,
+            'earliest_created': earliest_created,
+            'latest_created': latest_created,
+        }
+
     def start_submission_script(self):
         """
         Start the Python script that will submit the group's simulations to the cluster's batch system.
@@ -84,16 +154,52 @@ class Simulation(models.Model):
     """
     A single execution of a simulation model.
     """
-    created_when = models.DateTimeField(auto_now_add=True)
+    created_when = models.DateTimeField(auto_now_add=True, db_index=True)
     group = models.ForeignKey(SimulationGroup)
     status = models.CharField(choices=make_choices_tuple(sim_status.ALL, sim_status.get_description),
                               default=sim_status.READY_TO_RUN,
                               max_length=sim_status.MAX_LENGTH)
     # Job ID is updated by submit_group.py script using REST API
-    batch_job_id = models.CharField(default='', max_length=50,
+    batch_job_id = models.CharField(default='', max_length=50, db_index=True,
                                     help_text="Identifier for the simulation's batch job")  # May be integer or string
     id_on_client = models.CharField(default='', max_length=100)
     error_details = models.CharField(default='', max_length=500)
+    model = models.CharField(default='', max_length=50, blank=True)
+    model_version = models.CharField(default='', max_length=50, blank=True)
+
+    # The statuses of simulations that ended with an error
+    ERROR_STATUSES = (sim_status.OUTPUT_ERROR, sim_status.SCRIPT_ERROR)
+
+    # The statuses of simulations that have ended
+    FINAL_STATUSES = (sim_status.SCRIPT_DONE,) + ERROR_STATUSES
+
+    class Meta:
+        index_together = [
+            ['group', 'status'],        # A group's simulations with a particular status (e.g., all the errors)
+            ['group', 'id_on_client'],  # Finding a group's simulation by the client's id
+            ['group', 'created_when'],  # Paging through a group's simulations in the order they were created
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super(Simulation, self).__init__(*args, **kwargs)
+        self._saved_status = None if self.pk is None else self.status
+
+    def save(self, *args, **kwargs):
+        """
+        Save the simulation, and if its status changed, record the change in its status history.  A new simulation's
+        creation time serves as the start of its initial status, so an event is only recorded for a new simulation if
+        its status isn't the default.
+        """
+        if self.pk is None:
+            status_changed = self.status != sim_status.READY_TO_RUN
+        else:
+            update_fields = kwargs.get('update_fields')
+            status_changed = self.status != self._saved_status and (update_fields is None or 'status' in update_fields)
+        with transaction.atomic():
+            super(Simulation, self).save(*args, **kwargs)
+            if status_changed:
+                SimulationStatusEvent.objects.create(simulation=self, status=self.status)
+        self._saved_status = self.status
 
     def setup_working_dir(self):
         """
@@ -107,3 +213,34 @@ class Simulation(models.Model):
         The path to the simulation's working directory.
         """
         return working_dirs.get_dir_for_simulation(self.id)
+
+
+class SimulationStatusEvent(models.Model):
+    """
+    A change in a simulation's status.  The events are an append-only history of when each simulation entered each
+    status; they're recorded by Simulation.save and are never modified.
+    """
+    simulation = models.ForeignKey(Simulation, related_name='status_events')
+    status = models.CharField(choices=make_choices_tuple(sim_status.ALL, sim_status.get_description),
+                              max_length=sim_status.MAX_LENGTH)
+    occurred_when = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        index_together = [
+            ['simulation', 'occurred_when'],  # A simulation's history in order
+        ]
+
+    def save(self, *args, **kwargs):
+        assert self.pk is None, 'Status events cannot be modified'
+        super(SimulationStatusEvent, self).save(*args, **kwargs)
+
+
+def notify_status_watchers(sender, instance, **kwargs):
+    """
+    Wake up any API requests that are watching a simulation or group for a status change (see status_watch.py).
+    """
+    status_watch.watcher.notify(status_watch.StatusWatcher.make_key(sender, instance.pk))
+
+
+models.signals.post_save.connect(notify_status_watchers, sender=SimulationGroup)
+models.signals.post_save.connect(notify_status_watchers, sender=Simulation)
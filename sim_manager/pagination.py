@@ -0,0 +1,169 @@
+# This file is part of the Simulation Manager project for VecNet.
+# For copyright and licensing information about this project, see the
+# NOTICE.txt and LICENSE.md files in its top-level directory; they are
+# available at https://github.com/vecnet/simulation-manager
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Keyset (cursor) pagination for list endpoints.
+
+Tastypie's paginator uses limit and offset, so the database has to skip over all the earlier rows to get a page, and
+it counts all the rows for each page.  A client opts into keyset pagination by adding a "cursor" parameter (empty for
+the first page).  Each page then starts right after the last row of the previous page, which is located with an index,
+so every page costs the same no matter how far into the list it is.
+"""
+
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from tastypie.exceptions import BadRequest
+from tastypie.paginator import Paginator
+
+
+class CursorPaginator(Paginator):
+    """
+    A paginator that uses keyset pagination if the request has a "cursor" parameter, and Tastypie's limit/offset
+    pagination otherwise.
+
+    In cursor mode, the list is ordered by one of the KEY_FIELDS (ascending, or descending with a "-" prefix), given
+    with the "order_by" parameter (the default is "id").  Ties are broken with the primary key.  The page's metadata
+    has the URL of the next page ("next"; None on the last page) with an opaque token for the next page's cursor.
+
+    The total count of the list is left out of the metadata in cursor mode unless the request has the parameter
+    "total_count=true".  In limit/offset mode, it can be left out with "total_count=false".
+    """
+
+    CURSOR_PARAM = 'cursor'
+    KEY_FIELDS = ('id', 'created_when')
+    DEFAULT_KEY = 'id'
+
+    def page(self):
+        if self.CURSOR_PARAM not in self.request_data:
+            if self.include_total_count(default=True):
+                return super(CursorPaginator, self).page()
+            return self.page_without_count()
+
+        key = self.get_key()
+        field = key.lstrip('-')
+        descending = key.startswith('-')
+        limit = self.get_limit()
+
+        objects = self.objects.order_by(key, '-id' if descending else 'id')
+        cursor = self.request_data[self.CURSOR_PARAM]
+        if cursor:
+            objects = objects.filter(self.after_cursor(key, field, descending, cursor))
+
+        meta = {
+            'limit': limit,
+            'previous': None,
+            'next': None,
+        }
+        if self.include_total_count(default=False):
+            meta['total_count'] = self.get_count()
+        if limit:
+            rows = list(objects[:limit + 1])
+            if len(rows) > limit:
+                rows = rows[:limit]
+                meta['next'] = self._generate_cursor_uri(limit, self.encode_cursor(key, rows[-1]))
+        else:
+            rows = list(objects)
+        return {
+            self.collection_name: rows,
+            'meta': meta,
+        }
+
+    def page_without_count(self):
+        """
+        A limit/offset page without the total count.  An extra row is fetched to tell if there's a next page.
+        """
+        limit = self.get_limit()
+        offset = self.get_offset()
+        meta = {
+            'offset': offset,
+            'limit': limit,
+        }
+        if limit:
+            objects = list(self.get_slice(limit + 1, offset))
+            meta['previous'] = self.get_previous(limit, offset)
+            meta['next'] = self._generate_uri(limit, offset + limit) if len(objects) > limit else None
+            objects = objects[:limit]
+        else:
+            objects = self.get_slice(limit, offset)
+        return {
+            self.collection_name: objects,
+            'meta': meta,
+        }
+
+    def include_total_count(self, default):
+        value = self.request_data.get('total_count')
+        if value is None:
+            return default
+        if value.lower() in ('true', '1'):
+            return True
+        if value.lower() in ('false', '0'):
+            return False
+        raise BadRequest("Invalid total_count '%s' provided.  Please provide true or false." % value)
+
+    def get_key(self):
+        """
+        Get the ordering for cursor mode from the "order_by" parameter.
+        """
+        try:
+            keys = self.request_data.getlist('order_by')
+        except AttributeError:
+            keys = [self.request_data['order_by']] if 'order_by' in self.request_data else []
+        if not keys:
+            return self.DEFAULT_KEY
+        if len(keys) > 1 or keys[0].lstrip('-') not in self.KEY_FIELDS:
+            raise BadRequest('Cursor pagination can only order by one of: %s' % ', '.join(self.KEY_FIELDS))
+        return keys[0]
+
+    def after_cursor(self, key, field, descending, cursor):
+        """
+        Get the filter for the rows that come after the cursor's row.
+        """
+        cursor_key, value, pk = self.decode_cursor(cursor)
+        if cursor_key != key:
+            raise BadRequest('The cursor is for a different ordering (order_by=%s)' % cursor_key)
+        comparison = 'lt' if descending else 'gt'
+        if field == 'id':
+            return Q(**{'id__%s' % comparison: pk})
+        return (Q(**{'%s__%s' % (field, comparison): value}) |
+                Q(**{field: value, 'id__%s' % comparison: pk}))
+
+    @staticmethod
+    def encode_cursor(key, obj):
+        value = getattr(obj, key.lstrip('-'))
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        return base64.urlsafe_b64encode(json.dumps([key, value, obj.pk]))
+
+    def decode_cursor(self, cursor):
+        """
+        :return: A 3-tuple: (the ordering, the value of the ordering field in the cursor's row, the row's primary key)
+        """
+        try:
+            key, value, pk = json.loads(base64.urlsafe_b64decode(str(cursor)))
+            pk = int(pk)
+            if key.lstrip('-') != 'id':
+                value = parse_datetime(value)
+                if value is None:
+                    raise ValueError
+        except (TypeError, ValueError, AttributeError):
+            raise BadRequest("Invalid cursor '%s' provided." % cursor)
+        return key, value, pk
+
+    def _generate_cursor_uri(self, limit, cursor):
+        if self.resource_uri is None:
+            return None
+        request_params = self.request_data.copy()
+        for param in ('limit', 'offset', self.CURSOR_PARAM):
+            if param in request_params:
+                del request_params[param]
+        request_params.update({'limit': limit, self.CURSOR_PARAM: cursor})
+        return '%s?%s' % (self.resource_uri, request_params.urlencode())
@@ -0,0 +1,66 @@
+# This file is part of the Simulation Manager project for VecNet.
+# For copyright and licensing information about this project, see the
+# NOTICE.txt and LICENSE.md files in its top-level directory; they are
+# available at https://github.com/vecnet/simulation-manager
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Reconciling the statuses of simulations with the statuses of their batch jobs.
+
+A simulation's status is only updated by its job's script, so if the job is killed (e.g., it exceeded its walltime or
+its node failed), the simulation stays in the status it had at the time.  The jobs of all the simulations that haven't
+ended are checked with a single query of the batch system, and the simulations whose jobs have ended are marked as
+errors.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+from vecnet.simulation import sim_status
+
+from sim_manager.models import Simulation
+from sim_manager.scripts.batch import job_status
+from sim_manager.scripts.constants import SIMULATION_SCRIPT_ERROR_FILE
+
+# Maximum number of job ids in each database query (SQLite's limit on query parameters is 999)
+QUERY_CHUNK_SIZE = 500
+
+
+def reconcile_simulations(batch_system, min_age=timedelta(minutes=5)):
+    """
+    Mark the simulations whose batch jobs have ended without the simulations ending as errors.
+
+    :param batch_system: The batch system that the simulations were submitted to.
+    :param timedelta min_age: Simulations created more recently than this are skipped, because their jobs may not be
+                              known to the batch system yet.
+    :return tuple: (number of simulations checked, list of the simulations marked as errors)
+    :raises BatchSystemError: if the batch system can't be queried.
+    """
+    unfinished = Simulation.objects.exclude(status__in=Simulation.FINAL_STATUSES).exclude(batch_job_id='')
+    unfinished = unfinished.filter(created_when__lte=timezone.now() - min_age)
+    job_ids = sorted(set(unfinished.values_list('batch_job_id', flat=True)))
+    if not job_ids:
+        return 0, []
+    statuses = batch_system.get_statuses(job_ids)
+    ended_job_ids = [job_id for job_id in job_ids if statuses.get(job_id) == job_status.FINISHED]
+
+    # The simulations are read again after the batch system was queried, so a simulation whose script finished
+    # (and updated its status) just before its job ended isn't marked as an error.
+    failed = []
+    with transaction.atomic():
+        for start in range(0, len(ended_job_ids), QUERY_CHUNK_SIZE):
+            chunk = ended_job_ids[start:start + QUERY_CHUNK_SIZE]
+            for simulation in unfinished.filter(batch_job_id__in=chunk).select_for_update():
+                error_details = 'Batch job %s ended while the simulation was in the status "%s"' % (
+                    simulation.batch_job_id, simulation.status)
+                if (simulation.working_dir / SIMULATION_SCRIPT_ERROR_FILE).exists():
+                    error_details += ' (the script failed and was unable to report its error)'
+                simulation.status = sim_status.SCRIPT_ERROR
+                simulation.error_details = error_details
+                simulation.save(update_fields=['status', 'error_details'])
+                failed.append(simulation)
+    return len(job_ids), failed
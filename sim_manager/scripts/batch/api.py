@@ -10,12 +10,22 @@
 from abc import ABCMeta, abstractmethod
 
 
+class BatchSystemError(Exception):
+    """
+    The batch system couldn't perform a request (e.g., one of its commands failed).
+    """
+    pass
+
+
 class BatchSystemApi(object):
     """
     API for batch systems.
     """
     __metaclass__ = ABCMeta
 
+    # Can the batch system submit many jobs at once as a job array?  If not, submit_jobs submits each job separately.
+    supports_job_arrays = False
+
     @abstractmethod
     def submit_job(self, executable, working_dir, *args):
         """
@@ -28,3 +38,33 @@ class BatchSystemApi(object):
         :return str: The batch job's identifier.
         """
         raise NotImplementedError
+
+    def submit_jobs(self, executable, working_dirs, args=(), script_dir=None):
+        """
+        Submit a set of jobs that run the same program with the same arguments, each job in its own working directory.
+
+        This default implementation submits each job separately with the submit_job method.  Batch systems that
+        support job arrays override it to submit all the jobs at once.
+
+        :param str executable: Path to the program to execute.
+        :param list working_dirs: Path to the working directory for each job.
+        :param args: Command line arguments for the program.
+        :param str script_dir: Where to put any script that the batch system needs for the job array (default: the
+                               current working directory).
+
+        :return list: The identifier of each job, in the same order as working_dirs.  An identifier is None if its job
+                      could not be submitted.
+        """
+        return [self.submit_job(executable, working_dir, *args) for working_dir in working_dirs]
+
+    @abstractmethod
+    def get_statuses(self, job_ids):
+        """
+        Get the statuses of a set of jobs with a single query of the batch system.
+
+        :param list job_ids: The jobs' identifiers.
+        :return dict: Key = job identifier, value = the job's status (see the job_status module).  A job that the batch
+                      system doesn't know about is FINISHED.
+        :raises BatchSystemError: if the batch system can't be queried.
+        """
+        raise NotImplementedError
@@ -0,0 +1,16 @@
+# This file is part of the Simulation Manager project for VecNet.
+# For copyright and licensing information about this project, see the
+# NOTICE.txt and LICENSE.md files in its top-level directory; they are
+# available at https://github.com/vecnet/simulation-manager
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Statuses of batch jobs, as reported by the batch system API's get_statuses method.
+"""
+
+QUEUED = 'queued'          # waiting to run (or held)
+RUNNING = 'running'
+FINISHED = 'finished'      # ended, or no longer known to the batch system
@@ -0,0 +1,377 @@
+# This file is part of the Simulation Manager project for VecNet.
+# For copyright and licensing information about this project, see the
+# NOTICE.txt and LICENSE.md files in its top-level directory; they are
+# available at https://github.com/vecnet/simulation-manager
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+A scheduler for running batch jobs on this computer (used by the psutil batch system).
+
+Submitted jobs are put in a persistent queue (a directory), and a dispatcher process starts them in the order they
+were submitted, with at most a fixed number of jobs (slots) running at a time.  Optionally, each job is pinned to a
+CPU core, and a job isn't started while other jobs are running unless there's enough available memory for it.  The
+queue's directory has:
+
+    next_id              the number for the next job's id
+    queued/{id}.json     the jobs waiting to run
+    running/{id}.json    the jobs that were started, with their process ids
+    dispatcher.pid       the dispatcher's process id, while it's running
+    dispatcher.log
+
+A job's id ("local.{number}") is assigned when it's submitted, and it doesn't change when the job is started.  The
+dispatcher is started when a job is submitted, and it exits after it has been idle for a while.  If the dispatcher is
+stopped (e.g., the computer is restarted), its queued jobs are started by the next dispatcher; its running jobs are
+kept track of if they're still running.
+
+To run the dispatcher (from the directory with the top-level package that this module was imported from, e.g., the
+project's root directory or the scripts directory):
+
+    python -m sim_manager.scripts.batch.local_scheduler QUEUE_DIR [--slots N] [--cpu-affinity] ...
+    python -m batch.local_scheduler QUEUE_DIR [--slots N] [--cpu-affinity] ...
+"""
+
+import argparse
+import errno
+import json
+import logging
+import os
+from subprocess import STDOUT
+import sys
+import tempfile
+import time
+
+from path import path
+import psutil
+
+from . import job_status
+
+logger = logging.getLogger(__name__)
+
+JOB_ID_PREFIX = 'local.'
+
+# Name of the file in a job's working directory where its standard output and error are written
+JOB_OUTPUT_FILENAME = 'batch_job_output.txt'
+
+
+def write_json_atomically(file_path, data):
+    fd, temp_path = tempfile.mkstemp(dir=path(file_path).dirname(), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+    if os.name == 'nt' and os.path.exists(file_path):
+        os.remove(file_path)  # rename doesn't replace an existing file on Windows
+    os.rename(temp_path, file_path)
+
+
+def read_json(file_path):
+    """
+    :return: The file's data, or None if the file doesn't exist (or is being replaced).
+    """
+    try:
+        with open(file_path, 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def is_process_alive(pid, create_time=None):
+    """
+    Is a process still running (and not a zombie)?
+
+    :param float create_time: When the process was created; if given, a different process that has reused the process
+                              id isn't mistaken for the process.
+    """
+    try:
+        process = psutil.Process(pid)
+        if create_time is not None and abs(process.create_time() - create_time) > 1:
+            return False
+        return process.status() != psutil.STATUS_ZOMBIE
+    except psutil.NoSuchProcess:
+        return False
+
+
+class FileLock(object):
+    """
+    A lock shared by processes, held while its file exists.
+    """
+
+    def __init__(self, lock_path, timeout=30):
+        """
+        :param float timeout: Number of seconds after which the lock is considered abandoned (e.g., its process was
+                              killed), so it's removed.
+        """
+        self.lock_path = lock_path
+        self.timeout = timeout
+
+    def __enter__(self):
+        while True:
+            try:
+                os.close(os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return self
+            except OSError as exc:
+                if exc.errno != errno.EEXIST:
+                    raise
+            try:
+                if time.time() - os.path.getmtime(self.lock_path) > self.timeout:
+                    os.remove(self.lock_path)
+                    continue
+            except OSError:
+                continue  # Released since the attempt to create it
+            time.sleep(0.01)
+
+    def __exit__(self, *exc_info):
+        os.remove(self.lock_path)
+
+
+class LocalScheduler(object):
+    """
+    The queue of jobs on this computer, and its dispatcher.
+    """
+
+    def __init__(self, queue_dir, slots=None, cpu_affinity=False, memory_per_job=0, poll_interval=1.0,
+                 idle_timeout=60.0):
+        """
+        :param str queue_dir: The queue's directory.
+        :param int slots: Maximum number of jobs running at a time (None = number of CPU cores).
+        :param bool cpu_affinity: Pin each job to a CPU core (the one with the fewest jobs)?  Ignored on platforms
+                                  where psutil can't set a process' CPU affinity.
+        :param int memory_per_job: Number of bytes of available memory that are needed to start a job while other
+                                   jobs are running (0 = memory isn't checked).
+        :param float poll_interval: Number of seconds between the dispatcher's checks of the queue and the running
+                                    jobs.
+        :param float idle_timeout: Number of seconds after which the dispatcher exits if there are no jobs.
+        """
+        self.queue_dir = path(queue_dir).abspath()
+        self.cpu_count = psutil.cpu_count() or 1
+        self.slots = slots or self.cpu_count
+        self.cpu_affinity = cpu_affinity
+        self.memory_per_job = memory_per_job
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.running = dict()  # The dispatcher's running jobs: key = job id, value = (process, CPU core or None)
+        for subdir in ('queued', 'running'):
+            (self.queue_dir / subdir).makedirs_p()
+
+    def queued_path(self, job_id):
+        return self.queue_dir / 'queued' / (job_id + '.json')
+
+    def running_path(self, job_id):
+        return self.queue_dir / 'running' / (job_id + '.json')
+
+    def get_queued_ids(self):
+        """
+        :return list: The ids of the queued jobs, in the order they were submitted.
+        """
+        job_ids = [x.namebase for x in (self.queue_dir / 'queued').files('*.json')]
+        return sorted(job_ids, key=lambda job_id: int(job_id[len(JOB_ID_PREFIX):]))
+
+    # ---- Submitting jobs, and checking their statuses
+
+    def submit(self, executable, working_dir, args=()):
+        """
+        Put a job in the queue.
+
+        :return str: The job's id.
+        """
+        with FileLock(self.queue_dir / 'next_id.lock'):
+            next_id_path = self.queue_dir / 'next_id'
+            number = int(next_id_path.text()) if next_id_path.exists() else 1
+            write_json_atomically(next_id_path, number + 1)
+        job_id = '%s%d' % (JOB_ID_PREFIX, number)
+        job = dict(id=job_id, executable=executable, args=[str(x) for x in args],
+                   working_dir=os.path.abspath(working_dir), submitted_when=time.time())
+        write_json_atomically(self.queued_path(job_id), job)
+        return job_id
+
+    def get_statuses(self, job_ids):
+        """
+        Get the statuses of jobs (see the job_status module).  A job that's not in the queue and not running is
+        FINISHED.
+        """
+        queued_ids = set(self.get_queued_ids())
+        statuses = dict()
+        for job_id in job_ids:
+            if job_id in queued_ids:
+                statuses[job_id] = job_status.QUEUED
+                continue
+            job = read_json(self.running_path(job_id))
+            if job is None:
+                # Either the job was started between reading the queue and now, or it has ended
+                statuses[job_id] = job_status.QUEUED if self.queued_path(job_id).exists() else job_status.FINISHED
+            elif 'pid' not in job or is_process_alive(job['pid'], job['create_time']):
+                statuses[job_id] = job_status.RUNNING
+            else:
+                statuses[job_id] = job_status.FINISHED
+        return statuses
+
+    def get_dispatcher_pid(self):
+        """
+        :return int: The process id of the queue's dispatcher, or None if it isn't running.
+        """
+        pid = read_json(self.queue_dir / 'dispatcher.pid')
+        if pid is None or not is_process_alive(pid):
+            return None
+        return pid
+
+    def ensure_dispatcher(self):
+        """
+        Start a dispatcher for the queue, unless one is running.
+        """
+        if self.get_dispatcher_pid() is not None:
+            return
+        # The dispatcher is run as this module, with the same name, so the directory with its top-level package must
+        # be on the path (e.g., the project's root for "sim_manager.scripts.batch.local_scheduler", or the scripts
+        # directory for "batch.local_scheduler").
+        import_root = path(__file__).abspath().dirname()
+        for _ in range(__name__.count('.')):
+            import_root = import_root.parent
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(x for x in (import_root, env.get('PYTHONPATH')) if x)
+        cmd = [sys.executable, '-m', __name__, self.queue_dir, '--slots', str(self.slots),
+               '--memory-per-job', str(self.memory_per_job), '--poll-interval', str(self.poll_interval),
+               '--idle-timeout', str(self.idle_timeout)]
+        if self.cpu_affinity:
+            cmd.append('--cpu-affinity')
+        kwargs = dict(cwd=self.queue_dir, env=env)
+        if os.name == 'nt':
+            kwargs['creationflags'] = 0x00000008  # DETACHED_PROCESS
+        else:
+            kwargs['close_fds'] = True
+            kwargs['preexec_fn'] = os.setsid  # So it's not stopped with the submitter's session
+        with open(os.devnull, 'r') as devnull:
+            with open(self.queue_dir / 'dispatcher.log', 'a') as log:
+                psutil.Popen(cmd, stdin=devnull, stdout=log, stderr=STDOUT, **kwargs)
+
+    # ---- The dispatcher
+
+    def run_dispatcher(self):
+        """
+        Start the queued jobs as slots become available, until the queue has been idle for the idle timeout.  Returns
+        immediately if another dispatcher is running.
+        """
+        while True:
+            if not self._acquire_dispatcher_lock():
+                return
+            try:
+                self._recover_running_jobs()
+                self._dispatch()
+            finally:
+                os.remove(self.queue_dir / 'dispatcher.pid')
+            # A job may have been submitted after the dispatcher decided to stop, but before it released the lock
+            if not self.get_queued_ids():
+                return
+
+    def _acquire_dispatcher_lock(self):
+        pid_path = self.queue_dir / 'dispatcher.pid'
+        with FileLock(self.queue_dir / 'dispatcher.lock'):
+            if self.get_dispatcher_pid() is not None:
+                return False
+            write_json_atomically(pid_path, os.getpid())
+            return True
+
+    def _recover_running_jobs(self):
+        """
+        Keep track of the jobs that were started by an earlier dispatcher.
+        """
+        for job_path in (self.queue_dir / 'running').files('*.json'):
+            job_id = job_path.namebase
+            if job_id in self.running:
+                continue
+            job = read_json(job_path)
+            if job is None:
+                continue
+            if 'pid' not in job:
+                os.rename(job_path, self.queued_path(job_id))  # The earlier dispatcher stopped before starting it
+            elif is_process_alive(job['pid'], job['create_time']):
+                self.running[job_id] = (psutil.Process(job['pid']), job.get('cpu'))
+            else:
+                logger.info('Job %s ended while there was no dispatcher', job_id)
+                os.remove(job_path)
+
+    def _dispatch(self):
+        idle_since = None
+        while True:
+            self._reap()
+            self._admit()
+            if self.running or self.get_queued_ids():
+                idle_since = None
+            elif idle_since is None:
+                idle_since = time.time()
+            elif time.time() - idle_since >= self.idle_timeout:
+                return
+            time.sleep(self.poll_interval)
+
+    def _reap(self):
+        for job_id, (process, _) in self.running.items():
+            if hasattr(process, 'poll'):
+                exit_status = process.poll()
+                has_ended = exit_status is not None
+            else:
+                has_ended = not is_process_alive(process.pid)
+                exit_status = None  # Not a child of this dispatcher
+            if has_ended:
+                logger.info('Job %s ended (exit status %s)', job_id, exit_status)
+                del self.running[job_id]
+                os.remove(self.running_path(job_id))
+
+    def _admit(self):
+        for job_id in self.get_queued_ids():
+            if len(self.running) >= self.slots:
+                return
+            if self.running and self.memory_per_job and psutil.virtual_memory().available < self.memory_per_job:
+                return  # At least one job is always allowed to run, so the queue doesn't stall
+            self._start(job_id)
+
+    def _choose_cpu(self):
+        jobs_per_cpu = dict.fromkeys(range(self.cpu_count), 0)
+        for _, cpu in self.running.values():
+            if cpu is not None:
+                jobs_per_cpu[cpu] += 1
+        return min(range(self.cpu_count), key=lambda cpu: (jobs_per_cpu[cpu], cpu))
+
+    def _start(self, job_id):
+        running_path = self.running_path(job_id)
+        os.rename(self.queued_path(job_id), running_path)
+        job = read_json(running_path)
+        working_dir = job['working_dir']
+        try:
+            with open(os.path.join(working_dir, JOB_OUTPUT_FILENAME), 'w') as output:
+                process = psutil.Popen([job['executable']] + job['args'], cwd=working_dir, stdout=output,
+                                       stderr=STDOUT)
+        except (IOError, OSError) as exc:
+            logger.error('Unable to start job %s: %s', job_id, exc)
+            os.remove(running_path)
+            return
+        cpu = None
+        if self.cpu_affinity:
+            cpu = self._choose_cpu()
+            try:
+                process.cpu_affinity([cpu])
+            except (AttributeError, psutil.Error) as exc:
+                logger.warning('Unable to pin job %s to CPU %d: %s', job_id, cpu, exc)
+                cpu = None
+        job.update(pid=process.pid, create_time=process.create_time(), cpu=cpu, started_when=time.time())
+        write_json_atomically(running_path, job)
+        self.running[job_id] = (process, cpu)
+        logger.info('Started job %s (process %d%s)', job_id, process.pid, '' if cpu is None else ', CPU %d' % cpu)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the dispatcher for a queue of local batch jobs')
+    parser.add_argument('queue_dir')
+    parser.add_argument('--slots', type=int, default=None)
+    parser.add_argument('--cpu-affinity', action='store_true')
+    parser.add_argument('--memory-per-job', type=int, default=0)
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--idle-timeout', type=float, default=60.0)
+    args = parser.parse_args()
+    logging.basicConfig(format='%(asctime)s - %(process)d - %(message)s', level=logging.INFO)
+    scheduler = LocalScheduler(args.queue_dir, args.slots, args.cpu_affinity, args.memory_per_job,
+                               args.poll_interval, args.idle_timeout)
+    scheduler.run_dispatcher()
+
+
+if __name__ == '__main__':
+    main()
@@ -9,10 +9,28 @@
 
 import os.path
 from subprocess import PIPE, CalledProcessError
+import tempfile
+from xml.etree import cElementTree as ElementTree
 
 import psutil
 
-from .api import BatchSystemApi
+from . import job_status
+from .api import BatchSystemApi, BatchSystemError
+
+# Job statuses for the job_state codes in qstat's output
+JOB_STATES = {
+    'Q': job_status.QUEUED,     # Queued
+    'H': job_status.QUEUED,     # Held
+    'W': job_status.QUEUED,     # Waiting for its execution time
+    'T': job_status.QUEUED,     # Being moved to a new location
+    'R': job_status.RUNNING,    # Running
+    'E': job_status.RUNNING,    # Exiting after having run
+    'S': job_status.RUNNING,    # Suspended
+    'C': job_status.FINISHED,   # Completed
+}
+
+# Name of the file in a working directory where the standard output and error of a job in a job array are written
+ARRAY_JOB_OUTPUT_FILENAME = 'pbs_output.txt'
 
 
 class PortableBatchSystem(BatchSystemApi):
@@ -20,6 +38,12 @@ class PortableBatchSystem(BatchSystemApi):
     Implementation of the API using the Portable Batch System (PBS) and its variants (e.g., Torque).
     """
 
+    supports_job_arrays = True
+
+    # Largest job array that's submitted with one qsub command (Torque's default max_job_array_size is 1024).  Larger
+    # sets of jobs are split into several arrays.
+    MAX_ARRAY_SIZE = 1000
+
     def submit_job(self, executable, working_dir, *args):
         """
         Implements the BatchSystemApi's submit_job (link to its documentation).
@@ -53,3 +77,108 @@ class PortableBatchSystem(BatchSystemApi):
 
         return pid
 
+    def submit_jobs(self, executable, working_dirs, args=(), script_dir=None):
+        """
+        Implements the BatchSystemApi's submit_jobs (link to its documentation).  The jobs are submitted as one or more
+        job arrays; each array index is mapped to a working directory by the array's script.
+        """
+        if script_dir is None:
+            script_dir = os.getcwd()
+        job_ids = []
+        for start in range(0, len(working_dirs), self.MAX_ARRAY_SIZE):
+            array_dirs = working_dirs[start:start + self.MAX_ARRAY_SIZE]
+            job_ids += self.submit_job_array(executable, array_dirs, args, script_dir)
+        return job_ids
+
+    def submit_job_array(self, executable, working_dirs, args, script_dir):
+        """
+        Submit a set of jobs as a single job array.
+
+        :return list: The identifier of each job in the array, e.g., "1234[5].server" for the job with index 5.  The
+                      identifiers are all None if the array could not be submitted.
+        """
+        fd, filename = tempfile.mkstemp(prefix='pbs_array_', suffix='.sh', dir=script_dir)
+        with os.fdopen(fd, "w") as f:
+            lines = [
+                "#!/bin/bash",
+                "#PBS -N OpenMalaria",
+                '#PBS -t 0-%d' % (len(working_dirs) - 1),
+                '#PBS -l nodes=1:ppn=1',
+                '#PBS -V',
+                "WORKING_DIRS=(",
+            ]
+            lines += ["  '%s'" % working_dir for working_dir in working_dirs]
+            lines += [
+                ")",
+                # Don't run the job in the home directory if its working directory isn't available
+                'cd "${WORKING_DIRS[$PBS_ARRAYID]}" || exit 1',
+                # qsub is run in the script's directory, so PBS would put the job's output there
+                'exec >"${WORKING_DIRS[$PBS_ARRAYID]}/%s" 2>&1' % ARRAY_JOB_OUTPUT_FILENAME,
+                "%s %s" % (executable, " ".join(args)),
+            ]
+            for line in lines:
+                f.write(line + '\n')
+
+        # Note - we assume that working directories on headnode and compute node are the same
+        cmd = ["qsub", filename]
+        try:
+            p = psutil.Popen(cmd, cwd=script_dir, stdout=PIPE)
+        except OSError:
+            return [None] * len(working_dirs)
+        (array_id, _) = p.communicate()
+        array_id = array_id.strip("\r\n")
+        if p.returncode != 0 or not array_id:
+            return [None] * len(working_dirs)
+        return [make_array_job_id(array_id, index) for index in range(len(working_dirs))]
+
+    def get_statuses(self, job_ids):
+        """
+        Implements the BatchSystemApi's get_statuses (link to its documentation).  All the jobs (including the jobs in
+        job arrays) are listed with one qstat command in XML format.
+        """
+        cmd = ['qstat', '-x', '-t']
+        try:
+            p = psutil.Popen(cmd, stdout=PIPE, stderr=PIPE)
+        except OSError as exc:
+            raise BatchSystemError('Unable to run qstat: %s' % exc)
+        (output, errors) = p.communicate()
+        if p.returncode != 0:
+            raise BatchSystemError('qstat failed (exit status %d): %s' % (p.returncode, errors.strip()))
+        job_states = parse_qstat_xml(output)
+        return dict((job_id, JOB_STATES.get(job_states.get(job_id), job_status.FINISHED)) for job_id in job_ids)
+
+
+def parse_qstat_xml(output):
+    """
+    Parse the output of "qstat -x".
+
+    :param str output: The command's output, e.g., "<Data><Job><Job_Id>1234.server</Job_Id>...
+                       <job_state>R</job_state>...</Job>...</Data>"
+    :return dict: Key = job identifier, value = the job's job_state code
+    """
+    if not output.strip():
+        return dict()  # No jobs
+    try:
+        root = ElementTree.fromstring(output)
+    except SyntaxError as exc:
+        raise BatchSystemError('Invalid XML from qstat: %s' % exc)
+    job_states = dict()
+    for job in root.findall('Job'):  # Elements of <Data>
+        job_id = job.findtext('Job_Id')
+        if job_id:
+            job_states[job_id.strip()] = (job.findtext('job_state') or '').strip()
+    return job_states
+
+
+def make_array_job_id(array_id, index):
+    """
+    Make the identifier for a job in a job array.
+
+    :param str array_id: The array's identifier as printed by qsub, e.g., "1234[].server"
+    :param int index: The job's index in the array.
+    :return str: The job's identifier, e.g., "1234[5].server"
+    """
+    if '[]' in array_id:
+        return array_id.replace('[]', '[%d]' % index, 1)
+    sequence_number, dot, server = array_id.partition('.')
+    return '%s[%d]%s%s' % (sequence_number, index, dot, server)
@@ -7,23 +7,77 @@
 # License (MPL), version 2.0. If a copy of the MPL was not distributed
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import os
+import tempfile
+
 import psutil
 
+from . import job_status
 from .api import BatchSystemApi
+from .local_scheduler import JOB_ID_PREFIX, LocalScheduler
+
+
+class SchedulerSettings:
+    """
+    Settings for the local scheduler that runs the jobs (see local_scheduler.py).  They can be changed in the
+    conf_local.py file, e.g.:
+
+        from batch.psutil_impl import SchedulerSettings
+        SchedulerSettings.SLOTS = 2
+    """
+    QUEUE_DIR = os.path.join(tempfile.gettempdir(), 'sim_manager_local_jobs')
+    SLOTS = None            # Maximum number of jobs running at a time (None = number of CPU cores)
+    CPU_AFFINITY = False    # Pin each job to a CPU core?
+    MEMORY_PER_JOB = 0      # Bytes of available memory needed to start a job while others run (0 = not checked)
+    POLL_INTERVAL = 1.0     # Seconds between the dispatcher's checks for finished jobs and available slots
+    IDLE_TIMEOUT = 60.0     # Seconds after which the dispatcher exits if there are no jobs
 
 
 class SimpleBatchSystem(BatchSystemApi):
     """
-    A simple implementation of the API using the psutil library.
+    A simple implementation of the API using the psutil library.  Jobs are run on this computer by a local scheduler,
+    which limits the number of jobs running at the same time.
     """
 
+    def __init__(self):
+        self.scheduler = LocalScheduler(SchedulerSettings.QUEUE_DIR, SchedulerSettings.SLOTS,
+                                        SchedulerSettings.CPU_AFFINITY, SchedulerSettings.MEMORY_PER_JOB,
+                                        SchedulerSettings.POLL_INTERVAL, SchedulerSettings.IDLE_TIMEOUT)
+
     def submit_job(self, executable, working_dir, *args):
         """
-        Implements the BatchSystemApi's submit_job (link to its documentation).
+        Implements the BatchSystemApi's submit_job (link to its documentation).  The job is put in the local
+        scheduler's queue, and the scheduler's dispatcher is started if it isn't running.
+        """
+        job_id = self.scheduler.submit(executable, working_dir, args)
+        self.scheduler.ensure_dispatcher()
+        return job_id
+
+    def get_statuses(self, job_ids):
+        """
+        Implements the BatchSystemApi's get_statuses (link to its documentation).  The statuses of the local
+        scheduler's jobs are read from its queue; if jobs are queued and its dispatcher isn't running (e.g., the
+        computer was restarted), the dispatcher is started.
+
+        A job id that's a process id (jobs submitted before the scheduler was used) is checked with a single scan of
+        the system's processes.  A job's process that has exited but hasn't been reaped (a zombie) is finished.
         """
-        cmd = [executable] + [str(x) for x in args]
-        p = psutil.Popen(cmd, cwd=working_dir)
-        return str(p.pid)
+        scheduler_ids = [x for x in job_ids if x.startswith(JOB_ID_PREFIX)]
+        statuses = self.scheduler.get_statuses(scheduler_ids)
+        if job_status.QUEUED in statuses.values():
+            self.scheduler.ensure_dispatcher()
+        process_ids = set(psutil.pids())
+        for job_id in job_ids:
+            if job_id in statuses:
+                continue
+            statuses[job_id] = job_status.FINISHED
+            if job_id.isdigit() and int(job_id) in process_ids:
+                try:
+                    if psutil.Process(int(job_id)).status() != psutil.STATUS_ZOMBIE:
+                        statuses[job_id] = job_status.RUNNING
+                except psutil.NoSuchProcess:
+                    pass
+        return statuses
 
     def get_status(self, process_id):
         """
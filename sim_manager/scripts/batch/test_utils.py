@@ -14,12 +14,22 @@ from .api import BatchSystemApi
 
 class Mocks:
     submit_job = mock.MagicMock()
+    submit_jobs = mock.MagicMock()
+    get_statuses = mock.MagicMock()
 
 
 class MockBatchSystem(BatchSystemApi):
     """
-    Mock batch system for testing.
+    Mock batch system for testing.  Tests can enable job arrays by patching the supports_job_arrays attribute.
     """
 
     def submit_job(self, executable, working_dir, *args):
-        return Mocks.submit_job(executable, working_dir, *args)
\ No newline at end of file
+        return Mocks.submit_job(executable, working_dir, *args)
+
+    def submit_jobs(self, executable, working_dirs, args=(), script_dir=None):
+        if self.supports_job_arrays:
+            return Mocks.submit_jobs(executable, working_dirs, args, script_dir)
+        return super(MockBatchSystem, self).submit_jobs(executable, working_dirs, args, script_dir)
+
+    def get_statuses(self, job_ids):
+        return Mocks.get_statuses(job_ids)
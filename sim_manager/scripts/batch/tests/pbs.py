@@ -0,0 +1,141 @@
+# This file is part of the Simulation Manager project for VecNet.
+# For copyright and licensing information about this project, see the
+# NOTICE.txt and LICENSE.md files in its top-level directory; they are
+# available at https://github.com/vecnet/simulation-manager
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Tests for the PBS implementation of the batch system API.  The qsub command is mocked, so PBS isn't needed.
+"""
+
+from unittest import TestCase
+
+from crc_nd.utils.test_io import WritesOutputFiles
+from mock import MagicMock, patch
+
+from .constants import TEST_OUTPUT_ROOT
+from .. import job_status
+from ..api import BatchSystemError
+from ..pbs import make_array_job_id, parse_qstat_xml, PortableBatchSystem
+
+
+def mock_qsub(stdout, returncode=0):
+    process = MagicMock()
+    process.communicate.return_value = (stdout, None)
+    process.returncode = returncode
+    return MagicMock(return_value=process)
+
+
+def mock_qstat(stdout, returncode=0):
+    process = MagicMock()
+    process.communicate.return_value = (stdout, 'qstat: error' if returncode else '')
+    process.returncode = returncode
+    return MagicMock(return_value=process)
+
+
+class SubmitJobsTests(WritesOutputFiles):
+    """
+    Tests of the submit_jobs method.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.set_output_root(TEST_OUTPUT_ROOT / 'pbs')
+
+    def setUp(self):
+        self.initialize_output_dir()
+        self.script_dir = self.get_output_dir()
+        self.working_dirs = [self.script_dir / ('sim-%d' % i) for i in range(3)]
+
+    def test_job_array(self):
+        with patch('psutil.Popen', mock_qsub('1234[].pbs-server\n')) as popen:
+            job_ids = PortableBatchSystem().submit_jobs('/usr/bin/python', self.working_dirs, ['run.py'],
+                                                        self.script_dir)
+        self.assertEqual(job_ids, ['1234[0].pbs-server', '1234[1].pbs-server', '1234[2].pbs-server'])
+
+        self.assertEqual(popen.call_count, 1)
+        cmd = popen.call_args[0][0]
+        self.assertEqual(cmd[0], 'qsub')
+        script_lines = [x.rstrip('\n') for x in open(cmd[1]).readlines()]
+        self.assertIn('#PBS -t 0-2', script_lines)
+        for working_dir in self.working_dirs:
+            self.assertIn("  '%s'" % working_dir, script_lines)
+        self.assertEqual(script_lines[-3:], [
+            'cd "${WORKING_DIRS[$PBS_ARRAYID]}" || exit 1',
+            'exec >"${WORKING_DIRS[$PBS_ARRAYID]}/pbs_output.txt" 2>&1',
+            '/usr/bin/python run.py',
+        ])
+
+    def test_large_array_is_split(self):
+        with patch.object(PortableBatchSystem, 'MAX_ARRAY_SIZE', 2):
+            with patch('psutil.Popen', mock_qsub('77[].srv')) as popen:
+                job_ids = PortableBatchSystem().submit_jobs('python', self.working_dirs, script_dir=self.script_dir)
+        self.assertEqual(popen.call_count, 2)
+        self.assertEqual(job_ids, ['77[0].srv', '77[1].srv', '77[0].srv'])
+
+    def test_qsub_fails(self):
+        with patch('psutil.Popen', mock_qsub('', returncode=1)):
+            job_ids = PortableBatchSystem().submit_jobs('python', self.working_dirs, script_dir=self.script_dir)
+        self.assertEqual(job_ids, [None, None, None])
+
+
+QSTAT_XML = (
+    '<Data>'
+    '<Job><Job_Id>1234[0].server</Job_Id><Job_Name>OpenMalaria-0</Job_Name><job_state>R</job_state></Job>'
+    '<Job><Job_Id>1234[1].server</Job_Id><Job_Name>OpenMalaria-1</Job_Name><job_state>Q</job_state></Job>'
+    '<Job><Job_Id>1235.server</Job_Id><job_state>C</job_state><exit_status>271</exit_status></Job>'
+    '</Data>'
+)
+
+
+class GetStatusesTests(TestCase):
+    """
+    Tests of the get_statuses method.
+    """
+
+    def test_statuses(self):
+        with patch('psutil.Popen', mock_qstat(QSTAT_XML)) as popen:
+            statuses = PortableBatchSystem().get_statuses(['1234[0].server', '1234[1].server', '1235.server',
+                                                           '999.server'])
+        self.assertEqual(statuses, {
+            '1234[0].server': job_status.RUNNING,
+            '1234[1].server': job_status.QUEUED,
+            '1235.server': job_status.FINISHED,
+            '999.server': job_status.FINISHED,  # No longer known to PBS
+        })
+        self.assertEqual(popen.call_count, 1)
+        self.assertEqual(popen.call_args[0][0], ['qstat', '-x', '-t'])
+
+    def test_no_jobs(self):
+        with patch('psutil.Popen', mock_qstat('')):
+            statuses = PortableBatchSystem().get_statuses(['1.server'])
+        self.assertEqual(statuses, {'1.server': job_status.FINISHED})
+
+    def test_qstat_fails(self):
+        """
+        Test that a failed query raises an error rather than reporting all the jobs as finished.
+        """
+        with patch('psutil.Popen', mock_qstat('', returncode=1)):
+            self.assertRaises(BatchSystemError, PortableBatchSystem().get_statuses, ['1.server'])
+        with patch('psutil.Popen', mock_qstat('<Data><Job>')):
+            self.assertRaises(BatchSystemError, PortableBatchSystem().get_statuses, ['1.server'])
+
+    def test_parse_qstat_xml(self):
+        self.assertEqual(parse_qstat_xml(QSTAT_XML), {'1234[0].server': 'R', '1234[1].server': 'Q',
+                                                      '1235.server': 'C'})
+
+
+class MakeArrayJobIdTests(TestCase):
+    """
+    Tests of the make_array_job_id function.
+    """
+
+    def test_with_brackets(self):
+        self.assertEqual(make_array_job_id('1234[].server', 5), '1234[5].server')
+
+    def test_without_brackets(self):
+        self.assertEqual(make_array_job_id('1234.server', 5), '1234[5].server')
+        self.assertEqual(make_array_job_id('1234', 0), '1234[0]')
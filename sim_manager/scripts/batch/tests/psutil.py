@@ -11,14 +11,24 @@
 Tests for the psutil-based implementation of the batch system API.
 """
 
+from __future__ import absolute_import
+
 import os
+import subprocess
 import sys
+import threading
+import time
+from unittest import TestCase
 
 from crc_nd.utils.test_io import WritesOutputFiles
+from mock import patch
 from path import path
+import psutil
 
 from .constants import TEST_OUTPUT_ROOT
-from ..psutil_impl import SimpleBatchSystem
+from .. import job_status
+from ..local_scheduler import JOB_OUTPUT_FILENAME, LocalScheduler, read_json, write_json_atomically
+from ..psutil_impl import SchedulerSettings, SimpleBatchSystem
 
 
 class SubmitJobTests(WritesOutputFiles):
@@ -30,6 +40,14 @@ class SubmitJobTests(WritesOutputFiles):
     def setUpClass(cls):
         cls.set_output_root(TEST_OUTPUT_ROOT / 'psutil')
 
+    def setUp(self):
+        settings = dict(QUEUE_DIR=TEST_OUTPUT_ROOT / 'psutil-queue', POLL_INTERVAL=0.1, IDLE_TIMEOUT=1.0)
+        self.settings_patcher = patch.multiple(SchedulerSettings, **settings)
+        self.settings_patcher.start()
+
+    def tearDown(self):
+        self.settings_patcher.stop()
+
     def test_python_executable(self):
         """
         Test the submit_job method with the Python executable.
@@ -41,7 +59,9 @@ class SubmitJobTests(WritesOutputFiles):
         working_dir = self.get_output_dir()
         self.initialize_output_dir()
         script_args = ('foo', 42, 'hello world')
-        job_number = simple_batch_system.submit_job(sys.executable, working_dir, script, *script_args)
+        job_id = simple_batch_system.submit_job(sys.executable, working_dir, script, *script_args)
+        self.assertTrue(job_id.startswith('local.'))
+        wait_until(lambda: simple_batch_system.get_statuses([job_id])[job_id] == job_status.FINISHED)
 
         #  The test script writes the following information to a text file:
         #    process id
@@ -49,10 +69,175 @@ class SubmitJobTests(WritesOutputFiles):
         #    sys.argv[1]   <-- script_args[0]
         #    sys.argv[2]   <-- script_args[1]
         #    ...
-        os.waitpid(job_number, 0)
         stdout = working_dir / 'stdout.txt'
         stdout_lines = stdout.lines()
-        pid_in_stdout = int(stdout_lines[0])
-        self.assertEqual(job_number, pid_in_stdout)
         args_in_stdout = [x.rstrip('\n') for x in stdout_lines[1:]]
-        self.assertEqual(args_in_stdout, [script] + [str(x) for x in script_args])
\ No newline at end of file
+        self.assertEqual(args_in_stdout, [script] + [str(x) for x in script_args])
+
+
+def wait_until(condition, timeout=30):
+    start = time.time()
+    while not condition():
+        if time.time() - start > timeout:
+            raise AssertionError('Condition not met after %d seconds' % timeout)
+        time.sleep(0.1)
+
+
+class LocalSchedulerTests(WritesOutputFiles):
+    """
+    Tests of the local scheduler.  The dispatcher is run in a thread.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.set_output_root(TEST_OUTPUT_ROOT / 'local_scheduler')
+
+    def setUp(self):
+        self.initialize_output_dir()
+        self.output_dir = self.get_output_dir()
+        self.queue_dir = self.output_dir / 'queue'
+        self.dispatcher = None
+
+    def tearDown(self):
+        if self.dispatcher is not None:
+            self.dispatcher.join(30)
+
+    def create_scheduler(self, **kwargs):
+        return LocalScheduler(self.queue_dir, poll_interval=0.05, idle_timeout=0.2, **kwargs)
+
+    def start_dispatcher(self, scheduler):
+        self.dispatcher = threading.Thread(target=scheduler.run_dispatcher)
+        self.dispatcher.start()
+
+    def submit_python(self, scheduler, code):
+        working_dir = self.output_dir / ('job%d' % len(self.output_dir.dirs('job*')))
+        working_dir.makedirs()
+        return scheduler.submit(sys.executable, working_dir, ['-c', code]), working_dir
+
+    def test_ids_and_queued_status(self):
+        scheduler = self.create_scheduler()
+        job_ids = [scheduler.submit(sys.executable, self.output_dir, ['-c', 'pass']) for _ in range(3)]
+        self.assertEqual(job_ids, ['local.1', 'local.2', 'local.3'])
+        self.assertEqual(scheduler.get_queued_ids(), job_ids)
+        statuses = scheduler.get_statuses(job_ids + ['local.99'])
+        self.assertEqual(statuses, {
+            'local.1': job_status.QUEUED,
+            'local.2': job_status.QUEUED,
+            'local.3': job_status.QUEUED,
+            'local.99': job_status.FINISHED,
+        })
+
+        # Ids continue from the persistent counter with a new scheduler for the same queue
+        self.assertEqual(self.create_scheduler().submit(sys.executable, self.output_dir), 'local.4')
+
+    def test_slots_and_order(self):
+        """
+        Test that the jobs are run one at a time in the order they were submitted, when there's one slot.
+        """
+        scheduler = self.create_scheduler(slots=1)
+        code = ("import time; open('start', 'w').write(repr(time.time())); time.sleep(0.3); "
+                "open('end', 'w').write(repr(time.time()))")
+        jobs = [self.submit_python(scheduler, code) for _ in range(3)]
+        self.start_dispatcher(scheduler)
+        job_ids = [job_id for job_id, _ in jobs]
+        wait_until(lambda: set(scheduler.get_statuses(job_ids).values()) == set([job_status.FINISHED]))
+
+        times = [(float((dir_ / 'start').text()), float((dir_ / 'end').text())) for _, dir_ in jobs]
+        for (_, previous_end), (next_start, _) in zip(times, times[1:]):
+            self.assertTrue(next_start >= previous_end)
+        self.assertEqual((jobs[0][1] / JOB_OUTPUT_FILENAME).text(), '')
+        self.dispatcher.join(30)
+        self.assertFalse(self.dispatcher.is_alive())
+        self.assertEqual((self.queue_dir / 'running').files(), [])
+
+    def test_running_status(self):
+        scheduler = self.create_scheduler()
+        job_id, _ = self.submit_python(scheduler, 'import time; time.sleep(30)')
+        self.start_dispatcher(scheduler)
+        wait_until(lambda: 'pid' in (read_json(scheduler.running_path(job_id)) or {}))
+        self.assertEqual(scheduler.get_statuses([job_id]), {job_id: job_status.RUNNING})
+        psutil.Process(read_json(scheduler.running_path(job_id))['pid']).kill()
+        wait_until(lambda: scheduler.get_statuses([job_id]) == {job_id: job_status.FINISHED})
+
+    def test_memory_admission(self):
+        """
+        Test that only one job runs at a time when there isn't enough available memory for more.
+        """
+        scheduler = self.create_scheduler(slots=2, memory_per_job=psutil.virtual_memory().total * 2)
+        code = 'import time; time.sleep(0.5)'
+        job_ids = [self.submit_python(scheduler, code)[0] for _ in range(2)]
+        self.start_dispatcher(scheduler)
+        wait_until(lambda: scheduler.get_statuses(job_ids)[job_ids[0]] == job_status.RUNNING)
+        self.assertEqual(scheduler.get_statuses(job_ids)[job_ids[1]], job_status.QUEUED)
+        wait_until(lambda: set(scheduler.get_statuses(job_ids).values()) == set([job_status.FINISHED]))
+
+    def test_recovery(self):
+        """
+        Test that a new dispatcher requeues a job that an earlier dispatcher didn't start, and forgets a job that
+        ended while there was no dispatcher.
+        """
+        scheduler = self.create_scheduler()
+        job_id, working_dir = self.submit_python(scheduler, "open('ran', 'w').close()")
+        os.rename(scheduler.queued_path(job_id), scheduler.running_path(job_id))
+        self.assertEqual(scheduler.get_statuses([job_id]), {job_id: job_status.RUNNING})
+
+        ended = subprocess.Popen([sys.executable, '-c', 'pass'])
+        ended.wait()
+        ended_job = dict(id='local.2', executable=sys.executable, args=[], working_dir=self.output_dir,
+                         pid=ended.pid, create_time=time.time() - 10)
+        write_json_atomically(scheduler.running_path('local.2'), ended_job)
+        self.assertEqual(scheduler.get_statuses(['local.2']), {'local.2': job_status.FINISHED})
+
+        self.start_dispatcher(scheduler)
+        wait_until(lambda: (working_dir / 'ran').exists())
+        self.dispatcher.join(30)
+        self.assertEqual((self.queue_dir / 'running').files(), [])
+
+    def test_second_dispatcher_exits(self):
+        scheduler = self.create_scheduler()
+        self.submit_python(scheduler, 'import time; time.sleep(1)')
+        self.start_dispatcher(scheduler)
+        wait_until(lambda: scheduler.get_dispatcher_pid() is not None)
+        start = time.time()
+        self.create_scheduler().run_dispatcher()  # Same process id, so it sees the lock as held
+        self.assertTrue(time.time() - start < 0.5)
+
+    def test_cpu_affinity(self):
+        if not hasattr(psutil.Process, 'cpu_affinity'):
+            return  # CPU affinity isn't supported on this platform
+        scheduler = self.create_scheduler(slots=2, cpu_affinity=True)
+        job_ids = [self.submit_python(scheduler, 'import time; time.sleep(30)')[0] for _ in range(2)]
+        self.start_dispatcher(scheduler)
+        jobs = []
+        for job_id in job_ids:
+            wait_until(lambda: 'pid' in (read_json(scheduler.running_path(job_id)) or {}))
+            jobs.append(read_json(scheduler.running_path(job_id)))
+        try:
+            expected_cpus = [0, 1 % scheduler.cpu_count]
+            self.assertEqual([job['cpu'] for job in jobs], expected_cpus)
+            for job, cpu in zip(jobs, expected_cpus):
+                self.assertEqual(psutil.Process(job['pid']).cpu_affinity(), [cpu])
+        finally:
+            for job in jobs:
+                psutil.Process(job['pid']).kill()
+
+
+class GetStatusesTests(TestCase):
+    """
+    Tests of the get_statuses method.
+    """
+
+    def test_statuses(self):
+        running = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+        try:
+            statuses = SimpleBatchSystem().get_statuses([str(running.pid), str(exited.pid), 'not-a-pid'])
+        finally:
+            running.kill()
+            running.wait()
+        self.assertEqual(statuses, {
+            str(running.pid): job_status.RUNNING,
+            str(exited.pid): job_status.FINISHED,
+            'not-a-pid': job_status.FINISHED,
+        })
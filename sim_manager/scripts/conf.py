@@ -9,7 +9,9 @@
 
 #  Configuration settings for scripts
 
+import os
 import socket
+import tempfile
 
 import batch
 from models import Mock, openmalaria
@@ -24,6 +26,58 @@ MODELS = [
 
 BATCH_SYSTEM = batch.PSUTIL
 
+# Number of simulations that the submit_group.py script creates in the database with each request to the REST API
+SIMULATION_CHUNK_SIZE = 100
+
+# Number of simulations that the submit_group.py script submits to the batch system concurrently
+SUBMISSION_WORKERS = 8
+
+# Maximum number of input files that the run_simulation.py script downloads concurrently
+INPUT_STAGING_WORKERS = 4
+
+# Directory of the cache for input files, which is shared by the jobs on this node (or on all the nodes if it's on a
+# shared filesystem).  None = input files aren't cached, so each simulation downloads its own copies.
+INPUT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'sim_manager_input_cache')
+
+# Maximum total size of the cached input files (in bytes); the least recently used files are removed beyond this size
+INPUT_CACHE_MAX_SIZE = 20 * 1024 ** 3
+
+# Number of seconds after which the input cache asks the server whether a cached file has changed (with a conditional
+# request, so the file is only downloaded again if it has changed).  None = cached files are assumed to never change.
+# A file whose URL has a SHA-256 checksum (e.g., "http://example.com/climate.bin#sha256=...") is never revalidated.
+INPUT_CACHE_REVALIDATE_AFTER = 600
+
+# Directories on shared storage whose files can be used as input files with file:// URLs (e.g.,
+# "file:///shared/sim_manager/inputs/climate.bin"), which are linked into simulations' working directories instead of
+# being downloaded
+SHARED_INPUT_ROOTS = []
+
+# The ways a file:// input file is linked into a working directory, in the order they're tried:
+#   'reflink'  = copy-on-write clone (Linux, on filesystems such as Btrfs and XFS), so a model can't change the
+#                original file
+#   'hardlink' = hard link (same filesystem only)
+#   'symlink'  = symbolic link
+#   'copy'     = copy of the file's data
+SHARED_INPUT_LINK_MODES = ('reflink', 'hardlink', 'symlink')
+
+# How the run_simulation.py script stages output files to a simulation's output URL:
+#   'json'   = the contents of all the files are sent in a single JSON document (one string per line)
+#   'stream' = each file is sent as bytes in gzip-compressed chunks, and an interrupted upload is resumed (see
+#              output_staging.py); the output URL must accept these chunks
+OUTPUT_STAGING_MODE = 'json'
+
+# Maximum number of bytes in each chunk of an output file (before compression) when streaming output files
+OUTPUT_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Maximum number of times each chunk is sent when streaming output files
+OUTPUT_CHUNK_ATTEMPTS = 5
+
+# With the psutil batch system, jobs are run on this computer by a local scheduler (see batch/local_scheduler.py).  Its
+# settings (number of jobs at a time, CPU pinning, memory needed to start a job) can be changed in conf_local.py, e.g.:
+#   from batch.psutil_impl import SchedulerSettings
+#   SchedulerSettings.SLOTS = 2
+#   SchedulerSettings.CPU_AFFINITY = True
+
 if hostname == 'vecnet02':  # Notre Dame Development PBS/Torque Cluster
     MODELS += [
         openmalaria.SimulationModel('30', '/opt/OM/dependencies/openMalaria'),
@@ -17,4 +17,8 @@ SIMULATION_DEFINITION_FILENAME = "simulation.json"
 
 SIMULATION_SCRIPT = 'run_simulation.py'
 
-SIMULATION_SCRIPT_ERROR_FILE = 'run_simulation_error.txt'
\ No newline at end of file
+SUBMISSION_JOURNAL_FILENAME = 'submission_journal.txt'
+
+SIMULATION_SCRIPT_ERROR_FILE = 'run_simulation_error.txt'
+
+OUTPUT_STAGING_PROGRESS_FILENAME = 'output_staging_progress.json'
@@ -14,14 +14,221 @@ A simple API to records in the Django database for console scripts.
 import importlib
 import json
 import logging
+import random
+import threading
+import time
+from urlparse import urljoin
 
 import requests
+from requests.adapters import HTTPAdapter
 from vecnet.simulation import sim_status, submission_status
 
 
 logger = logging.getLogger(__name__)
 
 
+class HttpSettings:
+    """
+    Settings for the HTTP connections to the REST API.  Changes to the pool size only take effect if they are made
+    before the first request is sent (that's when the process' session is created).
+    """
+    POOL_SIZE = 10          # Maximum number of keep-alive connections to the server
+    CONNECT_TIMEOUT = 10    # Seconds to wait when establishing a connection
+    READ_TIMEOUT = 60       # Seconds to wait for the server to send a response
+
+    # Retry policy for idempotent requests (GET, PATCH).  The delay before a retry is random between 0 and the backoff,
+    # which doubles with each attempt (from BACKOFF_BASE up to BACKOFF_MAX), so that many clients spread out their
+    # retries rather than all hitting the server at the same time.
+    MAX_ATTEMPTS = 6        # Total attempts per request, including the first one
+    BACKOFF_BASE = 1.0      # Seconds
+    BACKOFF_MAX = 60.0      # Seconds
+
+    # Circuit breaker: after this many consecutive failures, requests are not sent to the server for a while
+    BREAKER_THRESHOLD = 5
+    BREAKER_RESET_TIMEOUT = 30.0  # Seconds before a single trial request is let through
+
+    @classmethod
+    def timeouts(cls):
+        """
+        The connect and read timeouts in the form expected by the requests library.
+        """
+        return cls.CONNECT_TIMEOUT, cls.READ_TIMEOUT
+
+
+# The session (with its pool of keep-alive connections) that's shared by all the database records in this process.
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Get the HTTP session that's used for all requests to the REST API in this process.  It's created upon first use.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=HttpSettings.POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+
+def get_connection_stats():
+    """
+    Get statistics about the HTTP connections that this process has made to the REST API.
+
+    :return dict: The number of requests sent ('requests'), the number of connections opened for them ('opened'), and
+                  the number of requests that reused a kept-alive connection ('reused').
+    """
+    stats = dict(requests=0, opened=0)
+    if _session is not None:
+        for adapter in set(_session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    stats['requests'] += pool.num_requests
+                    stats['opened'] += pool.num_connections
+    stats['reused'] = max(stats['requests'] - stats['opened'], 0)
+    return stats
+
+
+class ServerUnavailable(RuntimeError):
+    """
+    Raised when a request isn't sent because the circuit breaker is open (the server appears to be down).
+    """
+
+    def __init__(self, retry_after):
+        super(ServerUnavailable, self).__init__('Server appears to be down; requests suspended for %.1f seconds'
+                                                % retry_after)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker(object):
+    """
+    Sheds load while the server is down.  After a number of consecutive failed requests, the breaker opens and no
+    requests are sent for a while.  Then a single trial request is let through: if it succeeds, the breaker closes and
+    requests flow normally again; if it fails, the breaker opens again.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self):
+        self.state = CircuitBreaker.CLOSED
+        self.consecutive_failures = 0
+        self.opened_when = None
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """
+        Check if a request can be sent.
+
+        :raises ServerUnavailable: if the breaker is open.
+        """
+        with self._lock:
+            if self.state == CircuitBreaker.CLOSED:
+                return
+            retry_after = self.opened_when + HttpSettings.BREAKER_RESET_TIMEOUT - time.time()
+            if self.state == CircuitBreaker.OPEN and retry_after <= 0:
+                # Let this request through as the trial
+                self.state = CircuitBreaker.HALF_OPEN
+                return
+            raise ServerUnavailable(max(retry_after, 0.0))
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CircuitBreaker.CLOSED:
+                logger.info('Server is responding again; circuit breaker closed')
+            self.state = CircuitBreaker.CLOSED
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == CircuitBreaker.HALF_OPEN or \
+                    (self.state == CircuitBreaker.CLOSED and
+                     self.consecutive_failures >= HttpSettings.BREAKER_THRESHOLD):
+                if self.state == CircuitBreaker.CLOSED:
+                    logger.warn('%d consecutive failed requests; circuit breaker opened' % self.consecutive_failures)
+                self.state = CircuitBreaker.OPEN
+                self.opened_when = time.time()
+
+
+_circuit_breaker = CircuitBreaker()
+
+# Response status codes that indicate the server is temporarily unable to handle a request
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def backoff_delay(attempt):
+    """
+    The delay before retrying a request (full jitter: random between 0 and the exponential backoff).
+
+    :param int attempt: The number of the attempt that just failed (1 = the first attempt).
+    :return float: Seconds
+    """
+    backoff = min(HttpSettings.BACKOFF_MAX, HttpSettings.BACKOFF_BASE * 2 ** (attempt - 1))
+    return random.uniform(0, backoff)
+
+
+def send_request(method, url, idempotent, **kwargs):
+    """
+    Send a request to the REST API with the process' session.  Idempotent requests are retried with jittered
+    exponential backoff if the server is unreachable or temporarily unable to respond.  Other requests (e.g., POST,
+    which could create duplicate records) are sent once.  Every request goes through the circuit breaker.
+
+    :param str method: HTTP method
+    :param bool idempotent: Is it safe to send the request again?
+    :param kwargs: Passed to the session's request method.
+    :return: The response.  If all the attempts fail, it's the last response received.
+    :raises: The last error (e.g., requests.ConnectionError or ServerUnavailable) if no response was received.
+    """
+    max_attempts = HttpSettings.MAX_ATTEMPTS if idempotent else 1
+    start_time = time.time()
+    attempt = 0
+    while True:
+        attempt += 1
+        resp = None
+        try:
+            _circuit_breaker.before_request()
+            resp = get_session().request(method, url, timeout=HttpSettings.timeouts(), **kwargs)
+        except ServerUnavailable as exc:
+            error = exc
+            delay = max(exc.retry_after, backoff_delay(attempt))
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            _circuit_breaker.record_failure()
+            error = exc
+            delay = backoff_delay(attempt)
+        except requests.RequestException:
+            # Not retried (e.g., a garbled response or too many redirects), but it must still be reported to the
+            # breaker, or a trial request that fails this way would leave the breaker half-open forever
+            _circuit_breaker.record_failure()
+            raise
+        else:
+            if resp.status_code not in RETRYABLE_STATUS_CODES:
+                _circuit_breaker.record_success()
+                if attempt > 1:
+                    logger.info('%s %s succeeded after %d attempts (%.2f seconds)', method, url, attempt,
+                                time.time() - start_time)
+                return resp
+            _circuit_breaker.record_failure()
+            error = 'response status %d' % resp.status_code
+            delay = backoff_delay(attempt)
+
+        error_text = str(error) or error.__class__.__name__
+        if attempt >= max_attempts:
+            logger.error('%s %s failed after %d attempt(s) (%.2f seconds): %s', method, url, attempt,
+                         time.time() - start_time, error_text)
+            if resp is not None:
+                return resp
+            raise error
+        logger.warn('%s %s attempt %d failed (%s); retrying in %.1f seconds', method, url, attempt, error_text, delay)
+        time.sleep(delay)
+
+
 class Credentials(object):
     """
     Credentials for accessing the database's REST API.
@@ -66,7 +273,7 @@ class DatabaseRecord(object):
         Update certain fields of the database record
         """
         body = json.dumps(new_field_values)
-        resp = requests.patch(self.url, data=body, headers=self.headers)
+        resp = send_request('PATCH', self.url, idempotent=True, data=body, headers=self.headers)
         #  Contrary to the Tastypie 0.11.2 documentation, status code 202 (Accepted) is always returned
         if resp.status_code != 202:
             logger.warn('Expected response status 202, but got %d instead' % resp.status_code)
@@ -80,6 +287,8 @@ class GroupRecord(DatabaseRecord):
     def __init__(self, group_url, simulations_url, credentials):
         super(GroupRecord, self).__init__(group_url, credentials)
         self.simulations_url = simulations_url
+        self.bulk_create_url = urljoin(simulations_url, 'bulk/')
+        self.manifest_url = urljoin(group_url, 'manifest/')
 
     def update_script_status(self, status):
         """
@@ -97,7 +306,7 @@ class GroupRecord(DatabaseRecord):
         """
         field_values["group"] = self.url
         body = json.dumps(field_values)
-        resp = requests.post(self.simulations_url, data=body, headers=self.headers)
+        resp = send_request('POST', self.simulations_url, idempotent=False, data=body, headers=self.headers)
         if resp.status_code == 201:
             simulation_url = resp.headers['Location']
             resp_data = json.loads(resp.content)
@@ -106,6 +315,72 @@ class GroupRecord(DatabaseRecord):
         else:
             raise RuntimeError('Expected response status 201, but got %d instead' % resp.status_code)
 
+    def add_new_simulations(self, field_values_list):
+        """
+        Create a batch of new simulations in the database with a single request, and relate them to this group.
+
+        :param list field_values_list: For each new simulation, the values to assign to certain fields in its database
+                                       record (a dictionary).
+        :return list: A 2-tuple for each new simulation, in the same order as field_values_list: (the proxy for the
+                      simulation's database record, path to simulation's working directory)
+        """
+        body = json.dumps({
+            'group': self.url,
+            'objects': field_values_list,
+        })
+        resp = send_request('POST', self.bulk_create_url, idempotent=False, data=body, headers=self.headers)
+        if resp.status_code != 201:
+            raise RuntimeError('Expected response status 201, but got %d instead' % resp.status_code)
+        new_simulations = []
+        for simulation_data in json.loads(resp.content)['objects']:
+            simulation_url = urljoin(self.simulations_url, simulation_data['resource_uri'])
+            new_simulations.append((SimulationRecord(simulation_url, self.credentials), simulation_data['working_dir']))
+        return new_simulations
+
+    def get_simulations(self):
+        """
+        Get the simulations that are already in the database for this group (from the group's manifest).
+
+        :return list: A 3-tuple for each simulation, in the order they were created: (the proxy for the simulation's
+                      database record, path to simulation's working directory, dictionary with the simulation's
+                      id_on_client, batch_job_id and status)
+        """
+        resp = send_request('GET', self.manifest_url, idempotent=True, headers=self.headers)
+        if resp.status_code != 200:
+            raise RuntimeError('Expected response status 200, but got %d instead' % resp.status_code)
+        simulations = []
+        for simulation_data in json.loads(resp.content)['objects']:
+            simulation_url = urljoin(self.simulations_url, simulation_data['resource_uri'])
+            simulations.append((SimulationRecord(simulation_url, self.credentials), simulation_data['working_dir'],
+                                simulation_data))
+        return simulations
+
+    def update_simulations(self, updates):
+        """
+        Update certain fields in the database records of many simulations with a single request.
+
+        :param list updates: A 2-tuple for each simulation to update: (the proxy for the simulation's database record,
+                             dictionary with the new field values)
+        :return list: The simulations whose updates failed; a 2-tuple for each one: (the proxy for the simulation's
+                      database record, description of the error)
+        """
+        if not updates:
+            return []
+        objects = []
+        for simulation_record, new_field_values in updates:
+            update = dict(new_field_values)
+            update['resource_uri'] = simulation_record.url
+            objects.append(update)
+        body = json.dumps({'objects': objects})
+        resp = send_request('PATCH', self.simulations_url, idempotent=True, data=body, headers=self.headers)
+        if resp.status_code != 202:
+            raise RuntimeError('Expected response status 202, but got %d instead' % resp.status_code)
+        failed_updates = []
+        for (simulation_record, _), result in zip(updates, json.loads(resp.content)['objects']):
+            if not result['updated']:
+                failed_updates.append((simulation_record, result.get('error')))
+        return failed_updates
+
 
 class SimulationRecord(DatabaseRecord):
     """
@@ -181,3 +456,23 @@ class TestingApi:
         """
         global _credentials
         _credentials = None
+
+    @staticmethod
+    def reset_circuit_breaker():
+        """
+        Close the circuit breaker and clear its count of failures.
+        """
+        global _circuit_breaker
+        _circuit_breaker = CircuitBreaker()
+
+    @staticmethod
+    def close_session():
+        """
+        Close the process' HTTP session and its connections.  A new session is created the next time a request is
+        sent.
+        """
+        global _session
+        with _session_lock:
+            if _session is not None:
+                _session.close()
+                _session = None
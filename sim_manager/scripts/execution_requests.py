@@ -0,0 +1,122 @@
+# This file is part of the Simulation Manager project for VecNet.
+# For copyright and licensing information about this project, see the
+# NOTICE.txt and LICENSE.md files in its top-level directory; they are
+# available at https://github.com/vecnet/simulation-manager
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Reading and writing execution request files without loading all their simulations into memory.
+
+The files are written with the group's simulations last, so a reader has all the other fields (the "header") by the
+time it reaches the first simulation.
+"""
+
+import itertools
+import json
+
+from vecnet.simulation import ExecutionRequest, Simulation, SimulationGroup
+
+from streaming_json import JsonStreamParser
+
+# The keys from the top-level object to the array of simulations
+SIMULATIONS_PATH = ['simulation_group', 'simulations']
+
+
+def write(file_path, execution_request, simulations=None):
+    """
+    Write an execution request to a JSON file, with the simulations last.
+
+    :param execution_request: The request's fields other than its simulations are written from this object.
+    :param simulations: The simulations to write (an iterable of Simulation objects or their dictionaries).  If None,
+                        the simulations in the execution request are written.
+    """
+    header = get_header(execution_request)
+    if header['simulation_group'] is None:
+        with open(file_path, 'w') as f:
+            json.dump(header, f)
+        return
+    if simulations is None:
+        simulations = execution_request.simulation_group.simulations
+    with open(file_path, 'w') as f:
+        f.write('{')
+        for key, value in header.items():
+            if key != 'simulation_group':
+                f.write('%s: %s, ' % (json.dumps(key), json.dumps(value)))
+        f.write('"simulation_group": {')
+        for key, value in header['simulation_group'].items():
+            f.write('%s: %s, ' % (json.dumps(key), json.dumps(value)))
+        f.write('"simulations": [')
+        for i, simulation in enumerate(simulations):
+            if isinstance(simulation, Simulation):
+                simulation = simulation.to_dict()
+            if i > 0:
+                f.write(', ')
+            f.write(json.dumps(simulation))
+        f.write(']}}\n')
+
+
+def get_header(execution_request):
+    """
+    Get an execution request's fields, except for its simulations, as a dictionary.
+    """
+    header = dict()
+    for key in ExecutionRequest.dictionary_attributes:
+        if key != 'simulation_group':
+            header[key] = getattr(execution_request, key)
+    if execution_request.simulation_group is None:
+        header['simulation_group'] = None
+    else:
+        header['simulation_group'] = dict()
+        for key in SimulationGroup.dictionary_attributes:
+            if key != 'simulations':
+                header['simulation_group'][key] = getattr(execution_request.simulation_group, key)
+    return header
+
+
+def _is_complete(header):
+    group = header.get('simulation_group')
+    if not isinstance(group, dict) or 'simulations' not in group:
+        return False
+    if any(key not in header for key in ExecutionRequest.dictionary_attributes):
+        return False
+    return all(key in group for key in SimulationGroup.dictionary_attributes)
+
+
+def read(file_path):
+    """
+    Read an execution request from a JSON file, with its simulations read one at a time as they're needed.
+
+    :return: A 2-tuple: (the execution request without its simulations, iterator of its Simulation objects)
+    :raises DictConvertible.Error: if a required field is missing.
+    :raises ValueError: if the file is not valid JSON.
+    """
+    f = open(file_path, 'r')
+    header = dict()
+    items = JsonStreamParser(f).iter_array(SIMULATIONS_PATH, header)
+    try:
+        # Parse up to the first simulation
+        first_items = list(itertools.islice(items, 1))
+
+        if not _is_complete(header):
+            # Some fields come after the simulations (or are missing), so scan the rest of the file for them with a
+            # second parser, skipping over the simulations.
+            header = dict()
+            with open(file_path, 'r') as f2:
+                for _ in JsonStreamParser(f2).iter_array(SIMULATIONS_PATH, header):
+                    pass
+        execution_request = ExecutionRequest.from_dict(header)
+    except:
+        f.close()
+        raise
+
+    def iter_simulations():
+        try:
+            for simulation_dict in itertools.chain(first_items, items):
+                yield Simulation.from_dict(simulation_dict)
+        finally:
+            f.close()
+
+    return execution_request, iter_simulations()
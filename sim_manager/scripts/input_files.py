@@ -9,21 +9,388 @@
 
 """
 Input files for simulations.
+
+Input files are kept in a content-addressed cache, which is shared by the jobs on a node (or on all the nodes, if the
+cache's directory is on a shared filesystem).  The cache's directory has:
+
+    objects/{hash[:2]}/{hash}     the files' contents, named by their SHA-256 hashes (the same contents downloaded
+                                  from different URLs are stored once)
+    urls/{URL's hash}.json        for each URL, the hash of the contents downloaded from it
+    locks/{URL's hash}.lock       while a URL is being downloaded into the cache, so it's downloaded only once when
+                                  several jobs need it at the same time
+    tmp/                          downloads in progress
+
+An input file is put into a simulation's working directory as a hard link to the cached file (or a symbolic link if
+the working directory is on a different filesystem), so no data is copied.  The cached files are read-only, so a
+model can't change the cached copy through its link.  When the cache's total size exceeds its limit, the least
+recently used files are removed.
+
+Input files with file:// URLs are already on the cluster's shared storage, so they aren't cached; they're linked
+directly into the working directory.  Only files under the trusted shared roots in the configuration can be used.
 """
 
-import mock
+import errno
+import hashlib
+import json
+import logging
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import time
+from urllib import url2pathname
+from urlparse import urldefrag, urlparse
 
+from path import path
+from requests.exceptions import RequestException
 
-def add_to_cache(files):
+from conf import (INPUT_CACHE_DIR, INPUT_CACHE_MAX_SIZE, INPUT_CACHE_REVALIDATE_AFTER, SHARED_INPUT_LINK_MODES,
+                  SHARED_INPUT_ROOTS)
+from utils import download_file, DownloadCancelled, parse_checksum
+
+logger = logging.getLogger(__name__)
+
+
+class InputCache(object):
     """
-    Add input files to the local file cache.
+    A content-addressed cache of input files.
     """
-    # For now, this function is stubbed out by calling its associated mock object.
-    TestingApi.add_to_cache_mock(files)
 
+    # Seconds between checks whether another process has finished downloading a URL
+    LOCK_POLL_INTERVAL = 0.2
+
+    def __init__(self, root, max_size, revalidate_after=None, lock_timeout=3600):
+        """
+        :param str root: The cache's directory.
+        :param int max_size: Maximum total size (in bytes) of the cached files.
+        :param int revalidate_after: Number of seconds after which the server is asked whether a cached file has
+                                     changed (with a conditional request); None = cached files never change.
+        :param int lock_timeout: Number of seconds after which a download's lock is considered abandoned (e.g., its
+                                 job was killed), so it's removed.
+        """
+        self.root = path(root).abspath()
+        self.max_size = max_size
+        self.revalidate_after = revalidate_after
+        self.lock_timeout = lock_timeout
+        for subdir in ('objects', 'urls', 'locks', 'tmp'):
+            (self.root / subdir).makedirs_p()
+
+    @staticmethod
+    def url_key(url):
+        return hashlib.sha1(url).hexdigest()
+
+    def object_path(self, content_hash):
+        return self.root / 'objects' / content_hash[:2] / content_hash
+
+    def entry_path(self, url):
+        return self.root / 'urls' / (self.url_key(url) + '.json')
+
+    def read_entry(self, url):
+        """
+        Read the cache's entry for a URL.
+
+        :return dict: The entry: "url", "sha256" (the hash of the contents), "size", "validators" (see
+                      utils.DownloadResult) and "checked_when" (when the contents were last downloaded or
+                      revalidated); None if the URL isn't in the cache.
+        """
+        try:
+            with open(self.entry_path(url), 'r') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def lookup(self, url):
+        """
+        Find the cached file for a URL.  A URL with a SHA-256 checksum (see utils.parse_checksum) matches any cached
+        file with that hash, even if the file was downloaded from another URL.
+
+        :return: The path to the cached file, or None if the URL isn't in the cache (or its file needs to be
+                 revalidated).
+        """
+        _, algorithm, digest = parse_checksum(url)
+        if algorithm == 'sha256' and self._touch(self.object_path(digest)):
+            return self.object_path(digest)
+        entry = self.read_entry(url)
+        if entry is None:
+            return None
+        if self.revalidate_after is not None and time.time() - entry['checked_when'] > self.revalidate_after:
+            return None
+        object_path = self.object_path(entry['sha256'])
+        if not self._touch(object_path):
+            return None  # Evicted
+        return object_path
+
+    @staticmethod
+    def _touch(object_path):
+        """
+        Mark a cached file as recently used.
+
+        :return bool: False if the file isn't in the cache.
+        """
+        try:
+            os.utime(object_path, None)
+            return True
+        except OSError:
+            return False
+
+    def fetch(self, url, cancel_event=None):
+        """
+        Get the cached file for a URL, downloading it into the cache if necessary.
+
+        :param cancel_event: A threading.Event which, when set, stops the download.
+        :return: The path to the cached file.
+        """
+        object_path = self.lookup(url)
+        if object_path is not None:
+            return object_path
+        lock_path = self.root / 'locks' / (self.url_key(url) + '.lock')
+        self._acquire_lock(lock_path, cancel_event)
+        try:
+            # Another job may have downloaded the URL while this one waited for the lock
+            object_path = self.lookup(url)
+            if object_path is None:
+                object_path = self._download(url, cancel_event)
+        finally:
+            os.remove(lock_path)
+        self.evict()
+        return object_path
+
+    def _acquire_lock(self, lock_path, cancel_event):
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()))
+                os.close(fd)
+                return
+            except OSError as exc:
+                if exc.errno != errno.EEXIST:
+                    raise
+            try:
+                if time.time() - os.path.getmtime(lock_path) > self.lock_timeout:
+                    logger.warning('Removing abandoned lock: %s', lock_path)
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue  # Released (or removed) since the attempt to create it
+            if cancel_event is not None and cancel_event.is_set():
+                raise DownloadCancelled(lock_path)
+            time.sleep(self.LOCK_POLL_INTERVAL)
+
+    def _download(self, url, cancel_event):
+        # If the URL's file is in the cache (but needs revalidation), it's only downloaded again if it has changed
+        entry = self.read_entry(url)
+        if entry is not None and not self.object_path(entry['sha256']).exists():
+            entry = None
+        fd, temp_path = tempfile.mkstemp(suffix='.download', dir=self.root / 'tmp')
+        os.close(fd)
+        try:
+            result = download_file(url, temp_path, cancel_event, validators=entry and entry['validators'])
+            if result.is_modified:
+                object_path = self.object_path(result.sha256)
+                if object_path.exists():
+                    os.remove(temp_path)  # The same contents were downloaded from another URL
+                else:
+                    object_path.dirname().makedirs_p()
+                    os.chmod(temp_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                    os.rename(temp_path, object_path)
+                entry = dict(url=url, sha256=result.sha256, size=result.size)
+                logger.info('Cached %s (%d bytes)', url, result.size)
+            else:
+                os.remove(temp_path)
+                object_path = self.object_path(entry['sha256'])
+            os.utime(object_path, None)
+        except:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        entry['validators'] = result.validators
+        entry['checked_when'] = time.time()
+        write_file_atomically(self.entry_path(url), json.dumps(entry))
+        return object_path
+
+    def materialize(self, url, local_path, cancel_event=None):
+        """
+        Put the file for a URL at a local path (e.g., in a simulation's working directory), downloading it into the
+        cache if necessary.  The local path is a hard link to the cached file if possible, otherwise a copy (e.g., if
+        the local path is on another filesystem).  It's never a symbolic link, because the cached file may be evicted
+        while a simulation is still using it.
+
+        :param cancel_event: A threading.Event which, when set, stops the download.
+        """
+        local_path = path(local_path).abspath()
+        for attempt in (1, 2):
+            object_path = self.fetch(url, cancel_event)
+            try:
+                link_file(object_path, local_path, ('hardlink', 'copy'))
+                return
+            except (IOError, OSError) as exc:
+                if exc.errno != errno.ENOENT or attempt == 2:
+                    raise
+                # The cached file was evicted by another job after it was fetched; fetch it again
+
+    def get_size(self):
+        """
+        Get the total size (in bytes) of the cached files.
+        """
+        return sum(f.getsize() for f in (self.root / 'objects').walkfiles())
+
+    def evict(self):
+        """
+        Remove the least recently used files until the cache's total size is within its limit.  A file that's still
+        hard-linked into a working directory keeps its data on disk until the working directory is removed.
+        """
+        files = []
+        total_size = 0
+        for object_path in (self.root / 'objects').walkfiles():
+            try:
+                file_stat = object_path.stat()
+            except OSError:
+                continue  # Removed by another job
+            files.append((file_stat.st_mtime, file_stat.st_size, object_path))
+            total_size += file_stat.st_size
+        files.sort()
+        for _, size, object_path in files:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(object_path)
+                logger.info('Evicted %s from input cache', object_path.name)
+            except OSError:
+                pass  # Removed by another job
+            total_size -= size
+
+
+def write_file_atomically(file_path, contents):
+    fd, temp_path = tempfile.mkstemp(dir=path(file_path).dirname())
+    with os.fdopen(fd, 'w') as f:
+        f.write(contents)
+    if os.name == 'nt' and os.path.exists(file_path):
+        os.remove(file_path)  # rename doesn't replace an existing file on Windows
+    os.rename(temp_path, file_path)
+
+
+# Ioctl request for Linux to clone a file's extents into another file on the same filesystem (e.g., Btrfs or XFS)
+FICLONE = 0x40049409
 
-class TestingApi:
+
+def reflink(source, dest):
+    """
+    Create a copy-on-write clone of a file, which shares the source's data blocks until either file is changed.
+    """
+    if not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, 'Reflinks not supported on this platform')
+    import fcntl
+    with open(source, 'rb') as src:
+        with open(dest, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+# Functions to link (or copy) a file, by mode
+LINK_FUNCTIONS = {
+    'reflink': reflink,
+    'hardlink': lambda source, dest: os.link(source, dest),
+    'symlink': lambda source, dest: os.symlink(source, dest),
+    'copy': shutil.copyfile,
+}
+
+
+def link_file(source, local_path, modes=('hardlink', 'symlink', 'copy')):
     """
-    API for unit tests.
+    Create a link to a file, replacing any existing file at the local path.
+
+    :param modes: The ways to link the file, in the order they're tried: "reflink", "hardlink", "symlink" or "copy".
+                  A mode isn't possible if the platform (or filesystem) doesn't support it, or (for reflinks and hard
+                  links) if the source is on a different filesystem.
+    :return str: The mode used.
+    :raises IOError, OSError: if the source doesn't exist, or none of the modes were possible.
+    """
+    temp_path = local_path.dirname() / ('.%s.link' % local_path.name)
+    error = None
+    for mode in modes:
+        if os.path.lexists(temp_path):
+            temp_path.remove()
+        try:
+            LINK_FUNCTIONS[mode](source, temp_path)
+            break
+        except (AttributeError, IOError, OSError) as exc:
+            if getattr(exc, 'errno', None) == errno.ENOENT:
+                raise
+            error = exc
+    else:
+        if os.path.lexists(temp_path):
+            temp_path.remove()
+        raise error
+    if os.name == 'nt' and os.path.lexists(local_path):
+        local_path.remove()  # rename doesn't replace an existing file on Windows
+    os.rename(temp_path, local_path)
+    return mode
+
+
+def get_shared_path(file_url):
+    """
+    Get the path of a file on shared storage from its file:// URL.
+
+    :raises ValueError: if the URL is for a remote host, or the file isn't in one of the trusted shared roots
+                        (conf.SHARED_INPUT_ROOTS).
+    """
+    parts = urlparse(urldefrag(file_url)[0])
+    if parts.netloc not in ('', 'localhost'):
+        raise ValueError('File URL for a remote host: %s' % file_url)
+    file_path = os.path.realpath(url2pathname(parts.path))
+    for root in SHARED_INPUT_ROOTS:
+        root = os.path.join(os.path.realpath(root), '')
+        if file_path.startswith(root):
+            return path(file_path)
+    raise ValueError('File is not in a trusted shared root: %s' % file_url)
+
+
+def link_shared_file(file_url, local_path):
+    """
+    Put a file on shared storage at a local path (e.g., in a simulation's working directory) without copying its
+    data, by trying the ways in conf.SHARED_INPUT_LINK_MODES.
+
+    :raises ValueError: if the file isn't in a trusted shared root.
+    """
+    source = get_shared_path(file_url)
+    local_path = path(local_path).abspath()
+    start_time = time.time()
+    mode = link_file(source, local_path, SHARED_INPUT_LINK_MODES)
+    logger.info('Linked %s to %s (%s, %.3f seconds)', source, local_path.name, mode, time.time() - start_time)
+
+
+def get_cache():
+    """
+    Get the input cache configured for this node (None if caching is disabled).
+    """
+    if INPUT_CACHE_DIR is None:
+        return None
+    return InputCache(INPUT_CACHE_DIR, INPUT_CACHE_MAX_SIZE, INPUT_CACHE_REVALIDATE_AFTER)
+
+
+def add_to_cache(files):
+    """
+    Add input files to the local file cache.  A file that can't be downloaded (or whose contents don't match its URL's
+    checksum, or whose URL's checksum is malformed) is skipped, so it'll be downloaded by each simulation that needs
+    it.
+
+    Files on shared storage (file:// URLs) aren't cached, because each simulation links them from their shared root.
+
+    :param dict files: Key = local file name, value = URL of the file (None = no files)
+    :return dict: The files that couldn't be downloaded: key = URL, value = the error.
     """
-    add_to_cache_mock = mock.MagicMock()
+    errors = dict()
+    if not files:
+        return errors
+    cache = get_cache()
+    if cache is None:
+        return errors
+    for file_url in files.itervalues():
+        if urlparse(file_url).scheme == 'file':
+            continue
+        try:
+            cache.fetch(file_url)
+        except (RequestException, EnvironmentError, ValueError) as exc:
+            logger.warning('Unable to cache %s: %s', file_url, exc)
+            errors[file_url] = exc
+    return errors
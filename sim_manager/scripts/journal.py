@@ -0,0 +1,140 @@
+# This file is part of the Simulation Manager project for VecNet.
+# For copyright and licensing information about this project, see the
+# NOTICE.txt and LICENSE.md files in its top-level directory; they are
+# available at https://github.com/vecnet/simulation-manager
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+The journal of the steps that the submit_group.py script has completed for a group's simulations.
+
+The journal is an append-only file in the group's working directory with one JSON object per line.  Each line records
+that a step was completed for a simulation (identified by its index in the group's execution request):
+
+    {"step": "created", "index": 0, "url": "http://...", "working_dir": "/..."}
+    {"step": "submitted", "index": 0, "job_id": "1234"}
+    {"step": "recorded", "index": 0}
+
+Entries are flushed to disk after each batch of steps (a job's submission is written as soon as the job is submitted),
+so if the script dies, the journal tells which steps were finished and the script can resume with the remaining work.
+"""
+
+import json
+import os
+import threading
+
+
+class SimulationProgress(object):
+    """
+    The steps that have been completed for a simulation.
+    """
+
+    def __init__(self):
+        self.url = None
+        self.working_dir = None
+        self.is_submitted = False
+        self.job_id = None
+        self.is_recorded = False
+
+    @property
+    def is_created(self):
+        return self.url is not None
+
+
+class SubmissionJournal(object):
+    """
+    The journal for a simulation group's submission.
+    """
+
+    CREATED = 'created'      # The simulation's database record and working directory were created
+    SUBMITTED = 'submitted'  # The simulation's job was submitted to the batch system (job_id is None if failed)
+    RECORDED = 'recorded'    # The simulation's job id (or submission error) was saved in its database record
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.progress = dict()  # key = simulation index, value = SimulationProgress
+        self._file = None
+        self._lock = threading.Lock()  # Submission workers write to the journal concurrently
+
+    def load(self):
+        """
+        Load the steps in the journal file (if it exists).  A partial last line (the script died while writing it) is
+        ignored.
+        """
+        self.progress = dict()
+        if not os.path.exists(self.file_path):
+            return
+        with open(self.file_path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                self._apply(entry)
+
+    def _apply(self, entry):
+        progress = self.progress.setdefault(entry['index'], SimulationProgress())
+        step = entry['step']
+        if step == SubmissionJournal.CREATED:
+            progress.url = entry['url']
+            progress.working_dir = entry['working_dir']
+        elif step == SubmissionJournal.SUBMITTED:
+            progress.is_submitted = True
+            progress.job_id = entry['job_id']
+        elif step == SubmissionJournal.RECORDED:
+            progress.is_recorded = True
+
+    def get_progress(self, index):
+        """
+        Get the steps that have been completed for a simulation.
+
+        :param int index: The simulation's index in the group's execution request.
+        """
+        return self.progress.get(index) or SimulationProgress()
+
+    def open(self, resume=False):
+        """
+        Open the journal file for writing.
+
+        :param bool resume: If True, new steps are appended to the existing journal.  If False, the journal is
+                            started anew.
+        """
+        if resume:
+            self.load()
+        else:
+            self.progress = dict()
+        self._file = open(self.file_path, 'a' if resume else 'w')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def write(self, entries):
+        """
+        Append a batch of steps to the journal, and flush them to disk.  Safe to call from multiple threads.
+
+        :param list entries: Each entry is a dictionary with the keys "step" and "index", plus the step's details.
+        """
+        if not entries:
+            return
+        with self._lock:
+            for entry in entries:
+                self._file.write(json.dumps(entry) + '\n')
+                self._apply(entry)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    @staticmethod
+    def created(index, url, working_dir):
+        return dict(step=SubmissionJournal.CREATED, index=index, url=url, working_dir=working_dir)
+
+    @staticmethod
+    def submitted(index, job_id):
+        return dict(step=SubmissionJournal.SUBMITTED, index=index, job_id=job_id)
+
+    @staticmethod
+    def recorded(index):
+        return dict(step=SubmissionJournal.RECORDED, index=index)
@@ -0,0 +1,184 @@
+# This file is part of the Simulation Manager project for VecNet.
+# For copyright and licensing information about this project, see the
+# NOTICE.txt and LICENSE.md files in its top-level directory; they are
+# available at https://github.com/vecnet/simulation-manager
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Streaming upload of a simulation's output files to its output URL.
+
+Each file is sent in chunks, with one PUT request per chunk:
+
+    PUT {output_url}
+    Content-Type: application/octet-stream
+    Content-Encoding: gzip
+    Content-Range: bytes {first}-{last}/{file size}     ("bytes */0" for an empty file)
+    X-Id-On-Client: {the simulation's id on the client}
+    X-Output-Filename: {the file's name}
+
+    {the chunk's bytes, gzip-compressed}
+
+Each chunk is compressed by itself, so the receiver can decompress a chunk as soon as it arrives and a chunk can be
+sent again by itself.  The files are read as bytes, so binary files are sent unchanged.  Only one chunk is in memory
+at a time.  After all the files have been sent, a manifest is POSTed to the output URL:
+
+    {"id_on_client": "...", "streamed_files": {"ctsout.txt": {"size": 123456789}, ...}}
+
+A chunk that fails with a connection error or a temporary server error is retried.  The chunks that the receiver has
+accepted are recorded in a progress file in the working directory, so if the upload is interrupted, it resumes with
+the first unaccepted chunk when it's started again.
+"""
+
+import json
+import logging
+import os
+import time
+import zlib
+
+from path import path
+import requests
+
+from database_api import backoff_delay, RETRYABLE_STATUS_CODES
+
+logger = logging.getLogger(__name__)
+
+
+def load_progress(progress_path):
+    """
+    Load the progress of an upload.
+
+    :return dict: key = file name, value = dictionary with the file's size and modification time when the upload
+                  started, and the number of bytes accepted by the receiver ("size", "mtime", "offset"; "complete"
+                  is True when the whole file has been accepted).
+    """
+    if not os.path.exists(progress_path):
+        return dict()
+    try:
+        with open(progress_path, 'r') as f:
+            return json.load(f)
+    except ValueError:
+        return dict()  # Partially written when the script stopped
+
+
+def save_progress(progress_path, progress):
+    """
+    Save the progress of an upload.  The progress file is replaced atomically, so it's never partially written.
+    """
+    temp_path = progress_path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(progress, f)
+    os.rename(temp_path, progress_path)
+
+
+def gzip_compress(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # 16 = write a gzip header and trailer
+    return compressor.compress(data) + compressor.flush()
+
+
+def iter_chunks(f, offset, size, chunk_size):
+    """
+    Read a file's chunks, starting at an offset.
+
+    :return: Generator of 2-tuples: (chunk's offset, chunk's data).  An empty file has one empty chunk.
+    """
+    if size == 0:
+        yield 0, ''
+        return
+    f.seek(offset)
+    while offset < size:
+        data = f.read(min(chunk_size, size - offset))
+        if not data:
+            raise IOError('File was truncated during upload: %s' % f.name)
+        yield offset, data
+        offset += len(data)
+
+
+def send_with_retries(session, method, url, max_attempts, **kwargs):
+    """
+    Send a request, and retry it with jittered exponential backoff if there's a connection error or a temporary
+    server error.
+
+    :raises requests.exceptions.RequestException: if the request still fails after the maximum number of attempts, or
+                                                  it fails with an error that's not temporary.
+    """
+    for attempt in range(1, max_attempts + 1):
+        try:
+            resp = session.request(method, url, **kwargs)
+            if resp.status_code not in RETRYABLE_STATUS_CODES or attempt == max_attempts:
+                resp.raise_for_status()
+                return resp
+            error = 'response status %d' % resp.status_code
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as exc:
+            if attempt == max_attempts:
+                raise
+            error = str(exc) or exc.__class__.__name__
+        delay = backoff_delay(attempt)
+        logger.warning('%s %s attempt %d failed (%s); retrying in %.1f seconds', method, url, attempt, error, delay)
+        time.sleep(delay)
+
+
+def stream_output_files(output_url, id_on_client, filenames, progress_path, chunk_size, max_attempts, dir_path=None,
+                        callback=None):
+    """
+    Upload output files to an output URL in chunks (see this module's docstring).
+
+    :param list filenames: Names of the files.  A file that doesn't exist is skipped (a model may not write all its
+                           output files, depending on its settings).
+    :param str progress_path: Path to the file where the upload's progress is saved.  It's removed when the upload
+                              is done.
+    :param int chunk_size: Maximum number of bytes in a chunk (before compression).
+    :param int max_attempts: Maximum number of times a request is sent.
+    :param str dir_path: Where the files are located (default: current working directory)
+    :param callback: A callable object that's called with the name of each file before it's sent.
+    :raises requests.exceptions.RequestException: if a request fails.
+    """
+    if dir_path is None:
+        dir_path = path.getcwd().abspath()
+    dir_path = path(dir_path)
+    progress = load_progress(progress_path)
+    session = requests.Session()
+    streamed_files = dict()
+    for filename in filenames:
+        file_path = dir_path / filename
+        if not file_path.exists():
+            continue
+        if callback:
+            callback(filename)
+        size = file_path.getsize()
+        mtime = file_path.getmtime()
+        streamed_files[filename] = dict(size=size)
+
+        file_progress = progress.get(filename)
+        if file_progress is None or file_progress['size'] != size or file_progress['mtime'] != mtime:
+            file_progress = progress[filename] = dict(size=size, mtime=mtime, offset=0, complete=False)
+        elif file_progress['complete']:
+            continue
+        elif file_progress['offset'] > 0:
+            logger.info('Resuming upload of %s at byte %d', filename, file_progress['offset'])
+
+        with open(file_path, 'rb') as f:
+            for offset, data in iter_chunks(f, file_progress['offset'], size, chunk_size):
+                if size == 0:
+                    content_range = 'bytes */0'
+                else:
+                    content_range = 'bytes %d-%d/%d' % (offset, offset + len(data) - 1, size)
+                headers = {
+                    'Content-Type': 'application/octet-stream',
+                    'Content-Encoding': 'gzip',
+                    'Content-Range': content_range,
+                    'X-Id-On-Client': id_on_client,
+                    'X-Output-Filename': filename,
+                }
+                send_with_retries(session, 'PUT', output_url, max_attempts, data=gzip_compress(data), headers=headers)
+                file_progress['offset'] = offset + len(data)
+                file_progress['complete'] = file_progress['offset'] >= size
+                save_progress(progress_path, progress)
+
+    manifest = dict(id_on_client=id_on_client, streamed_files=streamed_files)
+    send_with_retries(session, 'POST', output_url, max_attempts, data=json.dumps(manifest),
+                      headers={'Content-Type': 'application/json'})
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
@@ -23,7 +23,9 @@ import api_urls
 import conf
 import constants
 import database_api
-from utils import download_file, get_file_contents
+import input_files
+import output_staging
+from utils import download_file, download_files, get_file_contents
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -55,6 +57,9 @@ def main():
     stage_output_files(sim_model.output_filenames, simulation)
 
     simulation_db_rec.update_status(sim_status.SCRIPT_DONE)
+    connection_stats = database_api.get_connection_stats()
+    logger.info('HTTP requests to API: %(requests)d (connections opened: %(opened)d, reused: %(reused)d)',
+                connection_stats)
     logger.info('Script done')
 
 
@@ -70,18 +75,32 @@ def get_database_record():
 
 def get_input_files(files):
     """
-    Get the scenario's input files and put them in the working directory.
+    Get the scenario's input files and put them in the working directory.  The files are downloaded concurrently (up
+    to conf.INPUT_STAGING_WORKERS at a time); if one of them fails, the others are cancelled.  If the input cache is
+    enabled, the files are linked from the cache, so each file is only downloaded once per node.  Files with file://
+    URLs (in trusted shared roots) are linked from their location on shared storage.
 
     :param dict files: Key = local file name to store input file as, value = URL of input file
     """
     for local_name, file_url in files.iteritems():
         scheme = urlparse(file_url).scheme
-        if scheme in ('http', 'https'):
-            logger.info('Downloading %s from %s ...', local_name, file_url)
-            download_file(file_url, local_name)
-        else:
+        if scheme == 'file':
+            input_files.get_shared_path(file_url)  # Raises ValueError if the file isn't in a trusted shared root
+        elif scheme not in ('http', 'https'):
             raise NotImplementedError('URL scheme "%s" not supported' % scheme)
 
+    cache = input_files.get_cache()
+    download = download_file if cache is None else cache.materialize
+
+    def stage_file(file_url, local_name, cancel_event):
+        if urlparse(file_url).scheme == 'file':
+            input_files.link_shared_file(file_url, local_name)
+        else:
+            download(file_url, local_name, cancel_event)
+
+    print_download_in_log = lambda local_name, file_url: logger.info('Staging %s from %s ...', local_name, file_url)
+    download_files(files, conf.INPUT_STAGING_WORKERS, callback=print_download_in_log, download=stage_file)
+
 
 def stage_output_files(output_filenames, simulation):
     """
@@ -95,10 +114,17 @@ def stage_output_files(output_filenames, simulation):
         logger.info('No output files were staged because output_url is None')
         return
     logger.info('Staging output files to %s ...', output_url)
+    print_filename_in_log = lambda filename: logger.info('  %s', filename)
+
+    if conf.OUTPUT_STAGING_MODE == 'stream':
+        progress_path = path.getcwd().abspath() / constants.OUTPUT_STAGING_PROGRESS_FILENAME
+        output_staging.stream_output_files(output_url, simulation.id_on_client, output_filenames, progress_path,
+                                           conf.OUTPUT_CHUNK_SIZE, conf.OUTPUT_CHUNK_ATTEMPTS,
+                                           callback=print_filename_in_log)
+        return
 
     # Collect the contents of the output files into a dictionary: key = filename, value = list of strings (one per
     # line)
-    print_filename_in_log = lambda filename: logger.info('  %s', filename)
     output_files = get_file_contents(output_filenames, print_filename_in_log)
 
     output_data = dict(id_on_client=simulation.id_on_client, output_files=output_files)
@@ -0,0 +1,189 @@
+# This file is part of the Simulation Manager project for VecNet.
+# For copyright and licensing information about this project, see the
+# NOTICE.txt and LICENSE.md files in its top-level directory; they are
+# available at https://github.com/vecnet/simulation-manager
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Incremental parsing of large JSON documents.
+
+A document is read from a file-like object in blocks, and the items of one of its arrays (e.g., the simulations in an
+execution request) are returned one at a time.  So memory use depends on the size of the largest item, rather than the
+size of the whole document.
+"""
+
+import json
+import zlib
+
+WHITESPACE = ' \t\n\r'
+
+
+class JsonStreamParser(object):
+    """
+    Parses a JSON document incrementally from a file-like object.
+    """
+
+    def __init__(self, f, read_size=64 * 1024):
+        """
+        :param f: A file-like object with a read(size) method.
+        :param int read_size: Number of bytes to read at a time.
+        """
+        self.f = f
+        self.read_size = read_size
+        self.buffer = ''
+        self.pos = 0  # Position of the next character to parse in the buffer
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def iter_array(self, path, header):
+        """
+        Parse a JSON document whose top-level value is an object, and return the items of the array at the given path
+        one at a time.
+
+        :param list path: The keys that lead from the top-level object to the array, e.g., ["group", "items"].
+        :param dict header: The other values along the path are stored in this dictionary (in nested dictionaries that
+                            mirror the document's objects).  An empty list is stored in place of the array as soon as
+                            the array is found, so a caller can check if the path exists.
+        :return: Generator of the array's items.
+        :raises ValueError: if the document is not valid JSON, or a value on the path has the wrong type.
+        """
+        assert len(path) > 0
+        for item in self._iter_object(path, header):
+            yield item
+        if self._skip_whitespace() is not None:
+            raise ValueError('Extra data after JSON document at position %d' % self.pos)
+
+    def _iter_object(self, path, container):
+        self._expect('{')
+        if self._skip_whitespace() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self._decode_value()
+            if not isinstance(key, basestring):
+                raise ValueError('Expected object key at position %d' % self.pos)
+            self._expect(':')
+            if key == path[0] and self._skip_whitespace() != 'n':  # Any null on the path is stored like other values
+                if len(path) == 1:
+                    container[key] = []
+                    for item in self._iter_array_items():
+                        yield item
+                else:
+                    container[key] = dict()
+                    for item in self._iter_object(path[1:], container[key]):
+                        yield item
+            else:
+                container[key] = self._decode_value()
+            c = self._next_char()
+            if c == '}':
+                return
+            if c != ',':
+                raise ValueError("Expected ',' or '}' at position %d" % (self.pos - 1))
+
+    def _iter_array_items(self):
+        self._expect('[')
+        if self._skip_whitespace() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self._decode_value()
+            c = self._next_char()
+            if c == ']':
+                return
+            if c != ',':
+                raise ValueError("Expected ',' or ']' at position %d" % (self.pos - 1))
+
+    def _fill(self, min_size=0):
+        """
+        Read more of the document into the buffer, discarding what's been parsed already.
+
+        :return bool: True if more data was read, False if at the end of the document.
+        """
+        if self.eof:
+            return False
+        data = self.f.read(max(self.read_size, min_size))
+        if not data:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def _skip_whitespace(self):
+        """
+        Skip over any whitespace.
+
+        :return: The next character (without consuming it), or None if at the end of the document.
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return None
+
+    def _next_char(self):
+        c = self._skip_whitespace()
+        if c is None:
+            raise ValueError('Unexpected end of JSON document')
+        self.pos += 1
+        return c
+
+    def _expect(self, expected_char):
+        c = self._next_char()
+        if c != expected_char:
+            raise ValueError("Expected '%s' at position %d" % (expected_char, self.pos - 1))
+
+    def _decode_value(self):
+        """
+        Decode the next value in the document.
+        """
+        if self._skip_whitespace() is None:
+            raise ValueError('Unexpected end of JSON document')
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                # The value may be incomplete; read more of the document (at least doubling the unparsed data, so a
+                # large value isn't decoded over and over again).
+                if not self._fill(len(self.buffer) - self.pos):
+                    raise
+                continue
+            # A number or literal that ends at the end of the buffer may continue in the next block.
+            if end == len(self.buffer) and self._fill(len(self.buffer) - self.pos):
+                continue
+            self.pos = end
+            return value
+
+
+class GzipReader(object):
+    """
+    A file-like object that decompresses gzip-compressed data as it's read from another file-like object.
+    """
+
+    def __init__(self, f, read_size=64 * 1024):
+        self.f = f
+        self.read_size = read_size
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)  # 16 = expect a gzip header and trailer
+
+    def read(self, size=64 * 1024):
+        """
+        Read up to size bytes of decompressed data.  The amount of decompressed data in memory is bounded by size, no
+        matter how well the data was compressed.
+
+        :return str: The data, or an empty string at the end of the compressed data.
+        :raises zlib.error: if the data is not valid gzip data.
+        """
+        while True:
+            data = self.decompressor.unconsumed_tail
+            if not data:
+                data = self.f.read(self.read_size)
+                if not data:
+                    return self.decompressor.flush()
+            decompressed = self.decompressor.decompress(data, size)
+            if decompressed:
+                return decompressed
@@ -11,18 +11,22 @@
 Submit the simulations in a group to the batch system.
 """
 
+import itertools
+from multiprocessing.pool import ThreadPool
 import os
 import path
 import sys
 
 import api_urls
 from batch.utils import load_batch_system
-from conf import BATCH_SYSTEM
-from constants import EXECUTION_REQUEST_FILENAME, SIMULATION_DEFINITION_FILENAME, SIMULATION_SCRIPT
+from conf import BATCH_SYSTEM, SIMULATION_CHUNK_SIZE, SUBMISSION_WORKERS
+from constants import (EXECUTION_REQUEST_FILENAME, SIMULATION_DEFINITION_FILENAME, SIMULATION_SCRIPT,
+                       SUBMISSION_JOURNAL_FILENAME)
 import database_api
+import execution_requests
 import input_files
+from journal import SubmissionJournal
 
-from vecnet.simulation import ExecutionRequest
 from vecnet.simulation.submission_status import (
     STARTED_SCRIPT,
     CACHING_FILES,
@@ -36,7 +40,8 @@ def main(*args, **kwargs):
     """
     The main algorithm of the script.
 
-    :param args: Sequence of command-line arguments
+    :param args: Sequence of command-line arguments.  If "--resume" is one of them, the script resumes the group's
+                 submission where an earlier run left off (according to the journal in the group's working directory).
     :param kwargs: Special parameters for testing purposes.  They are provided when the script is imported as a module.
     :return: exit status
     """
@@ -63,6 +68,8 @@ def main(*args, **kwargs):
     print >>stdout, '  group_url =', group_url
     print >>stdout, '  simulations_url =', simulations_url
 
+    # Keep enough connections alive for all the submission workers
+    database_api.HttpSettings.POOL_SIZE = max(database_api.HttpSettings.POOL_SIZE, SUBMISSION_WORKERS)
     group_db_rec = database_api.get_group_record(group_url, simulations_url)
     group_db_rec.update_script_status(STARTED_SCRIPT)
     if test_callback:
@@ -70,10 +77,13 @@ def main(*args, **kwargs):
 
     print >>stdout, "Loading execution request ..."
     execution_request_path = working_dir / EXECUTION_REQUEST_FILENAME
-    execution_request = ExecutionRequest.read_json_file(execution_request_path)
+    # The simulations are read from the file as they're submitted, so they're not all in memory at once
+    execution_request, simulations = execution_requests.read(execution_request_path)
 
     group_db_rec.update_script_status(CACHING_FILES)
-    input_files.add_to_cache(execution_request.input_files)
+    cache_errors = input_files.add_to_cache(execution_request.input_files)
+    for file_url, error in cache_errors.items():
+        print >>stdout, '  Unable to cache %s: %s' % (file_url, error)
     if test_callback:
         test_callback()
 
@@ -83,35 +93,182 @@ def main(*args, **kwargs):
     simulation_script = path.path(__file__).dirname() / SIMULATION_SCRIPT
     batch_system = load_batch_system(BATCH_SYSTEM)
 
-    for simulation in execution_request.simulation_group.simulations:
-        simulation_db_rec, sim_working_dir = group_db_rec.add_new_simulation(id_on_client=simulation.id_on_client)
-        print >>stdout, ' ', simulation_db_rec.url
+    def submit(simulation_info):
+        index, simulation, simulation_db_rec, sim_working_dir = simulation_info
+        job_id = submit_simulation(batch_system, simulation_script, simulation, simulation_db_rec, sim_working_dir)
+        # Journaled as soon as the job is submitted, so if the script dies before the rest of the chunk is done, the
+        # job isn't submitted again when the script resumes
+        journal.write([SubmissionJournal.submitted(index, job_id)])
+        return job_id
 
-        # Write the simulation object as JSON to the working directory
-        sim_working_dir = path.path(sim_working_dir)
-        sim_definition_path = sim_working_dir / SIMULATION_DEFINITION_FILENAME
-        simulation.write_json_file(sim_definition_path)
+    def write_definition(simulation_info):
+        _, simulation, _, sim_working_dir = simulation_info
+        write_simulation_definition(simulation, sim_working_dir)
 
-        # Schedule the simulation with the batch system.
-        cmd_args = [simulation_script]
-        job_id = batch_system.submit_job(sys.executable, sim_working_dir, *cmd_args)
-        print >>stdout, '    batch job =', job_id
-        if job_id is not None:
-            simulation_db_rec.set_batch_job(job_id)
-        else:
-            # Job submission failed, set this simulation status to SCRIPT_ERROR
-            simulation_db_rec.update_status(SCRIPT_ERROR)
-            pass
+    # The journal records the steps completed for each simulation.  When resuming, the steps that were completed by
+    # an earlier run of the script are skipped.
+    resume = '--resume' in args[1:]
+    journal = SubmissionJournal(working_dir / SUBMISSION_JOURNAL_FILENAME)
+    journal.open(resume)
+    if resume:
+        print >>stdout, '  resuming with journal =', journal.file_path
+
+    # The records for the simulations may have been created already (when the group was accepted by the server, or
+    # by an earlier run of the script)
+    existing_records = group_db_rec.get_simulations()
+    print >>stdout, '  existing simulations in database =', len(existing_records)
+    if resume:
+        # A job id in the database means that the job was submitted and recorded, even if the earlier run died
+        # before it could write those steps in the journal.
+        entries = []
+        for index, (_, _, simulation_data) in enumerate(existing_records):
+            progress = journal.get_progress(index)
+            if simulation_data['batch_job_id'] and not progress.is_recorded:
+                if not progress.is_submitted:
+                    entries.append(SubmissionJournal.submitted(index, simulation_data['batch_job_id']))
+                entries.append(SubmissionJournal.recorded(index))
+        journal.write(entries)
+
+    # The simulations in each chunk are submitted concurrently by a pool of worker threads.  Their results are
+    # collected in the order of the simulations, so the output below is the same regardless of how many workers.
+    pool = ThreadPool(SUBMISSION_WORKERS)
+    try:
+        simulation_count = 0
+        for chunk_start, chunk in iter_chunks(simulations, SIMULATION_CHUNK_SIZE):
+            simulation_count += len(chunk)
 
-        if test_callback:
-            test_callback()
+            # Create the database records for a chunk of simulations (unless they exist already) with a single request
+            new_records = [(simulation_db_rec, sim_working_dir) for simulation_db_rec, sim_working_dir, _
+                           in existing_records[chunk_start:chunk_start + SIMULATION_CHUNK_SIZE]]
+            if len(new_records) < len(chunk):
+                new_fields = [get_record_fields(x, execution_request.simulation_group)
+                              for x in chunk[len(new_records):]]
+                new_records += group_db_rec.add_new_simulations(new_fields)
+            simulation_infos = [(chunk_start + i, simulation, simulation_db_rec, sim_working_dir)
+                                for i, (simulation, (simulation_db_rec, sim_working_dir))
+                                in enumerate(zip(chunk, new_records))]
+            journal.write([SubmissionJournal.created(index, simulation_db_rec.url, sim_working_dir)
+                           for index, _, simulation_db_rec, sim_working_dir in simulation_infos
+                           if not journal.get_progress(index).is_created])
+
+            # Submit the simulations that haven't been submitted yet
+            unsubmitted = [x for x in simulation_infos if not journal.get_progress(x[0]).is_submitted]
+            if unsubmitted and batch_system.supports_job_arrays:
+                # Submit them to the batch system at once as a job array
+                pool.map(write_definition, unsubmitted)
+                sim_working_dirs = [path.path(x[3]) for x in unsubmitted]
+                job_ids = batch_system.submit_jobs(sys.executable, sim_working_dirs, [simulation_script],
+                                                   script_dir=working_dir)
+                journal.write([SubmissionJournal.submitted(x[0], job_id) for x, job_id in zip(unsubmitted, job_ids)])
+            else:
+                pool.map(submit, unsubmitted)
+
+            # Record the batch jobs that haven't been recorded yet with a single request
+            unrecorded = [x for x in simulation_infos if not journal.get_progress(x[0]).is_recorded]
+            failed_updates = record_batch_jobs(group_db_rec, [x[2] for x in unrecorded],
+                                               [journal.get_progress(x[0]).job_id for x in unrecorded])
+            failed_db_recs = set(simulation_db_rec for simulation_db_rec, _ in failed_updates)
+            journal.write([SubmissionJournal.recorded(x[0]) for x in unrecorded if x[2] not in failed_db_recs])
+
+            for index, _, simulation_db_rec, _ in simulation_infos:
+                print >>stdout, ' ', simulation_db_rec.url
+                print >>stdout, '    batch job =', journal.get_progress(index).job_id
+                if test_callback:
+                    test_callback()
+            for simulation_db_rec, error in failed_updates:
+                print >>stdout, 'Error updating %s: %s' % (simulation_db_rec.url, error)
+
+        if len(existing_records) > simulation_count:
+            raise RuntimeError('The group has %d simulations in the database, but only %d in its execution request'
+                               % (len(existing_records), simulation_count))
+        pool.close()
+    except Exception:
+        pool.terminate()
+        group_db_rec.update_script_status(SCRIPT_ERROR)
+        raise
+    finally:
+        pool.join()
+        journal.close()
 
     print >>stdout, "Done"
     group_db_rec.update_script_status(SCRIPT_DONE)
 
+    connection_stats = database_api.get_connection_stats()
+    print >>stdout, 'HTTP requests to API =', connection_stats['requests']
+    print >>stdout, '  connections opened =', connection_stats['opened']
+    print >>stdout, '  connections reused =', connection_stats['reused']
+
     return 0
 
 
+def iter_chunks(iterable, chunk_size):
+    """
+    Split a sequence of items into chunks, without needing all the items in memory.
+
+    :return: Generator of 2-tuples: (index of the chunk's first item in the sequence, list of the chunk's items)
+    """
+    iterator = iter(iterable)
+    chunk_start = 0
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk_start, chunk
+        chunk_start += len(chunk)
+
+
+def submit_simulation(batch_system, simulation_script, simulation, simulation_db_rec, sim_working_dir):
+    """
+    Submit a simulation to the batch system.
+
+    :return: The batch job's identifier, or None if the job could not be submitted.
+    """
+    sim_working_dir = write_simulation_definition(simulation, sim_working_dir)
+
+    # Schedule the simulation with the batch system.
+    cmd_args = [simulation_script]
+    return batch_system.submit_job(sys.executable, sim_working_dir, *cmd_args)
+
+
+def get_record_fields(simulation, simulation_group):
+    """
+    Get the fields for a simulation's new database record.  The model and its version are recorded so statistics can
+    be collected for each model.
+    """
+    return dict(id_on_client=simulation.id_on_client,
+                model=simulation.model or simulation_group.default_model or '',
+                model_version=simulation.model_version or simulation_group.default_version or '')
+
+
+def write_simulation_definition(simulation, sim_working_dir):
+    """
+    Write the simulation object as JSON to its working directory.
+
+    :return: The path to the working directory.
+    """
+    sim_working_dir = path.path(sim_working_dir)
+    sim_definition_path = sim_working_dir / SIMULATION_DEFINITION_FILENAME
+    simulation.write_json_file(sim_definition_path)
+    return sim_working_dir
+
+
+def record_batch_jobs(group_db_rec, simulation_db_recs, job_ids):
+    """
+    Record the batch jobs of a set of simulations in their database records with a single request.  A simulation whose
+    job could not be submitted (its job id is None) has its status set to SCRIPT_ERROR.
+
+    :return list: The simulations whose records could not be updated; see GroupRecord.update_simulations.
+    """
+    updates = []
+    for simulation_db_rec, job_id in zip(simulation_db_recs, job_ids):
+        if job_id is not None:
+            updates.append((simulation_db_rec, dict(batch_job_id=job_id)))
+        else:
+            # Job submission failed, set this simulation status to SCRIPT_ERROR
+            updates.append((simulation_db_rec, dict(status=SCRIPT_ERROR)))
+    return group_db_rec.update_simulations(updates)
+
+
 if __name__ == '__main__':
     exit_status = main(*sys.argv)
     sys.exit(exit_status)
\ No newline at end of file
@@ -7,20 +7,244 @@
 # License (MPL), version 2.0. If a copy of the MPL was not distributed
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import hashlib
+import logging
+from multiprocessing.pool import ThreadPool
+import os
+import sys
+import tempfile
+import threading
+import time
+from urlparse import urldefrag
+
 from path import path
 import requests
 
+from database_api import backoff_delay, RETRYABLE_STATUS_CODES
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class DownloadSettings:
+    """
+    Settings for downloading files.
+    """
+    TIMEOUT = (10, 60)      # Seconds to wait for the connection, and then for each piece of data from the server
+
+    # If a download fails with a connection error or a temporary server error, it's tried again (resuming where it
+    # stopped if the server supports ranges) after a jittered exponential backoff.
+    MAX_ATTEMPTS = 5        # Total attempts per file, including the first one
+
+    # The size of the chunks read from the server depends on the file's size, so a large file is read with few large
+    # chunks, and a small one doesn't need a large buffer.
+    MIN_CHUNK_SIZE = 64 * 1024
+    MAX_CHUNK_SIZE = 4 * 1024 * 1024
+    CHUNKS_PER_FILE = 100
+
+    WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+class DownloadCancelled(Exception):
+    """
+    A download was stopped because it was cancelled.
+    """
+    pass
+
+
+class ChecksumMismatch(IOError):
+    """
+    The contents of a downloaded file don't match the checksum given for it.
+    """
+    pass
+
+
+class DownloadResult(object):
+    """
+    Information about a download.
+    """
+
+    def __init__(self):
+        self.is_modified = True     # False if the server said the file hasn't changed since the given validators
+        self.size = 0               # Bytes
+        self.seconds = 0.0
+        self.sha256 = None          # Hash of the file's contents (hexadecimal)
+        self.validators = dict()    # The ETag and Last-Modified headers, if the server sent them (keys: "etag" and
+                                    # "last_modified")
+
+
+# The checksum algorithms that can be given in a URL (the ones that hashlib always provides)
+CHECKSUM_ALGORITHMS = ('md5', 'sha1', 'sha224', 'sha256', 'sha384', 'sha512')
 
-def download_file(url, local_path):
+
+def parse_checksum(url):
     """
-    Download a file from a URL.
+    Get the checksum for a file from its URL.  The checksum is given in the URL's fragment as "{algorithm}={digest}",
+    e.g., "http://example.com/climate.bin#sha256=9f86d081884c7d65...".  The algorithm is one of CHECKSUM_ALGORITHMS.
+
+    :return tuple: (URL without the fragment, algorithm, digest); the algorithm and digest are None if the URL has no
+                   checksum.
+    :raises ValueError: if the checksum's digest isn't valid for its algorithm.
     """
-    r = requests.get(url, stream=True)
-    with open(local_path, 'wb') as f:
-        for chunk in r.iter_content(chunk_size=1024):
-            if chunk: # filter out keep-alive new chunks
-                f.write(chunk)
-                f.flush()
+    url_without_fragment, fragment = urldefrag(url)
+    algorithm, _, digest = fragment.partition('=')
+    algorithm = algorithm.lower()
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        return url, None, None
+    digest = digest.lower()
+    if len(digest) != hashlib.new(algorithm).digest_size * 2 or digest.strip('0123456789abcdef'):
+        raise ValueError('Invalid %s checksum in URL: %s' % (algorithm, url))
+    return url_without_fragment, algorithm, digest
+
+
+def get_chunk_size(content_length):
+    if content_length is None:
+        return DownloadSettings.MIN_CHUNK_SIZE
+    chunk_size = content_length // DownloadSettings.CHUNKS_PER_FILE
+    return max(DownloadSettings.MIN_CHUNK_SIZE, min(chunk_size, DownloadSettings.MAX_CHUNK_SIZE))
+
+
+def download_file(url, local_path, cancel_event=None, validators=None):
+    """
+    Download a file from a URL.  The file is written to a temporary file in the same directory, which is renamed to
+    the local path when the download is complete, so there's never a partial file at the local path.  If the URL has
+    a checksum (see parse_checksum), the file's contents are verified before the file is renamed.
+
+    :param cancel_event: A threading.Event which, when set, stops the download.
+    :param dict validators: The validators of a copy of the file that's already at the local path (see
+                            DownloadResult).  If the server says the file hasn't changed, it's not downloaded again.
+    :return DownloadResult: Information about the download.
+    :raises requests.exceptions.RequestException: if the download fails.
+    :raises ChecksumMismatch: if the file's contents don't match the URL's checksum.
+    :raises DownloadCancelled: if the download is cancelled.
+    """
+    url, algorithm, expected_digest = parse_checksum(url)
+    local_path = path(local_path).abspath()
+    result = DownloadResult()
+    start_time = time.time()
+    digests = dict()  # Key = algorithm, value = hash object for the file's contents
+    fd, temp_path = tempfile.mkstemp(prefix='.%s.' % local_path.name, suffix='.part', dir=local_path.dirname())
+    try:
+        with os.fdopen(fd, 'wb', DownloadSettings.WRITE_BUFFER_SIZE) as f:
+            for attempt in range(1, DownloadSettings.MAX_ATTEMPTS + 1):
+                # Compressed responses can't be resumed by byte ranges, and most input files don't compress well
+                headers = {'Accept-Encoding': 'identity'}
+                if result.size > 0:
+                    headers['Range'] = 'bytes=%d-' % result.size
+                    if result.validators:
+                        headers['If-Range'] = result.validators.get('etag') or result.validators['last_modified']
+                elif validators:
+                    if validators.get('etag'):
+                        headers['If-None-Match'] = validators['etag']
+                    if validators.get('last_modified'):
+                        headers['If-Modified-Since'] = validators['last_modified']
+                try:
+                    r = requests.get(url, stream=True, headers=headers, timeout=DownloadSettings.TIMEOUT)
+                    if r.status_code == 304 and result.size == 0:
+                        result.is_modified = False
+                        result.validators = dict(validators or {})
+                        break
+                    if r.status_code in RETRYABLE_STATUS_CODES and attempt < DownloadSettings.MAX_ATTEMPTS:
+                        raise requests.exceptions.ConnectionError('response status %d' % r.status_code)
+                    r.raise_for_status()
+                    if r.status_code != 206 or not digests:
+                        # The whole file (the first attempt, or the server can't resume the download)
+                        f.seek(0)
+                        f.truncate()
+                        result.size = 0
+                        digests = dict(sha256=hashlib.sha256())
+                        if algorithm is not None:
+                            digests.setdefault(algorithm, hashlib.new(algorithm))
+                        result.validators = dict()
+                        if r.headers.get('ETag'):
+                            result.validators['etag'] = r.headers['ETag']
+                        if r.headers.get('Last-Modified'):
+                            result.validators['last_modified'] = r.headers['Last-Modified']
+                    content_length = r.headers.get('Content-Length')
+                    expected_size = result.size + int(content_length) if content_length is not None else None
+                    for chunk in r.iter_content(chunk_size=get_chunk_size(expected_size)):
+                        if cancel_event is not None and cancel_event.is_set():
+                            raise DownloadCancelled(url)
+                        f.write(chunk)
+                        for digest in digests.values():
+                            digest.update(chunk)
+                        result.size += len(chunk)
+                    if expected_size is not None and result.size < expected_size:
+                        raise requests.exceptions.ConnectionError('connection closed after %d of %d bytes' %
+                                                                  (result.size, expected_size))
+                    break
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                        requests.exceptions.ChunkedEncodingError) as exc:
+                    if attempt == DownloadSettings.MAX_ATTEMPTS:
+                        raise
+                    delay = backoff_delay(attempt)
+                    logger.warning('Download of %s interrupted after %d bytes (%s); retrying in %.1f seconds', url,
+                                   result.size, exc, delay)
+                    time.sleep(delay)
+        if not result.is_modified:
+            os.remove(temp_path)
+            logger.info('%s not modified', url)
+            return result
+
+        result.sha256 = digests['sha256'].hexdigest()
+        if algorithm is not None and digests[algorithm].hexdigest() != expected_digest:
+            raise ChecksumMismatch('%s checksum of %s is %s instead of %s' % (algorithm, url,
+                                                                              digests[algorithm].hexdigest(),
+                                                                              expected_digest))
+        if os.name == 'nt' and local_path.exists():
+            local_path.remove()  # rename doesn't replace an existing file on Windows
+        os.rename(temp_path, local_path)
+    except:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    result.seconds = time.time() - start_time
+    megabytes = result.size / (1024.0 * 1024)
+    logger.info('Downloaded %s (%.1f MB in %.2f seconds, %.1f MB/s)', url, megabytes, result.seconds,
+                megabytes / max(result.seconds, 0.001))
+    return result
+
+
+def download_files(files, max_workers, callback=None, download=download_file):
+    """
+    Download files concurrently.  If a download fails, the other downloads are cancelled.
+
+    :param dict files: Key = local path to store the file as, value = URL of the file
+    :param int max_workers: Maximum number of files downloaded at the same time.
+    :param callback: A callable object that's called with the local path and URL of each file before it's downloaded.
+    :param download: The function that downloads each file (same arguments as download_file).
+    :raises: The exception raised by the first download that failed.
+    """
+    if not files:
+        return
+    cancel_event = threading.Event()
+    errors = []  # Exception info for the failed downloads, in the order they failed
+    errors_lock = threading.Lock()
+
+    def download_item(item):
+        local_path, url = item
+        if cancel_event.is_set():
+            return
+        try:
+            if callback:
+                callback(local_path, url)
+            download(url, local_path, cancel_event)
+        except DownloadCancelled:
+            pass
+        except Exception:
+            with errors_lock:
+                errors.append(sys.exc_info())
+            cancel_event.set()
+
+    pool = ThreadPool(min(max_workers, len(files)))
+    try:
+        pool.map(download_item, files.items(), chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    if errors:
+        exc_type, exc_value, exc_traceback = errors[0]
+        raise exc_type, exc_value, exc_traceback
 
 
 def get_file_contents(filenames, callback, dir_path=None):
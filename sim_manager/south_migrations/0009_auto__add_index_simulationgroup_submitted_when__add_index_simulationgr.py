@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding index on 'SimulationGroup', fields ['submitted_when']
+        db.create_index(u'sim_manager_simulationgroup', ['submitted_when'])
+
+        # Adding index on 'SimulationGroup', fields ['script_status']
+        db.create_index(u'sim_manager_simulationgroup', ['script_status'])
+
+        # Adding index on 'SimulationGroup', fields ['submitter', 'submitted_when']
+        db.create_index(u'sim_manager_simulationgroup', ['submitter_id', 'submitted_when'])
+
+        # Adding index on 'Simulation', fields ['batch_job_id']
+        db.create_index(u'sim_manager_simulation', ['batch_job_id'])
+
+        # Adding index on 'Simulation', fields ['created_when']
+        db.create_index(u'sim_manager_simulation', ['created_when'])
+
+        # Adding index on 'Simulation', fields ['group', 'id_on_client']
+        db.create_index(u'sim_manager_simulation', ['group_id', 'id_on_client'])
+
+        # Adding index on 'Simulation', fields ['group', 'status']
+        db.create_index(u'sim_manager_simulation', ['group_id', 'status'])
+
+
+    def backwards(self, orm):
+        # Removing index on 'Simulation', fields ['group', 'status']
+        db.delete_index(u'sim_manager_simulation', ['group_id', 'status'])
+
+        # Removing index on 'Simulation', fields ['group', 'id_on_client']
+        db.delete_index(u'sim_manager_simulation', ['group_id', 'id_on_client'])
+
+        # Removing index on 'Simulation', fields ['created_when']
+        db.delete_index(u'sim_manager_simulation', ['created_when'])
+
+        # Removing index on 'Simulation', fields ['batch_job_id']
+        db.delete_index(u'sim_manager_simulation', ['batch_job_id'])
+
+        # Removing index on 'SimulationGroup', fields ['submitter', 'submitted_when']
+        db.delete_index(u'sim_manager_simulationgroup', ['submitter_id', 'submitted_when'])
+
+        # Removing index on 'SimulationGroup', fields ['script_status']
+        db.delete_index(u'sim_manager_simulationgroup', ['script_status'])
+
+        # Removing index on 'SimulationGroup', fields ['submitted_when']
+        db.delete_index(u'sim_manager_simulationgroup', ['submitted_when'])
+
+
+    models = {
+        u'auth.group': {
+            'Meta': {'object_name': 'Group'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '80'}),
+            'permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'})
+        },
+        u'auth.permission': {
+            'Meta': {'ordering': "(u'content_type__app_label', u'content_type__model', u'codename')", 'unique_together': "((u'content_type', u'codename'),)", 'object_name': 'Permission'},
+            'codename': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['contenttypes.ContentType']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        },
+        u'auth.user': {
+            'Meta': {'object_name': 'User'},
+            'date_joined': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'blank': 'True'}),
+            'first_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'groups': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'related_name': "u'user_set'", 'blank': 'True', 'to': u"orm['auth.Group']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'is_staff': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'is_superuser': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_login': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'last_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'password': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'user_permissions': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'related_name': "u'user_set'", 'blank': 'True', 'to': u"orm['auth.Permission']"}),
+            'username': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '30'})
+        },
+        u'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        u'sim_manager.simulation': {
+            'Meta': {'object_name': 'Simulation', 'index_together': "[['group', 'status'], ['group', 'id_on_client']]"},
+            'batch_job_id': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '50', 'db_index': 'True'}),
+            'created_when': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'error_details': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '500'}),
+            'group': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['sim_manager.SimulationGroup']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'id_on_client': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '100'}),
+            'status': ('django.db.models.fields.CharField', [], {'default': "'ready'", 'max_length': '7'})
+        },
+        u'sim_manager.simulationgroup': {
+            'Meta': {'object_name': 'SimulationGroup', 'index_together': "[['submitter', 'submitted_when']]"},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'process_id': ('django.db.models.fields.IntegerField', [], {'null': 'True'}),
+            'script_error': ('django.db.models.fields.CharField', [], {'max_length': '255', 'blank': 'True'}),
+            'script_status': ('django.db.models.fields.CharField', [], {'default': "'ready'", 'max_length': '6', 'db_index': 'True'}),
+            'submitted_when': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'submitter': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['auth.User']"})
+        }
+    }
+
+    complete_apps = ['sim_manager']
\ No newline at end of file
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'SimulationStatusEvent'
+        db.create_table(u'sim_manager_simulationstatusevent', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('simulation', self.gf('django.db.models.fields.related.ForeignKey')(related_name='status_events', to=orm['sim_manager.Simulation'])),
+            ('status', self.gf('django.db.models.fields.CharField')(max_length=7)),
+            ('occurred_when', self.gf('django.db.models.fields.DateTimeField')(default=datetime.datetime.now)),
+        ))
+        db.send_create_signal(u'sim_manager', ['SimulationStatusEvent'])
+
+        # Adding index on 'SimulationStatusEvent', fields ['simulation', 'occurred_when']
+        db.create_index(u'sim_manager_simulationstatusevent', ['simulation_id', 'occurred_when'])
+
+        # Adding field 'Simulation.model'
+        db.add_column(u'sim_manager_simulation', 'model',
+                      self.gf('django.db.models.fields.CharField')(default='', max_length=50, blank=True),
+                      keep_default=False)
+
+        # Adding field 'Simulation.model_version'
+        db.add_column(u'sim_manager_simulation', 'model_version',
+                      self.gf('django.db.models.fields.CharField')(default='', max_length=50, blank=True),
+                      keep_default=False)
+
+
+    def backwards(self, orm):
+        # Removing index on 'SimulationStatusEvent', fields ['simulation', 'occurred_when']
+        db.delete_index(u'sim_manager_simulationstatusevent', ['simulation_id', 'occurred_when'])
+
+        # Deleting model 'SimulationStatusEvent'
+        db.delete_table(u'sim_manager_simulationstatusevent')
+
+        # Deleting field 'Simulation.model'
+        db.delete_column(u'sim_manager_simulation', 'model')
+
+        # Deleting field 'Simulation.model_version'
+        db.delete_column(u'sim_manager_simulation', 'model_version')
+
+
+    models = {
+        u'auth.group': {
+            'Meta': {'object_name': 'Group'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '80'}),
+            'permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'})
+        },
+        u'auth.permission': {
+            'Meta': {'ordering': "(u'content_type__app_label', u'content_type__model', u'codename')", 'unique_together': "((u'content_type', u'codename'),)", 'object_name': 'Permission'},
+            'codename': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['contenttypes.ContentType']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        },
+        u'auth.user': {
+            'Meta': {'object_name': 'User'},
+            'date_joined': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'blank': 'True'}),
+            'first_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'groups': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'related_name': "u'user_set'", 'blank': 'True', 'to': u"orm['auth.Group']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'is_staff': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'is_superuser': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_login': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'last_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'password': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'user_permissions': ('django.db.models.fields.related.ManyToManyField', [], {'symmetrical': 'False', 'related_name': "u'user_set'", 'blank': 'True', 'to': u"orm['auth.Permission']"}),
+            'username': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '30'})
+        },
+        u'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        u'sim_manager.simulation': {
+            'Meta': {'object_name': 'Simulation', 'index_together': "[['group', 'status'], ['group', 'id_on_client'], ['group', 'created_when']]"},
+            'batch_job_id': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '50', 'db_index': 'True'}),
+            'created_when': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'error_details': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '500'}),
+            'group': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['sim_manager.SimulationGroup']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'id_on_client': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '100'}),
+            'model': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '50', 'blank': 'True'}),
+            'model_version': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '50', 'blank': 'True'}),
+            'status': ('django.db.models.fields.CharField', [], {'default': "'ready'", 'max_length': '7'})
+        },
+        u'sim_manager.simulationgroup': {
+            'Meta': {'object_name': 'SimulationGroup', 'index_together': "[['submitter', 'submitted_when']]"},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'process_id': ('django.db.models.fields.IntegerField', [], {'null': 'True'}),
+            'script_error': ('django.db.models.fields.CharField', [], {'max_length': '255', 'blank': 'True'}),
+            'script_status': ('django.db.models.fields.CharField', [], {'default': "'ready'", 'max_length': '6', 'db_index': 'True'}),
+            'submitted_when': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'db_index': 'True', 'blank': 'True'}),
+            'submitter': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['auth.User']"})
+        },
+        u'sim_manager.simulationstatusevent': {
+            'Meta': {'object_name': 'SimulationStatusEvent', 'index_together': "[['simulation', 'occurred_when']]"},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'occurred_when': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'simulation': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'status_events'", 'to': u"orm['sim_manager.Simulation']"}),
+            'status': ('django.db.models.fields.CharField', [], {'max_length': '7'})
+        }
+    }
+
+    complete_apps = ['sim_manager']
\ No newline at end of file
@@ -0,0 +1,32 @@
+# This file is part of the Simulation Manager project for VecNet.
+# For copyright and licensing information about this project, see the
+# NOTICE.txt and LICENSE.md files in its top-level directory; they are
+# available at https://github.com/vecnet/simulation-manager
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Configuration of SQLite database connections for many concurrent writers.
+
+In WAL (write-ahead logging) mode, readers don't block the writer and the writer doesn't block readers, and a commit
+only appends to the log.  With synchronous=NORMAL, a commit doesn't wait for the disk (the database can't be
+corrupted by a crash, though the last transactions may be lost if the OS crashes).  The busy timeout (the "timeout"
+option for the database in the settings) makes a writer wait for the lock instead of failing with "database is
+locked".
+"""
+
+from django.conf import settings
+
+
+def configure_connection(sender, connection, **kwargs):
+    """
+    Handler for the connection_created signal: set the journal mode for a new SQLite connection.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    cursor = connection.cursor()
+    cursor.execute('PRAGMA journal_mode=%s' % settings.SQLITE_JOURNAL_MODE)
+    if settings.SQLITE_JOURNAL_MODE.upper() == 'WAL':
+        cursor.execute('PRAGMA synchronous=NORMAL')
@@ -0,0 +1,90 @@
+# This file is part of the Simulation Manager project for VecNet.
+# For copyright and licensing information about this project, see the
+# NOTICE.txt and LICENSE.md files in its top-level directory; they are
+# available at https://github.com/vecnet/simulation-manager
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Waiting for the status of a simulation or group to change (for the API's long-poll "watch" endpoints).
+
+A request that's waiting for a change registers an event for the object it's watching, and sleeps until the event is
+set.  The event is set when the object is saved in this web process (see the post_save handlers in models.py), so the
+status is only read from the database when it may have changed.  Changes made by other processes (or that were not
+yet committed when the event was set) are caught by re-reading the status every few seconds.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+
+
+class StatusWatcher(object):
+    """
+    Keeps track of the requests that are waiting for objects to change.
+    """
+
+    def __init__(self, recheck_interval):
+        """
+        :param float recheck_interval: Maximum number of seconds between reads of a watched object's status.
+        """
+        self.recheck_interval = recheck_interval
+        self._lock = threading.Lock()
+        self._events = dict()  # key = (model name, primary key), value = set of Events for the requests waiting
+
+    @staticmethod
+    def make_key(model_class, pk):
+        return model_class.__name__, pk
+
+    def notify(self, key):
+        """
+        Wake up the requests waiting for an object, because it was changed.
+        """
+        with self._lock:
+            events = list(self._events.get(key, ()))
+        for event in events:
+            event.set()
+
+    def wait_for_change(self, key, get_status, status, timeout):
+        """
+        Wait until an object's status differs from a given value, or until a timeout expires.
+
+        :param key: The object's key (see make_key).
+        :param get_status: Function that reads the object's current status.
+        :param status: The status that the caller already knows about.
+        :param float timeout: Maximum number of seconds to wait.
+        :return: The object's current status (equal to the given status if the timeout expired).
+        """
+        deadline = time.time() + timeout
+        event = threading.Event()
+        with self._lock:
+            self._events.setdefault(key, set()).add(event)
+        try:
+            while True:
+                # Cleared before reading the status, so a change made while reading isn't missed.
+                event.clear()
+                current_status = get_status()
+                remaining = deadline - time.time()
+                if current_status != status or remaining <= 0:
+                    return current_status
+                event.wait(min(remaining, self.recheck_interval))
+        finally:
+            with self._lock:
+                events = self._events[key]
+                events.discard(event)
+                if not events:
+                    del self._events[key]
+
+    def waiting_count(self, key):
+        """
+        Get the number of requests waiting for an object to change.
+        """
+        with self._lock:
+            return len(self._events.get(key, ()))
+
+
+# The watcher for this web process
+watcher = StatusWatcher(settings.STATUS_WATCH_RECHECK_INTERVAL)
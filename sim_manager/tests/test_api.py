@@ -7,7 +7,12 @@
 # License (MPL), version 2.0. If a copy of the MPL was not distributed
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import time
+
+from tastypie.models import ApiKey
+
 from sim_manager import api
+from sim_manager.auth import CredentialCache, credential_cache
 from sim_manager.tests.utils import ApiTestCase, TestsWithApiKeyAuth
 
 
@@ -77,3 +82,47 @@ class AuthenticationTests(TestsWithApiKeyAuth):
             'resource_uri': detail_uri,
             'square': number * number,
         })
+
+    def test_credentials_cached(self):
+        credential_cache.clear()
+        detail_uri = self.make_resource_uri('squares', 3)
+        self.assertValidJSONResponse(self.api_client.get(detail_uri, authentication=self.get_credentials()))
+        with self.assertNumQueries(0):
+            self.assertValidJSONResponse(self.api_client.get(detail_uri, authentication=self.get_credentials()))
+        self.assertEqual(credential_cache.get_stats(), dict(hits=1, misses=1, entries=1, ttl=credential_cache.ttl))
+
+        # Wrong keys aren't cached
+        bad_credentials = self.create_apikey(self.test_user.username, 'not-the-key')
+        for _ in range(2):
+            self.assertHttpUnauthorized(self.api_client.get(detail_uri, authentication=bad_credentials))
+        self.assertEqual(credential_cache.get_stats()['misses'], 3)
+
+        resp = self.api_client.get(self.make_resource_uri('auth-cache'), authentication=self.get_credentials())
+        self.assertValidJSONResponse(resp)
+        self.assertEqual(self.deserialize(resp)['hits'], 2)
+
+    def test_rotated_key_invalidated(self):
+        credential_cache.clear()
+        detail_uri = self.make_resource_uri('squares', 3)
+        old_credentials = self.get_credentials()
+        self.assertValidJSONResponse(self.api_client.get(detail_uri, authentication=old_credentials))
+        api_key = ApiKey.objects.get(user=self.test_user)
+        try:
+            api_key.key = api_key.generate_key()
+            api_key.save()
+            self.assertEqual(credential_cache.get_stats()['entries'], 0)
+            self.assertHttpUnauthorized(self.api_client.get(detail_uri, authentication=old_credentials))
+            new_credentials = self.create_apikey(self.test_user.username, api_key.key)
+            self.assertValidJSONResponse(self.api_client.get(detail_uri, authentication=new_credentials))
+        finally:
+            api_key.key = self.test_user_api_key
+            api_key.save()
+
+    def test_cache_expires(self):
+        cache = CredentialCache(ttl=0.05)
+        cache.add('user', 'key', self.test_user)
+        self.assertEqual(cache.get('user', 'key'), self.test_user)
+        self.assertIsNone(cache.get('user', 'other-key'))
+        time.sleep(0.06)
+        self.assertIsNone(cache.get('user', 'key'))
+        self.assertEqual(cache.get_stats(), dict(hits=1, misses=2, entries=1, ttl=0.05))
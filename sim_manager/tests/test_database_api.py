@@ -11,9 +11,12 @@
 Tests for the scripts/database_api module.
 """
 
+import unittest
 from urlparse import urlparse
 
 from django.test import LiveServerTestCase
+from mock import MagicMock, patch
+import requests
 from vecnet.simulation import sim_status, submission_status
 
 from sim_manager import working_dirs
@@ -78,6 +81,70 @@ class GroupRecordTests(LiveServerTestCase, UsesDatabaseApi):
         self.assertEqual(simulation.id_on_client, id_on_client)
 
 
+    def test_add_new_simulations(self):
+        group = SimulationGroup.objects.create(submitter=self.test_user)
+
+        group_url = self.live_server_url + ('/api/v1/sim-groups/%s/' % group.id)
+        simulations_endpoint = '/api/v1/simulations/'
+        simulations_url = self.live_server_url + simulations_endpoint
+        group_db_rec = database_api.get_group_record(group_url, simulations_url)
+
+        ids_on_client = ['first', 'second', 'third']
+        new_simulations = group_db_rec.add_new_simulations([dict(id_on_client=x) for x in ids_on_client])
+        self.assertEqual(len(new_simulations), len(ids_on_client))
+        self.assertEqual(group.simulation_set.count(), len(ids_on_client))
+
+        for id_on_client, (simulation_db_rec, working_dir) in zip(ids_on_client, new_simulations):
+            parsed_url = urlparse(simulation_db_rec.url)
+            self.assertEqual(parsed_url.netloc, urlparse(self.live_server_url).netloc)
+            path_after_endpoint = parsed_url.path.replace(simulations_endpoint, '')
+            self.assertRegexpMatches(path_after_endpoint, r'^\d+/$')
+            simulation = group.simulation_set.get(id=int(path_after_endpoint.replace('/', '')))
+            self.assertEqual(simulation.working_dir, working_dir)
+            self.assertEqual(simulation.id_on_client, id_on_client)
+
+    def test_get_simulations(self):
+        group = SimulationGroup.objects.create(submitter=self.test_user)
+        simulations = [Simulation.objects.create(group=group, id_on_client=x) for x in ('a', 'b')]
+
+        group_url = self.live_server_url + ('/api/v1/sim-groups/%s/' % group.id)
+        simulations_url = self.live_server_url + '/api/v1/simulations/'
+        group_db_rec = database_api.get_group_record(group_url, simulations_url)
+
+        manifest = group_db_rec.get_simulations()
+        self.assertEqual(len(manifest), len(simulations))
+        for simulation, (simulation_db_rec, working_dir, simulation_data) in zip(simulations, manifest):
+            self.assertEqual(simulation_db_rec.url, simulations_url + '%s/' % simulation.id)
+            self.assertEqual(working_dir, simulation.working_dir)
+            self.assertEqual(simulation_data['id_on_client'], simulation.id_on_client)
+            self.assertEqual(simulation_data['status'], sim_status.READY_TO_RUN)
+
+    def test_update_simulations(self):
+        group = SimulationGroup.objects.create(submitter=self.test_user)
+        simulations = [Simulation.objects.create(group=group) for _ in range(3)]
+
+        group_url = self.live_server_url + ('/api/v1/sim-groups/%s/' % group.id)
+        simulations_url = self.live_server_url + '/api/v1/simulations/'
+        group_db_rec = database_api.get_group_record(group_url, simulations_url)
+        simulation_db_recs = [database_api.get_simulation_record(simulations_url + '%s/' % x.id) for x in simulations]
+        unknown_db_rec = database_api.get_simulation_record(simulations_url + '999999/')
+
+        updates = [
+            (simulation_db_recs[0], dict(batch_job_id='1234')),
+            (simulation_db_recs[1], dict(status=sim_status.SCRIPT_ERROR, error_details='qsub failed')),
+            (simulation_db_recs[2], dict(id_on_client='not allowed')),
+            (unknown_db_rec, dict(batch_job_id='5678')),
+        ]
+        failed_updates = group_db_rec.update_simulations(updates)
+        self.assertEqual([x[0] for x in failed_updates], [simulation_db_recs[2], unknown_db_rec])
+
+        simulations = [Simulation.objects.get(id=x.id) for x in simulations]  # Reload the model instances
+        self.assertEqual(simulations[0].batch_job_id, '1234')
+        self.assertEqual(simulations[1].status, sim_status.SCRIPT_ERROR)
+        self.assertEqual(simulations[1].error_details, 'qsub failed')
+        self.assertEqual(simulations[2].id_on_client, '')
+
+
 class SimulationRecordTests(LiveServerTestCase, UsesDatabaseApi):
     """
     Tests for the SimulationRecord class.
@@ -121,6 +188,22 @@ class SimulationRecordTests(LiveServerTestCase, UsesDatabaseApi):
             simulation = Simulation.objects.get(id=simulation.id)  # Refetch the model instance from DB
             self.assertEqual(simulation.status, new_status)
 
+    def test_connection_stats(self):
+        simulation = Simulation.objects.create(group=self.group)
+        simulation_url = self.live_server_url + ('/api/v1/simulations/%s/' % simulation.id)
+        simulation_db_rec = database_api.get_simulation_record(simulation_url)
+
+        database_api.TestingApi.close_session()
+        self.assertEqual(database_api.get_connection_stats(), dict(requests=0, opened=0, reused=0))
+        for new_status in (sim_status.STARTED_SCRIPT, sim_status.STAGING_INPUT, sim_status.RUNNING_MODEL):
+            simulation_db_rec.update_status(new_status)
+
+        # The live test server closes each connection after its response, so connections may or may not be reused.
+        stats = database_api.get_connection_stats()
+        self.assertEqual(stats['requests'], 3)
+        self.assertGreaterEqual(stats['opened'], 1)
+        self.assertEqual(stats['opened'] + stats['reused'], stats['requests'])
+
     def test_error_occurred(self):
         simulation = Simulation.objects.create(group=self.group)
         self.assertEqual(simulation.status, sim_status.READY_TO_RUN)
@@ -133,4 +216,114 @@ class SimulationRecordTests(LiveServerTestCase, UsesDatabaseApi):
 
         simulation = Simulation.objects.get(id=simulation.id)  # Refetch the model instance from DB
         self.assertEqual(simulation.status, error_status)
-        self.assertEqual(simulation.error_details, error_details)
\ No newline at end of file
+        self.assertEqual(simulation.error_details, error_details)
+
+
+def make_response(status_code):
+    resp = MagicMock()
+    resp.status_code = status_code
+    return resp
+
+
+@patch.object(database_api.time, 'sleep')
+class SendRequestTests(unittest.TestCase):
+    """
+    Tests of the retry policy and circuit breaker for requests to the REST API.
+    """
+
+    def setUp(self):
+        database_api.TestingApi.reset_circuit_breaker()
+        self.session = MagicMock()
+        self.session_patcher = patch.object(database_api, 'get_session', return_value=self.session)
+        self.session_patcher.start()
+
+    def tearDown(self):
+        self.session_patcher.stop()
+        database_api.TestingApi.reset_circuit_breaker()
+
+    def test_idempotent_request_is_retried(self, mock_sleep):
+        self.session.request.side_effect = [requests.ConnectionError(), make_response(503), make_response(202)]
+        resp = database_api.send_request('PATCH', 'http://server/api/', idempotent=True, data='{}')
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(self.session.request.call_count, 3)
+        self.assertEqual(mock_sleep.call_count, 2)
+
+    def test_backoff_is_jittered_and_bounded(self, mock_sleep):
+        self.session.request.side_effect = requests.ConnectionError()
+        with patch.object(database_api.HttpSettings, 'BREAKER_THRESHOLD', 100):
+            self.assertRaises(requests.ConnectionError, database_api.send_request, 'GET', 'http://server/api/',
+                              idempotent=True)
+        self.assertEqual(self.session.request.call_count, database_api.HttpSettings.MAX_ATTEMPTS)
+        for attempt, ((delay,), _) in enumerate(mock_sleep.call_args_list, start=1):
+            max_delay = min(database_api.HttpSettings.BACKOFF_MAX,
+                            database_api.HttpSettings.BACKOFF_BASE * 2 ** (attempt - 1))
+            self.assertTrue(0 <= delay <= max_delay)
+
+    def test_non_idempotent_request_is_not_retried(self, mock_sleep):
+        self.session.request.side_effect = [make_response(503), make_response(201)]
+        resp = database_api.send_request('POST', 'http://server/api/', idempotent=False, data='{}')
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(self.session.request.call_count, 1)
+        self.assertFalse(mock_sleep.called)
+
+    def test_client_error_is_not_retried(self, mock_sleep):
+        self.session.request.return_value = make_response(400)
+        resp = database_api.send_request('PATCH', 'http://server/api/', idempotent=True, data='{}')
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(self.session.request.call_count, 1)
+
+    def test_circuit_breaker(self, mock_sleep):
+        threshold = database_api.HttpSettings.BREAKER_THRESHOLD
+        self.session.request.side_effect = requests.ConnectionError()
+        for _ in range(threshold):
+            self.assertRaises(requests.ConnectionError, database_api.send_request, 'POST', 'http://server/api/',
+                              idempotent=False)
+        self.assertEqual(self.session.request.call_count, threshold)
+
+        # The breaker is open, so requests are not sent to the server
+        self.assertRaises(database_api.ServerUnavailable, database_api.send_request, 'POST', 'http://server/api/',
+                          idempotent=False)
+        self.assertEqual(self.session.request.call_count, threshold)
+
+        # After the reset timeout, a trial request is sent; since it succeeds, the breaker closes
+        self.session.request.side_effect = None
+        self.session.request.return_value = make_response(201)
+        reset_time = database_api.time.time() + database_api.HttpSettings.BREAKER_RESET_TIMEOUT + 1
+        with patch.object(database_api.time, 'time', return_value=reset_time):
+            resp = database_api.send_request('POST', 'http://server/api/', idempotent=False)
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(database_api._circuit_breaker.state, database_api.CircuitBreaker.CLOSED)
+
+    def test_breaker_reopens_after_other_trial_error(self, mock_sleep):
+        """
+        Test that the breaker opens again if its trial request fails with an error other than a connection error or
+        timeout.
+        """
+        self.session.request.side_effect = requests.ConnectionError()
+        for _ in range(database_api.HttpSettings.BREAKER_THRESHOLD):
+            self.assertRaises(requests.ConnectionError, database_api.send_request, 'POST', 'http://server/api/',
+                              idempotent=False)
+
+        self.session.request.side_effect = requests.exceptions.ChunkedEncodingError()
+        reset_time = database_api.time.time() + database_api.HttpSettings.BREAKER_RESET_TIMEOUT + 1
+        with patch.object(database_api.time, 'time', return_value=reset_time):
+            self.assertRaises(requests.exceptions.ChunkedEncodingError, database_api.send_request, 'GET',
+                              'http://server/api/', idempotent=True)
+        self.assertEqual(database_api._circuit_breaker.state, database_api.CircuitBreaker.OPEN)
+
+        # After another reset timeout, a new trial request is let through
+        self.session.request.side_effect = None
+        self.session.request.return_value = make_response(200)
+        reset_time += database_api.HttpSettings.BREAKER_RESET_TIMEOUT + 1
+        with patch.object(database_api.time, 'time', return_value=reset_time):
+            resp = database_api.send_request('GET', 'http://server/api/', idempotent=True)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(database_api._circuit_breaker.state, database_api.CircuitBreaker.CLOSED)
+
+    def test_idempotent_request_waits_for_open_breaker(self, mock_sleep):
+        self.session.request.side_effect = [requests.ConnectionError()] * 3 + [make_response(202)]
+        with patch.object(database_api.HttpSettings, 'BREAKER_THRESHOLD', 2):
+            with patch.object(database_api.HttpSettings, 'BREAKER_RESET_TIMEOUT', 0):
+                resp = database_api.send_request('PATCH', 'http://server/api/', idempotent=True, data='{}')
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(self.session.request.call_count, 4)
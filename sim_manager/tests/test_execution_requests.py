@@ -0,0 +1,173 @@
+# This file is part of the Simulation Manager project for VecNet.
+# For copyright and licensing information about this project, see the
+# NOTICE.txt and LICENSE.md files in its top-level directory; they are
+# available at https://github.com/vecnet/simulation-manager
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Tests for the streaming reading and writing of execution request files.
+"""
+
+from StringIO import StringIO
+import gzip
+import json
+import zlib
+import unittest
+
+from crc_nd.utils.test_io import WritesOutputFiles
+from vecnet.simulation import DictConvertible, ExecutionRequest, sim_model, Simulation, SimulationGroup
+
+from .constants import TEST_OUTPUT_ROOT
+from sim_manager.scripts import execution_requests
+from sim_manager.scripts.streaming_json import GzipReader, JsonStreamParser
+
+
+class JsonStreamParserTests(unittest.TestCase):
+    """
+    Tests of the JsonStreamParser class.
+    """
+
+    DOCUMENT = {
+        'a': 12345,
+        'b': {'c': [1, 2.5, 'three'], 'items': [{'x': 1234567890}, [True, False, None], 'long string ' * 20, 9876],
+              'd': 'after'},
+        'e': None,
+    }
+
+    def parse(self, document, read_size):
+        header = dict()
+        parser = JsonStreamParser(StringIO(document), read_size=read_size)
+        items = list(parser.iter_array(['b', 'items'], header))
+        return header, items
+
+    def test_small_blocks(self):
+        # Values are split across blocks of many different sizes
+        document = json.dumps(self.DOCUMENT, indent=2)
+        expected_header = dict(self.DOCUMENT, b=dict(self.DOCUMENT['b'], items=[]))
+        for read_size in range(1, 40):
+            header, items = self.parse(document, read_size)
+            self.assertEqual(items, self.DOCUMENT['b']['items'])
+            self.assertEqual(header, expected_header)
+
+    def test_empty_array(self):
+        header, items = self.parse('{"b": {"items": []}}', 3)
+        self.assertEqual(items, [])
+        self.assertEqual(header, {'b': {'items': []}})
+
+    def test_missing_array(self):
+        header, items = self.parse('{"a": 1, "b": null}', 3)
+        self.assertEqual(items, [])
+        self.assertEqual(header, {'a': 1, 'b': None})
+
+    def test_invalid_json(self):
+        for document in ('{"b": {"items": [1, 2}}', '{"b": {"items": [1, 2]}', '["b"]', '{"b": {"items": [1]}} x'):
+            self.assertRaises(ValueError, self.parse, document, 4)
+
+
+class GzipReaderTests(unittest.TestCase):
+    """
+    Tests of the GzipReader class.
+    """
+
+    @staticmethod
+    def compress(data):
+        compressed = StringIO()
+        with gzip.GzipFile(fileobj=compressed, mode='wb') as f:
+            f.write(data)
+        return compressed.getvalue()
+
+    def test_read(self):
+        data = ''.join('line %d\n' % i for i in range(10000))
+        reader = GzipReader(StringIO(self.compress(data)), read_size=100)
+        blocks = []
+        while True:
+            block = reader.read(1000)
+            if not block:
+                break
+            self.assertLessEqual(len(block), 1000)
+            blocks.append(block)
+        self.assertEqual(''.join(blocks), data)
+
+    def test_parse_compressed_json(self):
+        document = json.dumps({'items': range(1000)})
+        parser = JsonStreamParser(GzipReader(StringIO(self.compress(document))), read_size=64)
+        self.assertEqual(list(parser.iter_array(['items'], dict())), range(1000))
+
+    def test_invalid_data(self):
+        reader = GzipReader(StringIO('not gzip data'))
+        self.assertRaises(zlib.error, reader.read)
+
+
+class ExecutionRequestFileTests(WritesOutputFiles):
+    """
+    Tests of the read and write functions in the execution_requests module.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.set_output_root(TEST_OUTPUT_ROOT)
+
+    def setUp(self):
+        self.initialize_output_dir()
+        self.file_path = self.get_output_dir() / 'execution_request.json'
+        simulations = []
+        for i in range(5):
+            simulation = Simulation(model=sim_model.OPEN_MALARIA, model_version='32', id_on_client=str(i),
+                                    cmd_line_args=['--seed', str(i)])
+            simulation.input_files['scenario.xml'] = 'http://example.com/scenarios/%d.xml' % i
+            simulations.append(simulation)
+        self.execution_request = ExecutionRequest(simulation_group=SimulationGroup(simulations=simulations,
+                                                                                   default_model=sim_model.EMOD),
+                                                  input_files={'common.xml': 'http://example.com/common.xml'})
+
+    def assertExecutionRequest(self, execution_request, simulations):
+        self.assertEqual(execution_request.input_files, self.execution_request.input_files)
+        self.assertEqual(execution_request.simulation_group.default_model, sim_model.EMOD)
+        self.assertIsNone(execution_request.simulation_group.default_version)
+        self.assertEqual([x.to_dict() for x in simulations],
+                         [x.to_dict() for x in self.execution_request.simulation_group.simulations])
+
+    def test_write_and_read(self):
+        execution_requests.write(self.file_path, self.execution_request)
+
+        # The simulations are written last
+        contents = self.file_path.text()
+        self.assertGreater(contents.index('"simulations"'), contents.index('"input_files"'))
+        self.assertGreater(contents.index('"simulations"'), contents.index('"default_model"'))
+
+        execution_request, simulations = execution_requests.read(self.file_path)
+        self.assertEqual(execution_request.simulation_group.simulations, [])
+        self.assertExecutionRequest(execution_request, list(simulations))
+
+    def test_read_with_simulations_first(self):
+        with open(self.file_path, 'w') as f:
+            f.write('{"simulation_group": {"simulations": %s, "default_model": "%s", "default_version": null}, '
+                    '"input_files": %s}' % (json.dumps(self.execution_request.to_dict()['simulation_group']
+                                                                                       ['simulations']),
+                                            sim_model.EMOD, json.dumps(self.execution_request.input_files)))
+        execution_request, simulations = execution_requests.read(self.file_path)
+        self.assertExecutionRequest(execution_request, list(simulations))
+
+    def test_read_file_written_by_vecnet_package(self):
+        self.execution_request.write_json_file(self.file_path)
+        execution_request, simulations = execution_requests.read(self.file_path)
+        self.assertExecutionRequest(execution_request, list(simulations))
+
+    def test_simulations_are_read_incrementally(self):
+        execution_requests.write(self.file_path, self.execution_request)
+        contents = self.file_path.text()
+        # Truncate the file in the middle of the 3rd simulation
+        third_simulation = contents.index('"id_on_client": "2"')
+        self.file_path.write_text(contents[:third_simulation])
+
+        execution_request, simulations = execution_requests.read(self.file_path)
+        self.assertEqual(next(simulations).id_on_client, '0')
+        self.assertEqual(next(simulations).id_on_client, '1')
+        self.assertRaises(ValueError, next, simulations)
+
+    def test_missing_simulation_group(self):
+        self.file_path.write_text('{"input_files": null}')
+        self.assertRaises(DictConvertible.Error, execution_requests.read, self.file_path)
@@ -7,14 +7,23 @@
 # License (MPL), version 2.0. If a copy of the MPL was not distributed
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import errno
+import gzip
+import json
+from StringIO import StringIO
 from urlparse import urlparse
 
+from django.contrib.auth.models import User
 from django.utils import timezone
+from mock import patch
 
-from vecnet.simulation import ExecutionRequest, submission_status
+from vecnet.simulation import (ExecutionRequest, Simulation as SimDefinition, SimulationGroup as SimGroup, sim_status,
+                               submission_status)
 from sim_manager import async, working_dirs
-from sim_manager.api import SimulationGroupResource
-from sim_manager.models import SimulationGroup
+from sim_manager.api import SimulationGroupResource, SimulationResource
+from sim_manager.models import Simulation, SimulationGroup
+from sim_manager.scripts import api_urls, execution_requests
+from sim_manager.scripts.constants import EXECUTION_REQUEST_FILENAME
 from sim_manager.tests.utils import TestsWithApiKeyAuth
 
 
@@ -40,6 +49,40 @@ class GroupApiTests(TestsWithApiKeyAuth):
     def test_get_list_unauthorized(self):
         self.assertHttpUnauthorized(self.api_client.get(self.group_endpoint))
 
+    def test_get_list_filtered(self):
+        other_user = User.objects.create_user('other-user')
+        try:
+            mine = SimulationGroup.objects.create(submitter=self.test_user,
+                                                  script_status=submission_status.SUBMITTING_JOBS)
+            SimulationGroup.objects.create(submitter=other_user, script_status=submission_status.SUBMITTING_JOBS)
+            SimulationGroup.objects.create(submitter=self.test_user, script_status=submission_status.SCRIPT_DONE)
+
+            resp = self.api_client.get(self.group_endpoint, authentication=self.get_credentials(),
+                                       data=dict(submitter=self.test_user.username,
+                                                 script_status=submission_status.SUBMITTING_JOBS, order_by='-id'))
+            self.assertValidJSONResponse(resp)
+            objects = self.deserialize(resp)['objects']
+            self.assertEqual([x['id'] for x in objects], [mine.id])
+            self.assertEqual(objects[0]['submitter'], self.test_user.username)
+        finally:
+            other_user.delete()
+
+    def test_get_list_compact(self):
+        group = SimulationGroup.objects.create(submitter=self.test_user, script_status=submission_status.SCRIPT_DONE)
+        params = dict(order_by='-id', limit=1, fields='id,script_status,submitter', compact='true')
+        resp = self.api_client.get(self.group_endpoint, data=params, authentication=self.get_credentials())
+        self.assertValidJSONResponse(resp)
+        data = self.deserialize(resp)
+        self.assertEqual(data['columns'], ['id', 'script_status', 'submitter'])
+        self.assertEqual(data['rows'], [[group.id, submission_status.SCRIPT_DONE, self.test_user.username]])
+
+    def test_get_detail_sparse_fields(self):
+        group = SimulationGroup.objects.create(submitter=self.test_user)
+        resp = self.api_client.get('%s%s/' % (self.group_endpoint, group.id), data=dict(fields='script_status'),
+                                   authentication=self.get_credentials())
+        self.assertValidJSONResponse(resp)
+        self.assertEqual(self.deserialize(resp), {'script_status': group.script_status})
+
     def test_post_list_unauthorized(self):
         self.assertHttpUnauthorized(self.api_client.post(self.group_endpoint))
 
@@ -83,6 +126,178 @@ class GroupApiTests(TestsWithApiKeyAuth):
         self.assertEqual(self.mock_start_task.call_count, 1)
         self.assertEqual(group.process_id, process_id)
 
+    def test_post_list_create_simulations(self):
+        ids_on_client = ['x', 'y', 'z']
+        execution_request = ExecutionRequest(simulation_group=SimGroup(
+            simulations=[SimDefinition(id_on_client=x) for x in ids_on_client]))
+        resp = self.api_client.post(self.group_endpoint + '?create_simulations=true',
+                                    data=execution_request.to_dict(), authentication=self.get_credentials())
+        self.assertHttpCreated(resp)
+
+        group_id = urlparse(resp['Location']).path[len(self.group_endpoint):].rstrip('/')
+        group = SimulationGroup.objects.get(id=group_id)
+        simulations = list(group.simulation_set.order_by('id'))
+        self.assertEqual([x.id_on_client for x in simulations], ids_on_client)
+        simulations_endpoint = self.make_resource_uri(SimulationResource.Meta.resource_name)
+        for simulation in simulations:
+            self.assertTrue(simulation.working_dir.isdir())
+            simulation_url = api_urls.read_for_simulation(simulation.working_dir)
+            self.assertEqual(urlparse(simulation_url).path, simulations_endpoint + '%s/' % simulation.id)
+
+    def test_post_list_create_simulations_fails(self):
+        """
+        Test that when a simulation's working directory can't be set up, the group and its simulations are removed.
+        """
+        groups_before_post = SimulationGroup.objects.count()
+        simulations_before_post = Simulation.objects.count()
+        execution_request = ExecutionRequest(simulation_group=SimGroup(
+            simulations=[SimDefinition(id_on_client=x) for x in ('x', 'y', 'z')]))
+        setup_working_dir = SimulationResource.setup_working_dir
+        working_dirs_set_up = []
+
+        def setup_or_fail(resource, request, simulation):
+            if len(working_dirs_set_up) == 2:
+                raise OSError(errno.ENOSPC, 'No space left on device')
+            setup_working_dir(resource, request, simulation)
+            working_dirs_set_up.append(simulation.working_dir)
+        with patch.object(SimulationResource, 'setup_working_dir', autospec=True, side_effect=setup_or_fail):
+            resp = self.api_client.post(self.group_endpoint + '?create_simulations=true',
+                                        data=execution_request.to_dict(), authentication=self.get_credentials())
+        self.assertEqual(resp.status_code, 500)
+        self.assertEqual(SimulationGroup.objects.count(), groups_before_post)
+        self.assertEqual(Simulation.objects.count(), simulations_before_post)
+        self.assertEqual(len(working_dirs_set_up), 2)
+        for working_dir in working_dirs_set_up:
+            self.assertFalse(working_dir.exists())
+
+    def test_post_list_without_creating_simulations(self):
+        execution_request = ExecutionRequest(simulation_group=SimGroup(simulations=[SimDefinition()]))
+        resp = self.api_client.post(self.group_endpoint, data=execution_request.to_dict(),
+                                    authentication=self.get_credentials())
+        self.assertHttpCreated(resp)
+        group_id = urlparse(resp['Location']).path[len(self.group_endpoint):].rstrip('/')
+        self.assertEqual(Simulation.objects.filter(group_id=group_id).count(), 0)
+
+    def post_json(self, body, **extra):
+        return self.client.post(self.group_endpoint, content_type='application/json', data=body,
+                                HTTP_AUTHORIZATION=self.get_credentials(), **extra)
+
+    def test_post_list_gzip(self):
+        execution_request = ExecutionRequest(simulation_group=SimGroup(
+            simulations=[SimDefinition(id_on_client=str(i), cmd_line_args=['-n', str(i)]) for i in range(50)]),
+            input_files={'data.csv': 'http://example.com/data.csv'})
+        compressed = StringIO()
+        with gzip.GzipFile(fileobj=compressed, mode='wb') as f:
+            f.write(json.dumps(execution_request.to_dict()))
+        resp = self.post_json(compressed.getvalue(), HTTP_CONTENT_ENCODING='gzip')
+        self.assertHttpCreated(resp)
+
+        # Check the execution request written to the group's working directory
+        group_id = urlparse(resp['Location']).path[len(self.group_endpoint):].rstrip('/')
+        group = SimulationGroup.objects.get(id=group_id)
+        saved_request, simulations = execution_requests.read(group.working_dir / EXECUTION_REQUEST_FILENAME)
+        self.assertEqual(saved_request.input_files, execution_request.input_files)
+        self.assertEqual([x.to_dict() for x in simulations],
+                         [x.to_dict() for x in execution_request.simulation_group.simulations])
+
+    def test_post_list_invalid_gzip(self):
+        resp = self.post_json('{"not": "compressed"}', HTTP_CONTENT_ENCODING='gzip')
+        self.assertHttpBadRequest(resp)
+
+    def test_post_list_unsupported_encoding(self):
+        resp = self.post_json('{}', HTTP_CONTENT_ENCODING='br')
+        self.assertHttpBadRequest(resp)
+
+    def test_post_list_invalid_simulation(self):
+        count_before_post = SimulationGroup.objects.count()
+        execution_request = ExecutionRequest(simulation_group=SimGroup(simulations=[SimDefinition()] * 3)).to_dict()
+        del execution_request['simulation_group']['simulations'][2]['input_files']
+        resp = self.post_json(json.dumps(execution_request))
+        self.assertHttpBadRequest(resp)
+        error_info = self.deserialize(resp)
+        self.assertEqual(error_info['error_details'], {'missing_key': 'input_files', 'class': 'Simulation'})
+        self.assertEqual(SimulationGroup.objects.count(), count_before_post)
+
+    def test_get_manifest(self):
+        group = SimulationGroup.objects.create(submitter=self.test_user)
+        simulation_1 = Simulation.objects.create(group=group, id_on_client='A')
+        simulation_2 = Simulation.objects.create(group=group, id_on_client='B', batch_job_id='42',
+                                                 status=sim_status.RUNNING_MODEL)
+        resp = self.api_client.get('%s%s/manifest/' % (self.group_endpoint, group.id),
+                                   authentication=self.get_credentials())
+        self.assertValidJSONResponse(resp)
+
+        simulations_endpoint = self.make_resource_uri(SimulationResource.Meta.resource_name)
+        expected_objects = []
+        for simulation in (simulation_1, simulation_2):
+            expected_objects.append({
+                'id': simulation.id,
+                'id_on_client': simulation.id_on_client,
+                'resource_uri': simulations_endpoint + '%s/' % simulation.id,
+                'working_dir': simulation.working_dir,
+                'batch_job_id': simulation.batch_job_id,
+                'status': simulation.status,
+            })
+        self.assertEqual(self.deserialize(resp)['objects'], expected_objects)
+
+    def test_get_progress(self):
+        group = SimulationGroup.objects.create(submitter=self.test_user, script_status=submission_status.SCRIPT_DONE)
+        statuses = [sim_status.RUNNING_MODEL] * 3 + [sim_status.SCRIPT_DONE] * 2 + [sim_status.SCRIPT_ERROR,
+                                                                                  sim_status.OUTPUT_ERROR]
+        simulations = [Simulation.objects.create(group=group, status=x) for x in statuses]
+        Simulation.objects.create(group=SimulationGroup.objects.create(submitter=self.test_user))  # Another group
+
+        resp = self.api_client.get('%s%s/progress/' % (self.group_endpoint, group.id),
+                                   authentication=self.get_credentials())
+        self.assertValidJSONResponse(resp)
+        progress = self.deserialize(resp)
+        self.assertEqual(progress['group'], '%s%s/' % (self.group_endpoint, group.id))
+        self.assertEqual(progress['script_status'], submission_status.SCRIPT_DONE)
+        self.assertEqual(progress['total'], len(statuses))
+        self.assertEqual(progress['finished'], 4)
+        self.assertEqual(progress['errors'], 2)
+        expected_counts = dict((status, statuses.count(status)) for status in sim_status.ALL)
+        self.assertEqual(progress['counts'], expected_counts)
+        self.assertEqual(progress['earliest_created'], simulations[0].created_when.strftime('%Y-%m-%dT%H:%M:%S.%f'))
+        self.assertEqual(progress['latest_created'], simulations[-1].created_when.strftime('%Y-%m-%dT%H:%M:%S.%f'))
+
+    def test_get_progress_one_query(self):
+        group = SimulationGroup.objects.create(submitter=self.test_user)
+        for status in sim_status.ALL:
+            Simulation.objects.create(group=group, status=status)
+        with self.assertNumQueries(1):
+            progress = group.get_progress()
+        self.assertEqual(progress['total'], len(sim_status.ALL))
+
+    def test_get_progress_empty_group(self):
+        group = SimulationGroup.objects.create(submitter=self.test_user)
+        resp = self.api_client.get('%s%s/progress/' % (self.group_endpoint, group.id),
+                                   authentication=self.get_credentials())
+        self.assertValidJSONResponse(resp)
+        progress = self.deserialize(resp)
+        self.assertEqual(progress['total'], 0)
+        self.assertIsNone(progress['earliest_created'])
+
+    def test_watch(self):
+        group = SimulationGroup.objects.create(submitter=self.test_user, script_status=submission_status.SCRIPT_DONE)
+        resp = self.api_client.get('%s%s/watch/' % (self.group_endpoint, group.id),
+                                   data=dict(status=submission_status.SUBMITTING_JOBS),
+                                   authentication=self.get_credentials())
+        self.assertValidJSONResponse(resp)
+        self.assertEqual(self.deserialize(resp), {
+            'resource_uri': '%s%s/' % (self.group_endpoint, group.id),
+            'script_status': submission_status.SCRIPT_DONE,
+            'changed': True,
+        })
+
+    def test_get_manifest_unknown_group(self):
+        resp = self.api_client.get('%s999999/manifest/' % self.group_endpoint, authentication=self.get_credentials())
+        self.assertHttpNotFound(resp)
+
+    def test_get_manifest_unauthorized(self):
+        group = SimulationGroup.objects.create(submitter=self.test_user)
+        self.assertHttpUnauthorized(self.api_client.get('%s%s/manifest/' % (self.group_endpoint, group.id)))
+
     def test_post_list_empty_execution_request(self):
         execution_request = {
         }
@@ -0,0 +1,245 @@
+# This file is part of the Simulation Manager project for VecNet.
+# For copyright and licensing information about this project, see the
+# NOTICE.txt and LICENSE.md files in its top-level directory; they are
+# available at https://github.com/vecnet/simulation-manager
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import errno
+import hashlib
+import json
+import os
+import stat
+import threading
+import time
+
+from crc_nd.utils.test_io import WritesOutputFiles
+from django.test import SimpleTestCase
+from mock import Mock, patch
+from path import path
+
+from .test_staging_input import MockResponse
+from ..scripts import input_files, run_simulation
+from ..scripts.input_files import InputCache
+from ..scripts.utils import ChecksumMismatch
+
+
+@patch('sim_manager.scripts.run_simulation.logger')
+@patch('sim_manager.scripts.input_files.logger')
+@patch('sim_manager.scripts.utils.logger')
+class InputCacheTests(SimpleTestCase, WritesOutputFiles):
+    """
+    Tests of the cache of input files.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super(InputCacheTests, cls).setUpClass()
+        output_root = path(__file__).dirname() / 'output'
+        cls.set_output_root(output_root)
+
+    def setUp(self):
+        self.initialize_output_dir()
+        self.cache_dir = self.get_output_dir() / 'cache'
+        self.working_dir = self.get_output_dir() / 'working_dir'
+        self.working_dir.mkdir()
+        self.contents = dict()  # key = URL, value = file contents
+        self.requested_urls = []
+        patcher = patch('sim_manager.scripts.utils.requests.get', side_effect=self.mock_get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def mock_get(self, url, headers=None, **kwargs):
+        self.requested_urls.append(url)
+        time.sleep(0.05)  # So concurrent requests overlap
+        etag = '"%s"' % hashlib.md5(self.contents[url]).hexdigest()
+        if headers and headers.get('If-None-Match') == etag:
+            return MockResponse([], status_code=304)
+        return MockResponse([self.contents[url]], headers={'ETag': etag})
+
+    def test_fetched_once(self, *mocks):
+        url = 'http://example.com/climate.bin'
+        self.contents[url] = 'climate data'
+        cache = InputCache(self.cache_dir, max_size=1000)
+        for i in range(3):
+            cache.materialize(url, self.working_dir / ('climate_%d.bin' % i))
+        self.assertEqual(self.requested_urls, [url])
+
+        object_path = cache.object_path(hashlib.sha256('climate data').hexdigest())
+        for i in range(3):
+            local_path = self.working_dir / ('climate_%d.bin' % i)
+            self.assertEqual(local_path.bytes(), 'climate data')
+            self.assertTrue(os.path.samefile(local_path, object_path))  # A link, not a copy
+        self.assertEqual(object_path.stat().st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH), 0)  # Read-only
+
+    def test_copied_across_filesystems(self, *mocks):
+        """
+        Test that a cached file is copied (not symlinked) when it can't be hard-linked, so evicting it doesn't affect
+        the simulation using it.
+        """
+        url = 'http://example.com/climate.bin'
+        self.contents[url] = 'climate data'
+        cache = InputCache(self.cache_dir, max_size=1000)
+        local_path = self.working_dir / 'climate.bin'
+        cross_device = OSError(errno.EXDEV, 'Invalid cross-device link')
+        with patch.dict(input_files.LINK_FUNCTIONS, hardlink=Mock(side_effect=cross_device)):
+            cache.materialize(url, local_path)
+        self.assertFalse(local_path.islink())
+        cache.max_size = 0
+        cache.evict()
+        self.assertEqual(cache.get_size(), 0)
+        self.assertEqual(local_path.bytes(), 'climate data')
+
+    def test_same_contents_stored_once(self, *mocks):
+        self.contents['http://example.com/a'] = 'same data'
+        self.contents['http://example.com/b'] = 'same data'
+        cache = InputCache(self.cache_dir, max_size=1000)
+        self.assertEqual(cache.fetch('http://example.com/a'), cache.fetch('http://example.com/b'))
+        self.assertEqual(len(list((self.cache_dir / 'objects').walkfiles())), 1)
+        self.assertEqual(len(self.requested_urls), 2)
+
+    def test_concurrent_fetches(self, *mocks):
+        """
+        Test that when several jobs need the same file at the same time, it's only downloaded once.
+        """
+        url = 'http://example.com/demographics.json'
+        self.contents[url] = '{"nodes": []}'
+        with patch.object(InputCache, 'LOCK_POLL_INTERVAL', 0.01):
+            threads = [threading.Thread(target=InputCache(self.cache_dir, max_size=1000).materialize,
+                                        args=(url, self.working_dir / ('demographics_%d.json' % i)))
+                       for i in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(self.requested_urls, [url])
+        for i in range(5):
+            self.assertEqual((self.working_dir / ('demographics_%d.json' % i)).bytes(), '{"nodes": []}')
+        self.assertEqual((self.cache_dir / 'locks').listdir(), [])
+
+    def test_abandoned_lock(self, *mocks):
+        url = 'http://example.com/campaign.json'
+        self.contents[url] = '{}'
+        cache = InputCache(self.cache_dir, max_size=1000, lock_timeout=60)
+        lock_path = self.cache_dir / 'locks' / (cache.url_key(url) + '.lock')
+        lock_path.touch()
+        os.utime(lock_path, (time.time() - 120, time.time() - 120))
+        self.assertEqual(cache.fetch(url).bytes(), '{}')
+
+    def test_lru_eviction(self, *mocks):
+        for name in ('a', 'b', 'c'):
+            self.contents['http://example.com/' + name] = name * 400
+        cache = InputCache(self.cache_dir, max_size=1000)
+        path_a = cache.fetch('http://example.com/a')
+        path_b = cache.fetch('http://example.com/b')
+        os.utime(path_a, (time.time() - 20, time.time() - 20))
+        os.utime(path_b, (time.time() - 10, time.time() - 10))
+        cache.fetch('http://example.com/a')  # Used again, so b is now the least recently used
+        cache.fetch('http://example.com/c')
+
+        self.assertEqual(cache.get_size(), 800)
+        self.assertFalse(path_b.exists())
+        self.assertIsNone(cache.lookup('http://example.com/b'))
+        self.assertIsNotNone(cache.lookup('http://example.com/a'))
+        cache.fetch('http://example.com/b')
+        self.assertEqual(self.requested_urls.count('http://example.com/b'), 2)
+
+    def test_revalidation(self, *mocks):
+        url = 'http://example.com/migration.bin'
+        self.contents[url] = 'version 1'
+        cache = InputCache(self.cache_dir, max_size=1000, revalidate_after=60)
+        path_1 = cache.fetch(url)
+        self.assertEqual(cache.fetch(url), path_1)
+        self.assertEqual(len(self.requested_urls), 1)
+
+        # Not modified
+        entry = cache.read_entry(url)
+        entry['checked_when'] -= 120
+        cache.entry_path(url).write_text(json.dumps(entry))
+        self.assertEqual(cache.fetch(url), path_1)
+        self.assertEqual(len(self.requested_urls), 2)
+        self.assertGreater(cache.read_entry(url)['checked_when'], time.time() - 60)
+
+        # Modified
+        self.contents[url] = 'version 2'
+        entry = cache.read_entry(url)
+        entry['checked_when'] -= 120
+        cache.entry_path(url).write_text(json.dumps(entry))
+        path_2 = cache.fetch(url)
+        self.assertEqual(len(self.requested_urls), 3)
+        self.assertNotEqual(path_2, path_1)
+        self.assertEqual(path_2.bytes(), 'version 2')
+
+    def test_checksum_url(self, *mocks):
+        """
+        Test that a URL with a SHA-256 checksum matches a cached file with that hash, without any request.
+        """
+        self.contents['http://example.com/a'] = 'climate data'
+        cache = InputCache(self.cache_dir, max_size=1000, revalidate_after=0)
+        object_path = cache.fetch('http://example.com/a')
+        url = 'http://mirror.example.com/a#sha256=' + hashlib.sha256('climate data').hexdigest()
+        self.assertEqual(cache.fetch(url), object_path)
+        self.assertEqual(self.requested_urls, ['http://example.com/a'])
+
+    def test_get_input_files(self, *mocks):
+        """
+        Test that the input files of several simulations are linked from the cache.
+        """
+        self.contents['http://example.com/config.json'] = '{"parameters": {}}'
+        files = {'config.json': 'http://example.com/config.json'}
+        with patch('sim_manager.scripts.input_files.INPUT_CACHE_DIR', self.cache_dir):
+            for i in range(3):
+                sim_working_dir = self.working_dir / str(i)
+                sim_working_dir.mkdir()
+                sim_working_dir.chdir()
+                run_simulation.get_input_files(files)
+                self.assertEqual((sim_working_dir / 'config.json').bytes(), '{"parameters": {}}')
+        self.assertEqual(self.requested_urls, ['http://example.com/config.json'])
+
+    def test_add_to_cache(self, *mocks):
+        self.contents['http://example.com/scenario.xml'] = '<scenario/>'
+        files = {
+            'scenario.xml': 'http://example.com/scenario.xml',
+            'missing.xml': 'http://example.com/missing.xml',
+        }
+        self.mock_get = lambda url, **kwargs: MockResponse([self.contents[url]] if url in self.contents else [],
+                                                           status_code=200 if url in self.contents else 404)
+        with patch('sim_manager.scripts.utils.requests.get', side_effect=self.mock_get):
+            with patch('sim_manager.scripts.input_files.INPUT_CACHE_DIR', self.cache_dir):
+                errors = input_files.add_to_cache(files)
+        self.assertEqual(errors.keys(), ['http://example.com/missing.xml'])
+        self.assertIsNotNone(InputCache(self.cache_dir, max_size=1000).lookup('http://example.com/scenario.xml'))
+
+    def test_add_to_cache_skips_shared_files(self, *mocks):
+        self.contents['http://example.com/scenario.xml'] = '<scenario/>'
+        files = {
+            'scenario.xml': 'http://example.com/scenario.xml',
+            'climate.bin': 'file:///shared/sim_manager/inputs/climate.bin',
+        }
+        with patch('sim_manager.scripts.input_files.INPUT_CACHE_DIR', self.cache_dir):
+            errors = input_files.add_to_cache(files)
+        self.assertEqual(errors, {})
+        self.assertEqual(self.requested_urls, ['http://example.com/scenario.xml'])
+
+    def test_add_to_cache_bad_checksums(self, *mocks):
+        """
+        Test that files whose checksums don't match (or are malformed) are skipped.
+        """
+        self.contents['http://example.com/scenario.xml'] = '<scenario/>'
+        self.contents['http://example.com/climate.bin'] = 'climate data'
+        mismatch_url = 'http://example.com/climate.bin#sha256=' + hashlib.sha256('other data').hexdigest()
+        malformed_url = 'http://example.com/climate.bin#sha256=not-a-digest'
+        files = {
+            'scenario.xml': 'http://example.com/scenario.xml',
+            'climate.bin': mismatch_url,
+            'climate2.bin': malformed_url,
+        }
+        with patch('sim_manager.scripts.input_files.INPUT_CACHE_DIR', self.cache_dir):
+            errors = input_files.add_to_cache(files)
+        self.assertEqual(sorted(errors.keys()), sorted([mismatch_url, malformed_url]))
+        self.assertTrue(isinstance(errors[mismatch_url], ChecksumMismatch))
+        self.assertTrue(isinstance(errors[malformed_url], ValueError))
+        self.assertIsNotNone(InputCache(self.cache_dir, max_size=1000).lookup('http://example.com/scenario.xml'))
+        self.assertEqual((self.cache_dir / 'tmp').listdir(), [])
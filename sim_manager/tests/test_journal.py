@@ -0,0 +1,93 @@
+# This file is part of the Simulation Manager project for VecNet.
+# For copyright and licensing information about this project, see the
+# NOTICE.txt and LICENSE.md files in its top-level directory; they are
+# available at https://github.com/vecnet/simulation-manager
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Tests for the journal of the submit_group.py script.
+"""
+
+from crc_nd.utils.test_io import WritesOutputFiles
+
+from .constants import TEST_OUTPUT_ROOT
+from sim_manager.scripts.journal import SubmissionJournal
+
+
+class SubmissionJournalTests(WritesOutputFiles):
+    """
+    Tests of the SubmissionJournal class.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.set_output_root(TEST_OUTPUT_ROOT)
+
+    def setUp(self):
+        self.initialize_output_dir()
+        self.journal_path = self.get_output_dir() / 'journal.txt'
+
+    def write_steps(self):
+        journal = SubmissionJournal(self.journal_path)
+        journal.open()
+        journal.write([SubmissionJournal.created(0, 'http://server/simulations/1/', '/sims/1'),
+                       SubmissionJournal.created(1, 'http://server/simulations/2/', '/sims/2')])
+        journal.write([SubmissionJournal.submitted(0, '1001'), SubmissionJournal.submitted(1, None)])
+        journal.write([SubmissionJournal.recorded(0)])
+        journal.close()
+
+    def test_load(self):
+        self.write_steps()
+        journal = SubmissionJournal(self.journal_path)
+        journal.load()
+
+        progress = journal.get_progress(0)
+        self.assertTrue(progress.is_created)
+        self.assertEqual(progress.url, 'http://server/simulations/1/')
+        self.assertEqual(progress.working_dir, '/sims/1')
+        self.assertTrue(progress.is_submitted)
+        self.assertEqual(progress.job_id, '1001')
+        self.assertTrue(progress.is_recorded)
+
+        progress = journal.get_progress(1)
+        self.assertTrue(progress.is_created)
+        self.assertTrue(progress.is_submitted)
+        self.assertIsNone(progress.job_id)
+        self.assertFalse(progress.is_recorded)
+
+        progress = journal.get_progress(2)
+        self.assertFalse(progress.is_created)
+        self.assertFalse(progress.is_submitted)
+
+    def test_partial_last_line(self):
+        self.write_steps()
+        with open(self.journal_path, 'a') as f:
+            f.write('{"step": "recorded", "ind')
+        journal = SubmissionJournal(self.journal_path)
+        journal.load()
+        self.assertTrue(journal.get_progress(0).is_recorded)
+        self.assertFalse(journal.get_progress(1).is_recorded)
+
+    def test_open_without_resume(self):
+        self.write_steps()
+        journal = SubmissionJournal(self.journal_path)
+        journal.open(resume=False)
+        journal.close()
+        journal.load()
+        self.assertFalse(journal.get_progress(0).is_created)
+
+    def test_open_with_resume(self):
+        self.write_steps()
+        journal = SubmissionJournal(self.journal_path)
+        journal.open(resume=True)
+        self.assertTrue(journal.get_progress(0).is_recorded)
+        journal.write([SubmissionJournal.recorded(1)])
+        journal.close()
+
+        journal = SubmissionJournal(self.journal_path)
+        journal.load()
+        self.assertTrue(journal.get_progress(0).is_recorded)
+        self.assertTrue(journal.get_progress(1).is_recorded)
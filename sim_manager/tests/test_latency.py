@@ -0,0 +1,136 @@
+# This file is part of the Simulation Manager project for VecNet.
+# For copyright and licensing information about this project, see the
+# NOTICE.txt and LICENSE.md files in its top-level directory; they are
+# available at https://github.com/vecnet/simulation-manager
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Tests for the status history of simulations and the statistics about their phases.
+"""
+
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from vecnet.simulation import sim_status
+
+from sim_manager import latency
+from sim_manager.models import Simulation, SimulationGroup, SimulationStatusEvent
+
+
+class StatusHistoryTests(TestCase):
+    """
+    Tests of recording the changes in simulations' statuses.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.user = User.objects.create_user('latency-test-user')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.user.delete()
+
+    def setUp(self):
+        self.group = SimulationGroup.objects.create(submitter=self.user)
+
+    def get_history(self, simulation):
+        return list(simulation.status_events.order_by('occurred_when', 'id').values_list('status', flat=True))
+
+    def test_status_changes_recorded(self):
+        simulation = Simulation.objects.create(group=self.group)
+        self.assertEqual(self.get_history(simulation), [])
+
+        simulation.status = sim_status.STARTED_SCRIPT
+        simulation.save()
+        simulation.batch_job_id = '123'
+        simulation.save()  # Status didn't change
+        simulation = Simulation.objects.get(id=simulation.id)
+        simulation.status = sim_status.STAGING_INPUT
+        simulation.save(update_fields=['status'])
+        simulation.status = sim_status.RUNNING_MODEL
+        simulation.save(update_fields=['error_details'])  # Status not saved
+        self.assertEqual(self.get_history(simulation), [sim_status.STARTED_SCRIPT, sim_status.STAGING_INPUT])
+
+    def test_created_with_other_status(self):
+        simulation = Simulation.objects.create(group=self.group, status=sim_status.SCRIPT_ERROR)
+        self.assertEqual(self.get_history(simulation), [sim_status.SCRIPT_ERROR])
+
+    def test_events_not_modified(self):
+        simulation = Simulation.objects.create(group=self.group, status=sim_status.SCRIPT_ERROR)
+        event = simulation.status_events.get()
+        self.assertRaises(AssertionError, event.save)
+
+
+class PhaseLatencyTests(TestCase):
+    """
+    Tests of the statistics about the time spent in each phase.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.user = User.objects.create_user('latency-test-user')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.user.delete()
+
+    def add_simulation(self, group, model_version, phase_durations):
+        """
+        Add a simulation with a history of status changes.
+
+        :param list phase_durations: List of (status, seconds in the previous phase).
+        """
+        simulation = Simulation.objects.create(group=group, model='EMOD', model_version=model_version)
+        when = simulation.created_when
+        for status, seconds in phase_durations:
+            when += timedelta(seconds=seconds)
+            SimulationStatusEvent.objects.create(simulation=simulation, status=status, occurred_when=when)
+        return simulation
+
+    def test_percentile(self):
+        values = range(1, 101)
+        self.assertEqual(latency.percentile(values, 50), 50)
+        self.assertEqual(latency.percentile(values, 99), 99)
+        self.assertEqual(latency.percentile([7], 90), 7)
+        self.assertEqual(latency.percentile([1, 2], 0), 1)
+
+    def test_get_seconds(self):
+        self.assertEqual(latency.get_seconds(timedelta(days=2, seconds=5, microseconds=250000)), 2 * 86400 + 5.25)
+        self.assertEqual(latency.get_seconds(timedelta(seconds=-1.5)), -1.5)
+
+    def test_get_phase_latencies(self):
+        group = SimulationGroup.objects.create(submitter=self.user)
+        other_group = SimulationGroup.objects.create(submitter=self.user)
+        for queue_wait in (10, 20, 30, 40):
+            self.add_simulation(group, '1.6', [(sim_status.STARTED_SCRIPT, queue_wait), (sim_status.STAGING_INPUT, 1),
+                                               (sim_status.RUNNING_MODEL, 5), (sim_status.STAGING_OUTPUT, 100),
+                                               (sim_status.SCRIPT_DONE, 2)])
+        self.add_simulation(other_group, '1.5', [(sim_status.STARTED_SCRIPT, 60), (sim_status.SCRIPT_ERROR, 3)])
+        Simulation.objects.create(group=other_group, model='EMOD', model_version='1.5')  # Still waiting
+
+        results = latency.get_phase_latencies(Simulation.objects.filter(group__in=[group, other_group]),
+                                              lambda group_id, model, version: (model, version))
+        self.assertEqual(sorted(results.keys()), [('EMOD', '1.5'), ('EMOD', '1.6')])
+
+        results_16 = results[('EMOD', '1.6')]
+        self.assertEqual(results_16['simulations'], 4)
+        self.assertEqual(sorted(results_16['phases'].keys()),
+                         sorted([sim_status.READY_TO_RUN, sim_status.STARTED_SCRIPT, sim_status.STAGING_INPUT,
+                                 sim_status.RUNNING_MODEL, sim_status.STAGING_OUTPUT]))
+        self.assertEqual(results_16['phases'][sim_status.READY_TO_RUN],
+                         {'count': 4, 'mean': 25.0, 'max': 40.0, 'p50': 20.0, 'p90': 40.0, 'p99': 40.0})
+        self.assertEqual(results_16['phases'][sim_status.RUNNING_MODEL]['p50'], 100.0)
+
+        results_15 = results[('EMOD', '1.5')]
+        self.assertEqual(results_15['simulations'], 2)
+        self.assertEqual(results_15['phases'][sim_status.READY_TO_RUN]['count'], 1)
+        self.assertEqual(results_15['phases'][sim_status.STARTED_SCRIPT]['max'], 3.0)
+
+        results = latency.get_phase_latencies(Simulation.objects.filter(group__in=[group, other_group]),
+                                              lambda group_id, model, version: group_id)
+        self.assertEqual(results[group.id]['simulations'], 4)
+        self.assertEqual(results[other_group.id]['simulations'], 2)
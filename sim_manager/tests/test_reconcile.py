@@ -0,0 +1,115 @@
+# This file is part of the Simulation Manager project for VecNet.
+# For copyright and licensing information about this project, see the
+# NOTICE.txt and LICENSE.md files in its top-level directory; they are
+# available at https://github.com/vecnet/simulation-manager
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Tests for reconciling the statuses of simulations with the statuses of their batch jobs.
+"""
+
+from datetime import timedelta
+from StringIO import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils import timezone
+from vecnet.simulation import sim_status
+
+from sim_manager.models import Simulation, SimulationGroup
+from sim_manager.reconcile import reconcile_simulations
+from sim_manager.scripts.batch import job_status
+from sim_manager.scripts.batch.api import BatchSystemError
+from sim_manager.scripts.batch.test_utils import MockBatchSystem, Mocks
+
+
+class ReconcileTests(TestCase):
+    """
+    Tests of the reconcile_simulations function and the reconcile_jobs command.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.user = User.objects.create_user('reconcile-test-user')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.user.delete()
+
+    def setUp(self):
+        self.group = SimulationGroup.objects.create(submitter=self.user)
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        self.simulations = dict()
+        for job_id, status in (
+            ('1.server', sim_status.RUNNING_MODEL),     # Job killed
+            ('2.server', sim_status.STAGING_INPUT),     # Job still running
+            ('3.server', sim_status.READY_TO_RUN),      # Job still queued
+            ('4.server', sim_status.SCRIPT_DONE),       # Finished normally
+            ('5.server', sim_status.READY_TO_RUN),      # Job deleted from the queue
+            ('', sim_status.READY_TO_RUN),              # Not submitted yet
+        ):
+            simulation = Simulation.objects.create(group=self.group, batch_job_id=job_id, status=status)
+            Simulation.objects.filter(id=simulation.id).update(created_when=an_hour_ago)
+            self.simulations[job_id] = simulation
+        Mocks.get_statuses.reset_mock()
+        Mocks.get_statuses.side_effect = lambda job_ids: dict((job_id, {
+            '2.server': job_status.RUNNING,
+            '3.server': job_status.QUEUED,
+        }.get(job_id, job_status.FINISHED)) for job_id in job_ids)
+
+    def tearDown(self):
+        Mocks.get_statuses.side_effect = None
+
+    def get_status(self, job_id):
+        return Simulation.objects.get(id=self.simulations[job_id].id).status
+
+    def test_reconcile(self):
+        checked, failed = reconcile_simulations(MockBatchSystem())
+        self.assertEqual(checked, 4)
+        self.assertEqual(Mocks.get_statuses.call_count, 1)
+        self.assertEqual(Mocks.get_statuses.call_args[0][0], ['1.server', '2.server', '3.server', '5.server'])
+        self.assertEqual(sorted(x.batch_job_id for x in failed), ['1.server', '5.server'])
+
+        for job_id, expected_status in (
+            ('1.server', sim_status.SCRIPT_ERROR),
+            ('2.server', sim_status.STAGING_INPUT),
+            ('3.server', sim_status.READY_TO_RUN),
+            ('4.server', sim_status.SCRIPT_DONE),
+            ('5.server', sim_status.SCRIPT_ERROR),
+            ('', sim_status.READY_TO_RUN),
+        ):
+            self.assertEqual(self.get_status(job_id), expected_status)
+        simulation = Simulation.objects.get(id=self.simulations['1.server'].id)
+        self.assertEqual(simulation.error_details,
+                         'Batch job 1.server ended while the simulation was in the status "%s"' %
+                         sim_status.RUNNING_MODEL)
+        self.assertEqual([x.status for x in simulation.status_events.all()],
+                         [sim_status.RUNNING_MODEL, sim_status.SCRIPT_ERROR])
+
+        # Nothing more to do the second time
+        checked, failed = reconcile_simulations(MockBatchSystem())
+        self.assertEqual((checked, failed), (2, []))
+
+    def test_recent_simulations_skipped(self):
+        Simulation.objects.filter(batch_job_id='1.server').update(created_when=timezone.now())
+        checked, failed = reconcile_simulations(MockBatchSystem(), min_age=timedelta(minutes=5))
+        self.assertEqual(sorted(x.batch_job_id for x in failed), ['5.server'])
+        self.assertEqual(self.get_status('1.server'), sim_status.RUNNING_MODEL)
+
+    def test_command(self):
+        stdout = StringIO()
+        call_command('reconcile_jobs', batch_system='mock', stdout=stdout)
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(lines[-1], 'Checked 4 batch jobs; 2 simulations marked as errors')
+        self.assertEqual(self.get_status('5.server'), sim_status.SCRIPT_ERROR)
+
+    def test_command_batch_system_error(self):
+        Mocks.get_statuses.side_effect = BatchSystemError('qstat failed')
+        self.assertRaises(CommandError, call_command, 'reconcile_jobs', batch_system='mock', stdout=StringIO())
+        self.assertEqual(self.get_status('1.server'), sim_status.RUNNING_MODEL)
+        self.assertRaises(CommandError, call_command, 'reconcile_jobs', batch_system='lsf', stdout=StringIO())
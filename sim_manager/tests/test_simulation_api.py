@@ -7,14 +7,19 @@
 # License (MPL), version 2.0. If a copy of the MPL was not distributed
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
-from urlparse import urlparse
+import time
+from datetime import timedelta
+from urlparse import parse_qs, urlparse
 
+from django.db import connection, DatabaseError
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
+from mock import patch
 from vecnet.simulation import sim_status
 
 from sim_manager import working_dirs
 from sim_manager.api import SimulationGroupResource, SimulationResource
-from sim_manager.models import Simulation, SimulationGroup
+from sim_manager.models import Simulation, SimulationGroup, SimulationStatusEvent
 from sim_manager.tests.utils import TestsWithApiKeyAuth
 
 
@@ -58,9 +63,221 @@ class SimulationApiTests(TestsWithApiKeyAuth):
             'status': sim_status.READY_TO_RUN,
             'id_on_client': '',
             'error_details': '',
+            'model': '',
+            'model_version': '',
         }
         self.assertEqual(data, expected_data)
 
+    def get_list(self, **params):
+        resp = self.api_client.get(self.simulations_endpoint, data=params, authentication=self.get_credentials())
+        self.assertValidJSONResponse(resp)
+        return self.deserialize(resp)['objects']
+
+    def test_get_list_filtered(self):
+        group = SimulationGroup.objects.create(submitter=self.test_user)
+        running = [Simulation.objects.create(group=group, id_on_client=str(i), status=sim_status.RUNNING_MODEL)
+                   for i in range(3)]
+        done = Simulation.objects.create(group=group, id_on_client='3', status=sim_status.SCRIPT_DONE,
+                                         batch_job_id='77.server')
+        Simulation.objects.create(group=self.sim_group, status=sim_status.RUNNING_MODEL)  # In another group
+
+        objects = self.get_list(group=group.id, status=sim_status.RUNNING_MODEL)
+        self.assertEqual([x['id'] for x in objects], [x.id for x in running])
+
+        objects = self.get_list(group=group.id, status__in=','.join([sim_status.RUNNING_MODEL, sim_status.SCRIPT_DONE]))
+        self.assertEqual(len(objects), 4)
+
+        objects = self.get_list(group=group.id, id_on_client='1')
+        self.assertEqual([x['id'] for x in objects], [running[1].id])
+
+        objects = self.get_list(batch_job_id='77.server')
+        self.assertEqual([x['id'] for x in objects], [done.id])
+
+        objects = self.get_list(group=group.id, created_when__gte=done.created_when.isoformat())
+        self.assertIn(done.id, [x['id'] for x in objects])
+
+    def test_get_list_ordered(self):
+        group = SimulationGroup.objects.create(submitter=self.test_user)
+        simulations = [Simulation.objects.create(group=group, id_on_client=x) for x in ('b', 'c', 'a')]
+        objects = self.get_list(group=group.id, order_by='-id_on_client')
+        self.assertEqual([x['id_on_client'] for x in objects], ['c', 'b', 'a'])
+        objects = self.get_list(group=group.id, order_by='-id')
+        self.assertEqual([x['id'] for x in objects], [x.id for x in reversed(simulations)])
+
+    def get_pages(self, **params):
+        """
+        Get all the pages of a list with cursor pagination, following the "next" links.
+        """
+        resp = self.api_client.get(self.simulations_endpoint, data=params, authentication=self.get_credentials())
+        pages = []
+        while True:
+            self.assertValidJSONResponse(resp)
+            pages.append(self.deserialize(resp))
+            next_uri = pages[-1]['meta']['next']
+            if next_uri is None:
+                return pages
+            resp = self.api_client.get(next_uri, authentication=self.get_credentials())
+
+    def test_get_list_cursor(self):
+        group = SimulationGroup.objects.create(submitter=self.test_user)
+        simulations = [Simulation.objects.create(group=group) for _ in range(5)]
+        pages = self.get_pages(group=group.id, cursor='', limit=2)
+        self.assertEqual([[x['id'] for x in page['objects']] for page in pages],
+                         [[x.id for x in simulations[0:2]], [x.id for x in simulations[2:4]], [simulations[4].id]])
+        self.assertNotIn('total_count', pages[0]['meta'])
+        self.assertNotIn('offset', urlparse(pages[0]['meta']['next']).query)
+
+        pages = self.get_pages(group=group.id, cursor='', limit=3, order_by='-id', total_count='true')
+        self.assertEqual([x['id'] for page in pages for x in page['objects']], [x.id for x in reversed(simulations)])
+        self.assertEqual(pages[0]['meta']['total_count'], 5)
+
+    def test_get_list_cursor_created_when(self):
+        group = SimulationGroup.objects.create(submitter=self.test_user)
+        simulations = [Simulation.objects.create(group=group) for _ in range(5)]
+        now = timezone.now()
+        hours_ago = [2, 0, 0, 0, 1]  # Simulations with the same creation time are ordered by id
+        for simulation, hours in zip(simulations, hours_ago):
+            Simulation.objects.filter(id=simulation.id).update(created_when=now - timedelta(hours=hours))
+        expected_ids = [simulations[i].id for i in (0, 4, 1, 2, 3)]
+
+        for limit in (1, 2, 4):
+            pages = self.get_pages(group=group.id, cursor='', limit=limit, order_by='created_when')
+            self.assertEqual([x['id'] for page in pages for x in page['objects']], expected_ids)
+            pages = self.get_pages(group=group.id, cursor='', limit=limit, order_by='-created_when')
+            self.assertEqual([x['id'] for page in pages for x in page['objects']], list(reversed(expected_ids)))
+
+    def test_get_list_cursor_invalid(self):
+        group = SimulationGroup.objects.create(submitter=self.test_user)
+        for _ in range(2):
+            Simulation.objects.create(group=group)
+        next_uri = self.get_pages(group=group.id, cursor='', limit=1)[0]['meta']['next']
+        cursor = parse_qs(urlparse(next_uri).query)['cursor'][0]
+        for params in (dict(cursor='not a cursor'), dict(cursor='', order_by='status'), dict(total_count='maybe'),
+                       dict(cursor=cursor, order_by='created_when')):
+            resp = self.api_client.get(self.simulations_endpoint, data=params, authentication=self.get_credentials())
+            self.assertHttpBadRequest(resp)
+
+    def test_get_list_without_total_count(self):
+        group = SimulationGroup.objects.create(submitter=self.test_user)
+        simulations = [Simulation.objects.create(group=group) for _ in range(3)]
+        resp = self.api_client.get(self.simulations_endpoint, data=dict(group=group.id, limit=2, total_count='false'),
+                                   authentication=self.get_credentials())
+        self.assertValidJSONResponse(resp)
+        data = self.deserialize(resp)
+        self.assertNotIn('total_count', data['meta'])
+        self.assertEqual([x['id'] for x in data['objects']], [x.id for x in simulations[:2]])
+        self.assertIn('offset=2', data['meta']['next'])
+
+    def test_get_list_sparse_fields(self):
+        group = SimulationGroup.objects.create(submitter=self.test_user)
+        simulations = [Simulation.objects.create(group=group, status=sim_status.RUNNING_MODEL) for _ in range(2)]
+        objects = self.get_list(group=group.id, fields='id,status')
+        self.assertEqual(objects, [{'id': x.id, 'status': sim_status.RUNNING_MODEL} for x in simulations])
+
+        resp = self.api_client.get(self.simulations_endpoint, data=dict(fields='id,no_such_field'),
+                                   authentication=self.get_credentials())
+        self.assertHttpBadRequest(resp)
+
+    def test_get_list_compact(self):
+        group = SimulationGroup.objects.create(submitter=self.test_user)
+        simulations = [Simulation.objects.create(group=group, id_on_client=str(i)) for i in range(2)]
+        group_uri = '/api/v1/sim-groups/%s/' % group.id
+
+        resp = self.api_client.get(self.simulations_endpoint, authentication=self.get_credentials(),
+                                   data=dict(group=group.id, fields='id,group,id_on_client', compact='true'))
+        self.assertValidJSONResponse(resp)
+        data = self.deserialize(resp)
+        self.assertNotIn('objects', data)
+        self.assertEqual(data['columns'], ['id', 'group', 'id_on_client'])
+        self.assertEqual(data['rows'], [[x.id, group_uri, x.id_on_client] for x in simulations])
+        self.assertEqual(data['meta']['total_count'], 2)
+
+        resp = self.api_client.get(self.simulations_endpoint, data=dict(group=group.id, compact='1'),
+                                   authentication=self.get_credentials())
+        data = self.deserialize(resp)
+        self.assertEqual(data['columns'], sorted(SimulationResource().fields.keys()))
+        self.assertEqual(len(data['rows']), 2)
+
+    def count_queries(self, **params):
+        with CaptureQueriesContext(connection) as context:
+            self.get_list(**params)
+        return len(context.captured_queries)
+
+    def test_get_list_group_not_fetched(self):
+        # The number of queries for a page doesn't depend on the number of simulations in it
+        group = SimulationGroup.objects.create(submitter=self.test_user)
+        Simulation.objects.create(group=group)
+        queries_for_1 = self.count_queries(group=group.id)
+        for _ in range(5):
+            Simulation.objects.create(group=group)
+        self.assertEqual(self.count_queries(group=group.id), queries_for_1)
+
+    def watch(self, simulation, **params):
+        resp = self.api_client.get('%s%s/watch/' % (self.simulations_endpoint, simulation.id), data=params,
+                                   authentication=self.get_credentials())
+        self.assertValidJSONResponse(resp)
+        return self.deserialize(resp)
+
+    def test_watch(self):
+        simulation = Simulation.objects.create(group=self.sim_group, status=sim_status.RUNNING_MODEL)
+        data = self.watch(simulation, status=sim_status.READY_TO_RUN)
+        self.assertEqual(data, {
+            'resource_uri': '%s%s/' % (self.simulations_endpoint, simulation.id),
+            'status': sim_status.RUNNING_MODEL,
+            'changed': True,
+        })
+
+        start = time.time()
+        data = self.watch(simulation, status=sim_status.RUNNING_MODEL, timeout='0.1')
+        self.assertGreaterEqual(time.time() - start, 0.1)
+        self.assertEqual(data['status'], sim_status.RUNNING_MODEL)
+        self.assertFalse(data['changed'])
+
+    def test_watch_invalid(self):
+        simulation = Simulation.objects.create(group=self.sim_group)
+        watch_url = '%s%s/watch/' % (self.simulations_endpoint, simulation.id)
+        for params in (dict(), dict(status=sim_status.READY_TO_RUN, timeout='soon')):
+            self.assertHttpBadRequest(self.api_client.get(watch_url, data=params,
+                                                          authentication=self.get_credentials()))
+        self.assertHttpUnauthorized(self.api_client.get(watch_url, data=dict(status=sim_status.READY_TO_RUN)))
+        resp = self.api_client.get('%s%s/watch/' % (self.simulations_endpoint, simulation.id + 1000),
+                                   data=dict(status=sim_status.READY_TO_RUN), authentication=self.get_credentials())
+        self.assertHttpNotFound(resp)
+
+    def test_get_latencies(self):
+        group = SimulationGroup.objects.create(submitter=self.test_user)
+        for model_version in ('1.5', '1.6', '1.6'):
+            simulation = Simulation.objects.create(group=group, model='EMOD', model_version=model_version)
+            SimulationStatusEvent.objects.create(simulation=simulation, status=sim_status.STARTED_SCRIPT,
+                                                 occurred_when=simulation.created_when + timedelta(seconds=30))
+        resp = self.api_client.get(self.simulations_endpoint + 'latencies/', data=dict(group=group.id),
+                                   authentication=self.get_credentials())
+        self.assertValidJSONResponse(resp)
+        data = self.deserialize(resp)
+        self.assertEqual(data['by'], 'model')
+        self.assertEqual([(x['model'], x['model_version'], x['simulations']) for x in data['objects']],
+                         [('EMOD', '1.5', 1), ('EMOD', '1.6', 2)])
+        self.assertEqual(data['objects'][1]['phases'][sim_status.READY_TO_RUN]['p50'], 30.0)
+
+        resp = self.api_client.get(self.simulations_endpoint + 'latencies/', data=dict(group=group.id, by='group'),
+                                   authentication=self.get_credentials())
+        self.assertValidJSONResponse(resp)
+        objects = self.deserialize(resp)['objects']
+        self.assertEqual([(x['group'], x['simulations']) for x in objects],
+                         [('/api/v1/sim-groups/%s/' % group.id, 3)])
+
+    def test_get_latencies_invalid(self):
+        for params in (dict(by='user'), dict(group='x')):
+            resp = self.api_client.get(self.simulations_endpoint + 'latencies/', data=params,
+                                       authentication=self.get_credentials())
+            self.assertHttpBadRequest(resp)
+        self.assertHttpUnauthorized(self.api_client.get(self.simulations_endpoint + 'latencies/'))
+
+    def test_get_list_unindexed_filter(self):
+        for params in (dict(error_details='oops'), dict(id_on_client__contains='1'), dict(order_by='error_details')):
+            resp = self.api_client.get(self.simulations_endpoint, data=params, authentication=self.get_credentials())
+            self.assertHttpBadRequest(resp)
+
     def test_post_list_unauthorized(self):
         self.assertHttpUnauthorized(self.api_client.post(self.simulations_endpoint))
 
@@ -102,6 +319,68 @@ class SimulationApiTests(TestsWithApiKeyAuth):
         resp_data = self.deserialize(resp)
         self.assertEqual(resp_data['working_dir'], simulation.working_dir)
 
+    def test_post_bulk(self):
+        count_before_post = Simulation.objects.count()
+        ids_on_client = ['A1', 'B2', 'C3']
+
+        bulk_endpoint = self.simulations_endpoint + 'bulk/'
+        resp = self.api_client.post(bulk_endpoint,
+                                    data=dict(group=self.sim_group_uri,
+                                              objects=[dict(id_on_client=x) for x in ids_on_client]),
+                                    authentication=self.get_credentials())
+        self.assertHttpCreated(resp)
+        self.assertEqual(Simulation.objects.count(), count_before_post + len(ids_on_client))
+
+        # Check that the new simulations are listed in the response in the same order as in the request
+        resp_data = self.deserialize(resp)
+        self.assertEqual(len(resp_data['objects']), len(ids_on_client))
+        for id_on_client, simulation_data in zip(ids_on_client, resp_data['objects']):
+            simulation = Simulation.objects.get(id=simulation_data['id'])
+            self.assertEqual(simulation.group.id, self.sim_group.id)
+            self.assertEqual(simulation.id_on_client, id_on_client)
+            self.assertEqual(simulation_data['id_on_client'], id_on_client)
+            self.assertEqual(simulation_data['resource_uri'], self.simulations_endpoint + '%s/' % simulation.id)
+            self.assertEqual(simulation_data['working_dir'], simulation.working_dir)
+            self.assertTrue(simulation.working_dir.isdir())
+
+    def test_post_bulk_rolled_back(self):
+        """
+        Test that when a simulation can't be created, the others aren't created and their working directories are
+        removed.
+        """
+        count_before_post = Simulation.objects.count()
+        create = Simulation.objects.create
+        created = []
+
+        def create_or_fail(**kwargs):
+            if len(created) == 2:
+                raise DatabaseError('disk I/O error')
+            simulation = create(**kwargs)
+            created.append(simulation)
+            return simulation
+        with patch.object(Simulation.objects, 'create', side_effect=create_or_fail):
+            # The test client raises the view's exception instead of returning the error response
+            self.assertRaises(DatabaseError, self.api_client.post, self.simulations_endpoint + 'bulk/',
+                              data=dict(group=self.sim_group_uri,
+                                        objects=[dict(id_on_client=x) for x in ('A1', 'B2', 'C3')]),
+                              authentication=self.get_credentials())
+        self.assertEqual(Simulation.objects.count(), count_before_post)
+        self.assertEqual(len(created), 2)
+        for simulation in created:
+            self.assertFalse(simulation.working_dir.exists())
+
+    def test_post_bulk_restricted_field(self):
+        count_before_post = Simulation.objects.count()
+        bad_data = dict(group=self.sim_group_uri,
+                        objects=[dict(id_on_client='1'), dict(id_on_client='2', status=sim_status.SCRIPT_DONE)])
+        resp = self.api_client.post(self.simulations_endpoint + 'bulk/', data=bad_data,
+                                    authentication=self.get_credentials())
+        self.assertHttpBadRequest(resp)
+        self.assertEqual(Simulation.objects.count(), count_before_post)
+
+    def test_post_bulk_unauthorized(self):
+        self.assertHttpUnauthorized(self.api_client.post(self.simulations_endpoint + 'bulk/'))
+
     def test_patch_batch_job(self):
         simulation = Simulation.objects.create(group=self.sim_group)
         self.assertEqual(simulation.batch_job_id, '')
@@ -114,6 +393,81 @@ class SimulationApiTests(TestsWithApiKeyAuth):
         simulation = Simulation.objects.get(id=simulation.id)  # Reload the model instance
         self.assertEqual(simulation.batch_job_id, job_id)
 
+    def test_patch_list(self):
+        simulations = [Simulation.objects.create(group=self.sim_group) for _ in range(3)]
+        simulation_uris = [self.simulations_endpoint + '%s/' % x.id for x in simulations]
+        updates = [
+            dict(resource_uri=simulation_uris[0], batch_job_id='100'),
+            dict(resource_uri=simulation_uris[1], status=sim_status.STAGING_INPUT),
+            dict(resource_uri=simulation_uris[2], status=sim_status.SCRIPT_ERROR, error_details='oops'),
+        ]
+        resp = self.api_client.patch(self.simulations_endpoint, data=dict(objects=updates),
+                                     authentication=self.get_credentials())
+        self.assertHttpAccepted(resp)
+        resp_data = self.deserialize(resp)
+        self.assertEqual(resp_data['objects'], [dict(resource_uri=x, updated=True) for x in simulation_uris])
+
+        simulations = [Simulation.objects.get(id=x.id) for x in simulations]  # Reload the model instances
+        self.assertEqual(simulations[0].batch_job_id, '100')
+        self.assertEqual(simulations[1].status, sim_status.STAGING_INPUT)
+        self.assertEqual(simulations[2].status, sim_status.SCRIPT_ERROR)
+        self.assertEqual(simulations[2].error_details, 'oops')
+
+    def test_patch_list_with_failures(self):
+        simulation = Simulation.objects.create(group=self.sim_group)
+        simulation_uri = self.simulations_endpoint + '%s/' % simulation.id
+        unknown_uri = self.simulations_endpoint + '999999/'
+        updates = [
+            dict(resource_uri=simulation_uri, id_on_client='restricted'),
+            dict(resource_uri=unknown_uri, batch_job_id='200'),
+            dict(batch_job_id='300'),
+            dict(resource_uri=simulation_uri, batch_job_id='400'),
+        ]
+        resp = self.api_client.patch(self.simulations_endpoint, data=dict(objects=updates),
+                                     authentication=self.get_credentials())
+        self.assertHttpAccepted(resp)
+        results = self.deserialize(resp)['objects']
+        self.assertEqual([x['updated'] for x in results], [False, False, False, True])
+        self.assertEqual([x['resource_uri'] for x in results], [simulation_uri, unknown_uri, None, simulation_uri])
+        for result in results[:3]:
+            self.assertIn('error', result)
+
+        # The failed updates don't prevent the others from being applied
+        simulation = Simulation.objects.get(id=simulation.id)
+        self.assertEqual(simulation.id_on_client, '')
+        self.assertEqual(simulation.batch_job_id, '400')
+
+    def test_patch_list_with_save_error(self):
+        """
+        Test that an update that fails when it's saved is rolled back by itself, and the other updates are applied.
+        """
+        simulations = [Simulation.objects.create(group=self.sim_group) for _ in range(3)]
+        simulation_uris = [self.simulations_endpoint + '%s/' % x.id for x in simulations]
+        updates = [dict(resource_uri=uri, batch_job_id=str(i)) for i, uri in enumerate(simulation_uris)]
+        updates.append(dict(resource_uri=self.simulations_endpoint + 'bulk/', batch_job_id='3'))
+        save = Simulation.save
+
+        def save_or_fail(simulation, *args, **kwargs):
+            save(simulation, *args, **kwargs)
+            if simulation.id == simulations[1].id:
+                raise DatabaseError('disk I/O error')
+        with patch.object(Simulation, 'save', autospec=True, side_effect=save_or_fail):
+            with patch('sim_manager.api.logger') as mock_logger:
+                resp = self.api_client.patch(self.simulations_endpoint, data=dict(objects=updates),
+                                             authentication=self.get_credentials())
+        self.assertHttpAccepted(resp)
+        results = self.deserialize(resp)['objects']
+        self.assertEqual([x['updated'] for x in results], [True, False, True, False])
+        self.assertEqual(results[1]['error'], 'update failed')  # The database's error isn't sent to the client
+        self.assertEqual(mock_logger.exception.call_count, 1)
+        self.assertEqual(results[3]['error'], 'unknown simulation')
+
+        simulations = [Simulation.objects.get(id=x.id) for x in simulations]  # Reload the model instances
+        self.assertEqual([x.batch_job_id for x in simulations], ['0', '', '2'])
+
+    def test_patch_list_unauthorized(self):
+        self.assertHttpUnauthorized(self.api_client.patch(self.simulations_endpoint, data=dict(objects=[])))
+
     def test_patch_restricted_field(self):
         simulation = Simulation.objects.create(group=self.sim_group)
         bad_data = {
@@ -0,0 +1,299 @@
+# This file is part of the Simulation Manager project for VecNet.
+# For copyright and licensing information about this project, see the
+# NOTICE.txt and LICENSE.md files in its top-level directory; they are
+# available at https://github.com/vecnet/simulation-manager
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import errno
+import hashlib
+import os
+import threading
+import time
+from urllib import pathname2url
+
+from crc_nd.utils.test_io import WritesOutputFiles
+from django.test import SimpleTestCase
+from mock import Mock, patch
+from path import path
+from requests.exceptions import ChunkedEncodingError, HTTPError
+
+from ..scripts import input_files, run_simulation
+from ..scripts.utils import ChecksumMismatch, download_file, DownloadSettings
+
+
+class MockResponse(object):
+    """
+    A response to a download request, whose contents are sent in chunks.
+    """
+
+    def __init__(self, chunks, status_code=200, chunk_delay=0, headers=None, fail_after=None):
+        """
+        :param int fail_after: Number of chunks sent before the connection is lost (None = it's not lost).
+        """
+        self.chunks = chunks
+        self.status_code = status_code
+        self.chunk_delay = chunk_delay
+        self.headers = headers or dict()
+        self.fail_after = fail_after
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPError('%d Error' % self.status_code, response=self)
+
+    def iter_content(self, chunk_size=1):
+        for index, chunk in enumerate(self.chunks):
+            if index == self.fail_after:
+                raise ChunkedEncodingError('Connection broken')
+            time.sleep(self.chunk_delay)
+            yield chunk
+
+
+@patch('sim_manager.scripts.run_simulation.logger')
+@patch('sim_manager.scripts.input_files.INPUT_CACHE_DIR', None)
+class InputStagingTests(SimpleTestCase, WritesOutputFiles):
+    """
+    Tests of staging a simulation's input files into its working directory.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super(InputStagingTests, cls).setUpClass()
+        output_root = path(__file__).dirname() / 'output'
+        cls.set_output_root(output_root)
+
+    def setUp(self):
+        self.initialize_output_dir()
+        self.get_output_dir().chdir()  # Since the input files are written to the current working directory
+        self.responses = dict()  # key = URL, value = MockResponse
+        self.active_downloads = 0
+        self.max_active_downloads = 0
+        self.lock = threading.Lock()
+
+    def mock_get(self, url, **kwargs):
+        with self.lock:
+            self.active_downloads += 1
+            self.max_active_downloads = max(self.max_active_downloads, self.active_downloads)
+        try:
+            time.sleep(0.05)  # So the downloads overlap
+            return self.responses[url]
+        finally:
+            with self.lock:
+                self.active_downloads -= 1
+
+    def test_concurrent_downloads(self, *mocks):
+        files = dict()
+        for i in range(6):
+            url = 'http://example.com/input/%d' % i
+            self.responses[url] = MockResponse(['file %d, ' % i, 'chunk 2'])
+            files['input_%d.txt' % i] = url
+        with patch('sim_manager.scripts.utils.requests.get', side_effect=self.mock_get):
+            with patch('sim_manager.scripts.run_simulation.conf.INPUT_STAGING_WORKERS', 3):
+                run_simulation.get_input_files(files)
+
+        self.assertEqual(self.max_active_downloads, 3)
+        self.assertEqual(sorted(x.name for x in self.get_output_dir().files()), sorted(files.keys()))
+        for i in range(6):
+            self.assertEqual((self.get_output_dir() / ('input_%d.txt' % i)).bytes(), 'file %d, chunk 2' % i)
+
+    def test_failure_cancels_other_downloads(self, *mocks):
+        """
+        Test that when a download fails, the other downloads are cancelled without leaving partial files.
+        """
+        self.responses['http://example.com/missing'] = MockResponse([], status_code=404)
+        self.responses['http://example.com/large'] = MockResponse(['x' * 100] * 1000, chunk_delay=0.01)
+        files = {
+            'missing.txt': 'http://example.com/missing',
+            'large.bin': 'http://example.com/large',
+        }
+        start = time.time()
+        with patch('sim_manager.scripts.utils.requests.get', side_effect=self.mock_get):
+            self.assertRaises(HTTPError, run_simulation.get_input_files, files)
+        self.assertLess(time.time() - start, 2.0)  # Instead of 10 seconds for the large file
+        self.assertEqual(self.get_output_dir().listdir(), [])
+
+    def test_existing_file_replaced(self, *mocks):
+        (self.get_output_dir() / 'input.txt').write_bytes('old contents')
+        self.responses['http://example.com/input'] = MockResponse(['new contents'])
+        with patch('sim_manager.scripts.utils.requests.get', side_effect=self.mock_get):
+            run_simulation.get_input_files({'input.txt': 'http://example.com/input'})
+        self.assertEqual(self.get_output_dir().listdir(), [self.get_output_dir() / 'input.txt'])
+        self.assertEqual((self.get_output_dir() / 'input.txt').bytes(), 'new contents')
+
+    def test_unsupported_scheme(self, *mocks):
+        with patch('sim_manager.scripts.utils.requests.get') as mock_get:
+            self.assertRaises(NotImplementedError, run_simulation.get_input_files,
+                              {'a.txt': 'http://example.com/a', 'b.txt': 'ftp://example.com/b'})
+        self.assertFalse(mock_get.called)
+
+
+@patch('sim_manager.scripts.utils.logger')
+@patch('sim_manager.scripts.utils.time.sleep')
+class DownloadFileTests(SimpleTestCase, WritesOutputFiles):
+    """
+    Tests of the download_file function.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super(DownloadFileTests, cls).setUpClass()
+        output_root = path(__file__).dirname() / 'output'
+        cls.set_output_root(output_root)
+
+    def setUp(self):
+        self.initialize_output_dir()
+        self.local_path = self.get_output_dir() / 'climate.bin'
+        self.contents = ''.join(chr(i % 256) for i in range(1000))
+        self.chunks = [self.contents[i:i + 100] for i in range(0, 1000, 100)]
+        self.responses = []  # The responses for the next requests
+        self.request_headers = []  # The headers of each request
+
+    def mock_get(self, url, headers=None, **kwargs):
+        self.request_headers.append(headers)
+        return self.responses.pop(0)
+
+    def download(self, url='http://example.com/climate.bin', **kwargs):
+        with patch('sim_manager.scripts.utils.requests.get', side_effect=self.mock_get):
+            return download_file(url, self.local_path, **kwargs)
+
+    def test_resume(self, *mocks):
+        """
+        Test that an interrupted download resumes where it stopped.
+        """
+        self.responses = [
+            MockResponse(self.chunks, headers={'Content-Length': '1000', 'ETag': '"v1"'}, fail_after=3),
+            MockResponse(self.chunks[3:], status_code=206, headers={'Content-Length': '700'}),
+        ]
+        result = self.download()
+        self.assertEqual(self.local_path.bytes(), self.contents)
+        self.assertEqual(result.size, 1000)
+        self.assertEqual(result.sha256, hashlib.sha256(self.contents).hexdigest())
+        self.assertEqual(result.validators, {'etag': '"v1"'})
+        self.assertEqual(self.request_headers[1]['Range'], 'bytes=300-')
+        self.assertEqual(self.request_headers[1]['If-Range'], '"v1"')
+
+    def test_restart_if_range_not_supported(self, *mocks):
+        self.responses = [
+            MockResponse(self.chunks, headers={'Content-Length': '1000'}, fail_after=3),
+            MockResponse(self.chunks, headers={'Content-Length': '1000'}),
+        ]
+        self.download()
+        self.assertEqual(self.local_path.bytes(), self.contents)
+
+    def test_truncated_response(self, *mocks):
+        """
+        Test that a response that ends before its Content-Length is treated as an interruption.
+        """
+        self.responses = [
+            MockResponse(self.chunks[:5], headers={'Content-Length': '1000'}),
+            MockResponse(self.chunks[5:], status_code=206, headers={'Content-Length': '500'}),
+        ]
+        self.download()
+        self.assertEqual(self.local_path.bytes(), self.contents)
+        self.assertEqual(self.request_headers[1]['Range'], 'bytes=500-')
+
+    def test_checksum(self, *mocks):
+        for algorithm in ('sha256', 'md5'):
+            digest = hashlib.new(algorithm, self.contents).hexdigest()
+            self.responses = [MockResponse(self.chunks)]
+            self.download('http://example.com/climate.bin#%s=%s' % (algorithm, digest.upper()))
+            self.assertEqual(self.local_path.bytes(), self.contents)
+
+    def test_checksum_mismatch(self, *mocks):
+        self.responses = [MockResponse(self.chunks[:-1])]
+        digest = hashlib.sha256(self.contents).hexdigest()
+        self.assertRaises(ChecksumMismatch, self.download, 'http://example.com/climate.bin#sha256=' + digest)
+        self.assertEqual(self.get_output_dir().listdir(), [])
+        self.assertRaises(ValueError, self.download, 'http://example.com/climate.bin#sha256=1234')
+
+    def test_not_modified(self, *mocks):
+        self.local_path.write_bytes('cached copy')
+        validators = {'etag': '"v1"', 'last_modified': 'Tue, 15 Nov 1994 12:45:26 GMT'}
+        self.responses = [MockResponse([], status_code=304)]
+        result = self.download(validators=validators)
+        self.assertFalse(result.is_modified)
+        self.assertEqual(self.request_headers[0]['If-None-Match'], '"v1"')
+        self.assertEqual(self.request_headers[0]['If-Modified-Since'], 'Tue, 15 Nov 1994 12:45:26 GMT')
+        self.assertEqual(self.get_output_dir().listdir(), [self.local_path])
+        self.assertEqual(self.local_path.bytes(), 'cached copy')
+
+    def test_retries_exhausted(self, *mocks):
+        self.responses = [MockResponse(self.chunks, fail_after=1) for _ in range(DownloadSettings.MAX_ATTEMPTS)]
+        self.assertRaises(ChunkedEncodingError, self.download)
+        self.assertEqual(self.get_output_dir().listdir(), [])
+
+    def test_throughput_logged(self, mock_sleep, mock_logger):
+        self.responses = [MockResponse(self.chunks)]
+        self.download()
+        message = mock_logger.info.call_args[0][0]
+        self.assertIn('MB/s', message)
+
+
+@patch('sim_manager.scripts.run_simulation.logger')
+@patch('sim_manager.scripts.input_files.logger')
+@patch('sim_manager.scripts.input_files.INPUT_CACHE_DIR', None)
+class SharedInputTests(SimpleTestCase, WritesOutputFiles):
+    """
+    Tests of staging input files from trusted shared storage with file:// URLs.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super(SharedInputTests, cls).setUpClass()
+        output_root = path(__file__).dirname() / 'output'
+        cls.set_output_root(output_root)
+
+    def setUp(self):
+        self.initialize_output_dir()
+        self.shared_root = self.get_output_dir() / 'shared'
+        self.shared_root.mkdir()
+        self.shared_file = self.shared_root / 'climate.bin'
+        self.shared_file.write_bytes('climate data')
+        self.working_dir = self.get_output_dir() / 'working_dir'
+        self.working_dir.mkdir()
+        self.working_dir.chdir()
+        patcher = patch('sim_manager.scripts.input_files.SHARED_INPUT_ROOTS', [self.shared_root])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def file_url(self, file_path):
+        return 'file://' + pathname2url(file_path)
+
+    def test_linked(self, *mocks):
+        """
+        Test that when a reflink isn't possible, the file is hard-linked.
+        """
+        unsupported = OSError(errno.EOPNOTSUPP, 'Operation not supported')
+        with patch.dict(input_files.LINK_FUNCTIONS, reflink=Mock(side_effect=unsupported)):
+            with patch('sim_manager.scripts.utils.requests.get') as mock_get:
+                run_simulation.get_input_files({'climate.bin': self.file_url(self.shared_file)})
+        self.assertFalse(mock_get.called)
+        local_path = self.working_dir / 'climate.bin'
+        self.assertEqual(local_path.bytes(), 'climate data')
+        self.assertTrue(os.path.samefile(local_path, self.shared_file))
+        self.assertEqual(self.working_dir.listdir(), [local_path])
+
+    def test_link_modes(self, *mocks):
+        with patch('sim_manager.scripts.input_files.SHARED_INPUT_LINK_MODES', ('symlink',)):
+            run_simulation.get_input_files({'climate.bin': self.file_url(self.shared_file)})
+        local_path = self.working_dir / 'climate.bin'
+        self.assertTrue(local_path.islink())
+        self.assertEqual(local_path.bytes(), 'climate data')
+
+    def test_untrusted_path(self, *mocks):
+        outside_file = self.get_output_dir() / 'secret.txt'
+        outside_file.write_bytes('secret')
+        escaping_link = self.shared_root / 'escape.txt'
+        outside_file.symlink(escaping_link)
+        for file_path in (outside_file, self.shared_root / '..' / 'secret.txt', escaping_link):
+            self.assertRaises(ValueError, run_simulation.get_input_files, {'x.txt': self.file_url(file_path)})
+        self.assertRaises(ValueError, run_simulation.get_input_files,
+                          {'x.txt': 'file://otherhost' + pathname2url(self.shared_file)})
+        self.assertEqual(self.working_dir.listdir(), [])
+
+    def test_missing_file(self, *mocks):
+        self.assertRaises(EnvironmentError, run_simulation.get_input_files,
+                          {'x.bin': self.file_url(self.shared_root / 'missing.bin')})
+        self.assertEqual(self.working_dir.listdir(), [])
@@ -8,6 +8,7 @@
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import json
+import zlib
 
 from crc_nd.utils.test_io import WritesOutputFiles
 from django.core.urlresolvers import reverse
@@ -19,7 +20,7 @@ from requests.exceptions import HTTPError
 from vecnet.simulation import Simulation
 
 from .. import views
-from ..scripts import run_simulation
+from ..scripts import constants, run_simulation
 from ..scripts.tests.test_utils import add_newlines, LOREM_IPSUM, SAMPLE_CSV_DATA
 
 
@@ -109,3 +110,136 @@ class OutputStagingTests(LiveServerTestCase, WritesOutputFiles):
         """
         self.simulation.output_url='http://HostNotExist.vecnet.org/test-output-url'
         self.assertRaises(ConnectionError, run_simulation.stage_output_files, [], simulation=self.simulation)
+
+
+@patch('sim_manager.scripts.run_simulation.logger')
+@patch('sim_manager.scripts.output_staging.time.sleep')
+@patch('sim_manager.scripts.run_simulation.conf.OUTPUT_CHUNK_SIZE', 1000)
+@patch('sim_manager.scripts.run_simulation.conf.OUTPUT_STAGING_MODE', 'stream')
+class StreamingOutputStagingTests(LiveServerTestCase, WritesOutputFiles):
+    """
+    Tests of streaming a simulation's output files to its output URL in chunks.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super(StreamingOutputStagingTests, cls).setUpClass()
+        output_root = path(__file__).dirname() / 'output'
+        cls.set_output_root(output_root)
+        cls.test_output_url = reverse('test-output-url')
+
+    def setUp(self):
+        self.simulation = Simulation(id_on_client='007')
+        self.simulation.output_url = self.live_server_url + self.test_output_url
+        views.status_to_return = 200
+        del views.captured_requests[:]
+        del views.statuses_to_return_first[:]
+        self.initialize_output_dir()
+        self.get_output_dir().chdir()  # Since the output files are read from the current working directory
+        self.progress_path = self.get_output_dir() / constants.OUTPUT_STAGING_PROGRESS_FILENAME
+
+    @classmethod
+    def tearDownClass(cls):
+        views.status_to_return = None
+        del views.captured_requests[:]
+        del views.statuses_to_return_first[:]
+        super(StreamingOutputStagingTests, cls).tearDownClass()
+
+    def create_test_file(self, filename, contents):
+        file_path = self.get_output_dir() / filename
+        file_path.write_bytes(contents)
+
+    def get_received_files(self):
+        """
+        Reassemble the files from the chunks received by the output URL.
+        """
+        received_files = dict()
+        for request in views.captured_requests:
+            if request['method'] != 'PUT':
+                continue
+            headers = request['headers']
+            self.assertEqual(headers['CONTENT_TYPE'], 'application/octet-stream')
+            self.assertEqual(headers['HTTP_CONTENT_ENCODING'], 'gzip')
+            self.assertEqual(headers['HTTP_X_ID_ON_CLIENT'], self.simulation.id_on_client)
+            data = zlib.decompress(request['body'], 16 + zlib.MAX_WBITS)
+            contents = received_files.setdefault(headers['HTTP_X_OUTPUT_FILENAME'], bytearray())
+            content_range = headers['HTTP_CONTENT_RANGE']
+            if content_range != 'bytes */0':
+                first, last = map(int, content_range.split()[1].split('/')[0].split('-'))
+                self.assertEqual(last - first + 1, len(data))
+                contents[first:last + 1] = data
+        return dict((filename, str(contents)) for filename, contents in received_files.items())
+
+    def get_manifest(self):
+        self.assertEqual(views.captured_requests[-1]['method'], 'POST')
+        return json.loads(views.captured_requests[-1]['body'])
+
+    def test_chunks(self, *mocks):
+        binary_data = ''.join(chr(i % 256) for i in range(2500))
+        self.create_test_file('binary.dat', binary_data)
+        self.create_test_file('lorem.txt', '\n'.join(LOREM_IPSUM))
+        self.create_test_file('empty.txt', '')
+        filenames = ['binary.dat', 'lorem.txt', 'empty.txt', 'missing.txt']
+        run_simulation.stage_output_files(filenames, simulation=self.simulation)
+
+        self.assertEqual(self.get_received_files(), {
+            'binary.dat': binary_data,
+            'lorem.txt': '\n'.join(LOREM_IPSUM),
+            'empty.txt': '',
+        })
+        put_requests = [r for r in views.captured_requests if r['method'] == 'PUT']
+        self.assertEqual([r['headers']['HTTP_CONTENT_RANGE'] for r in put_requests[:3]],
+                         ['bytes 0-999/2500', 'bytes 1000-1999/2500', 'bytes 2000-2499/2500'])
+        self.assertEqual(self.get_manifest(), {
+            'id_on_client': self.simulation.id_on_client,
+            'streamed_files': {
+                'binary.dat': {'size': 2500},
+                'lorem.txt': {'size': len('\n'.join(LOREM_IPSUM))},
+                'empty.txt': {'size': 0},
+            },
+        })
+        self.assertFalse(self.progress_path.exists())
+
+    def test_chunk_retried(self, *mocks):
+        """
+        Test that a chunk that fails with a temporary server error is sent again.
+        """
+        binary_data = ''.join(chr(i % 251) for i in range(2500))
+        self.create_test_file('binary.dat', binary_data)
+        views.statuses_to_return_first[:] = [200, 503, 502]
+        run_simulation.stage_output_files(['binary.dat'], simulation=self.simulation)
+
+        self.assertEqual(self.get_received_files(), {'binary.dat': binary_data})
+        ranges = [r['headers'].get('HTTP_CONTENT_RANGE') for r in views.captured_requests]
+        self.assertEqual(ranges, ['bytes 0-999/2500', 'bytes 1000-1999/2500', 'bytes 1000-1999/2500',
+                                  'bytes 1000-1999/2500', 'bytes 2000-2499/2500', None])
+
+    def test_resume(self, *mocks):
+        """
+        Test that an interrupted upload resumes with the first chunk that wasn't accepted.
+        """
+        binary_data = ''.join(chr(i % 253) for i in range(3500))
+        self.create_test_file('binary.dat', binary_data)
+        views.statuses_to_return_first[:] = [200, 200, 401]
+        self.assertRaises(HTTPError, run_simulation.stage_output_files, ['binary.dat'], simulation=self.simulation)
+        self.assertTrue(self.progress_path.exists())
+
+        del views.captured_requests[:]
+        run_simulation.stage_output_files(['binary.dat'], simulation=self.simulation)
+        ranges = [r['headers'].get('HTTP_CONTENT_RANGE') for r in views.captured_requests]
+        self.assertEqual(ranges, ['bytes 2000-2999/3500', 'bytes 3000-3499/3500', None])
+        self.assertEqual(self.get_manifest()['streamed_files'], {'binary.dat': {'size': 3500}})
+        self.assertFalse(self.progress_path.exists())
+
+    def test_restart_if_file_changed(self, *mocks):
+        """
+        Test that a file is sent again from its start if it was changed after the upload was interrupted.
+        """
+        self.create_test_file('binary.dat', 'a' * 2500)
+        views.statuses_to_return_first[:] = [200, 401]
+        self.assertRaises(HTTPError, run_simulation.stage_output_files, ['binary.dat'], simulation=self.simulation)
+
+        self.create_test_file('binary.dat', 'b' * 1500)
+        del views.captured_requests[:]
+        run_simulation.stage_output_files(['binary.dat'], simulation=self.simulation)
+        self.assertEqual(self.get_received_files(), {'binary.dat': 'b' * 1500})
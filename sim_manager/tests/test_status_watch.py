@@ -0,0 +1,92 @@
+# This file is part of the Simulation Manager project for VecNet.
+# For copyright and licensing information about this project, see the
+# NOTICE.txt and LICENSE.md files in its top-level directory; they are
+# available at https://github.com/vecnet/simulation-manager
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Tests for waiting on status changes.
+"""
+
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from sim_manager import status_watch
+from sim_manager.models import Simulation, SimulationGroup
+from sim_manager.status_watch import StatusWatcher
+
+
+class StatusWatcherTests(TestCase):
+    """
+    Tests of the StatusWatcher class.
+    """
+
+    def setUp(self):
+        self.watcher = StatusWatcher(recheck_interval=60)
+        self.key = ('Simulation', 1)
+        self.status = ['ready']
+        self.reads = 0
+
+    def get_status(self):
+        self.reads += 1
+        return self.status[0]
+
+    def change_status_later(self, new_status, notify=True):
+        def change():
+            time.sleep(0.05)
+            self.status[0] = new_status
+            if notify:
+                self.watcher.notify(self.key)
+        thread = threading.Thread(target=change)
+        thread.start()
+        return thread
+
+    def test_already_changed(self):
+        self.assertEqual(self.watcher.wait_for_change(self.key, self.get_status, 'start', 10), 'ready')
+        self.assertEqual(self.reads, 1)
+        self.assertEqual(self.watcher.waiting_count(self.key), 0)
+
+    def test_notified(self):
+        thread = self.change_status_later('done')
+        start = time.time()
+        self.assertEqual(self.watcher.wait_for_change(self.key, self.get_status, 'ready', 10), 'done')
+        thread.join()
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual(self.reads, 2)  # No reads except when notified
+        self.assertEqual(self.watcher.waiting_count(self.key), 0)
+
+    def test_timeout(self):
+        start = time.time()
+        self.assertEqual(self.watcher.wait_for_change(self.key, self.get_status, 'ready', 0.1), 'ready')
+        self.assertGreaterEqual(time.time() - start, 0.1)
+
+    def test_recheck_without_notice(self):
+        # A change in another process isn't notified, so it's found by re-reading the status
+        self.watcher.recheck_interval = 0.02
+        self.status[0] = 'model'
+        self.assertEqual(self.watcher.wait_for_change(self.key, self.get_status, 'ready', 10), 'model')
+        self.status[0] = 'ready'
+        thread = self.change_status_later('output', notify=False)
+        self.assertEqual(self.watcher.wait_for_change(self.key, self.get_status, 'ready', 10), 'output')
+        thread.join()
+        self.assertGreater(self.reads, 2)
+
+    def test_saved_objects_notify(self):
+        user = User.objects.create_user('watch-test-user')
+        group = SimulationGroup.objects.create(submitter=user)
+        simulation = Simulation.objects.create(group=group)
+        for model_class, obj in ((Simulation, simulation), (SimulationGroup, group)):
+            key = StatusWatcher.make_key(model_class, obj.pk)
+            event = threading.Event()
+            status_watch.watcher._events[key] = set([event])
+            try:
+                obj.save()
+                self.assertTrue(event.is_set())
+            finally:
+                del status_watch.watcher._events[key]
@@ -18,7 +18,8 @@ from crc_nd.utils.test_io import WritesOutputFiles
 from django.test import LiveServerTestCase
 from mock import patch
 from path import path
-from vecnet.simulation import ExecutionRequest, sim_model, Simulation, SimulationGroup as SimGroup, submission_status
+from vecnet.simulation import (ExecutionRequest, sim_model, sim_status, Simulation, SimulationGroup as SimGroup,
+                               submission_status)
 
 from .constants import TEST_OUTPUT_ROOT
 from .mixins import UsesDatabaseApi
@@ -58,6 +59,240 @@ class MainTests(LiveServerTestCase, UsesDatabaseApi, WritesOutputFiles):
 
     @patch('sim_manager.scripts.submit_group.BATCH_SYSTEM', batch.MOCK)
     def test_run_script(self):
+        self.run_script()
+
+    @patch('sim_manager.scripts.submit_group.BATCH_SYSTEM', batch.MOCK)
+    @patch('sim_manager.scripts.submit_group.SIMULATION_CHUNK_SIZE', 1)
+    def test_run_script_chunk_size_1(self):
+        self.run_script()
+
+    @patch('sim_manager.scripts.submit_group.BATCH_SYSTEM', batch.MOCK)
+    @patch('sim_manager.scripts.submit_group.SIMULATION_CHUNK_SIZE', 5)
+    @patch('sim_manager.scripts.submit_group.SUBMISSION_WORKERS', 4)
+    def test_concurrent_submission(self):
+        group = SimulationGroup.objects.create(submitter=self.test_user)
+        simulations = [Simulation(model=sim_model.MOCK, model_version='0.1', id_on_client=str(i)) for i in range(12)]
+        execution_request = ExecutionRequest(simulation_group=SimGroup(simulations=simulations))
+        group.setup_working_dir(execution_request)
+
+        group_url = self.live_server_url + ('/api/v1/sim-groups/%s/' % group.id)
+        simulations_url = self.live_server_url + '/api/v1/simulations/'
+        api_urls.write_for_group(group.working_dir, group_url, simulations_url)
+
+        # Each simulation's job id is derived from its working directory, so it doesn't depend on submission order.
+        test_utils.Mocks.submit_job.reset_mock()
+        test_utils.Mocks.submit_job.side_effect = lambda executable, working_dir, *args: 'job.' + working_dir.name
+        self.callback_count = 0
+        group.working_dir.chdir()
+        self.initialize_output_dir()
+        stdout_path = self.get_output_dir() / 'stdout.txt'
+        try:
+            with stdout_path.open('w') as f:
+                exit_status = submit_group.main('foo', stdout=f, test_callback=self.count_callback)
+        finally:
+            test_utils.Mocks.submit_job.side_effect = None
+        self.assertEqual(exit_status, 0)
+        group = SimulationGroup.objects.get(id=group.id)
+        self.assertEqual(group.script_status, submission_status.SCRIPT_DONE)
+        self.assertEqual(test_utils.Mocks.submit_job.call_count, len(simulations))
+
+        # The callback is called once after the group starts, once after caching files, and once per simulation.
+        self.assertEqual(self.callback_count, 2 + len(simulations))
+
+        db_simulations = list(group.simulation_set.order_by('id'))
+        self.assertEqual([x.id_on_client for x in db_simulations], [x.id_on_client for x in simulations])
+        for simulation in db_simulations:
+            self.assertEqual(simulation.batch_job_id, 'job.%s' % simulation.id)
+
+        # Check that the simulations are listed in the output in their original order
+        batch_jobs_in_stdout = [line.split('=')[1].strip() for line in stdout_path.lines() if 'batch job =' in line]
+        self.assertEqual(batch_jobs_in_stdout, ['job.%s' % x.id for x in db_simulations])
+
+    @patch('sim_manager.scripts.submit_group.BATCH_SYSTEM', batch.MOCK)
+    @patch('sim_manager.scripts.submit_group.SIMULATION_CHUNK_SIZE', 5)
+    @patch.object(test_utils.MockBatchSystem, 'supports_job_arrays', True)
+    def test_job_arrays(self):
+        group = SimulationGroup.objects.create(submitter=self.test_user)
+        simulations = [Simulation(model=sim_model.MOCK, model_version='0.1', id_on_client=str(i)) for i in range(12)]
+        execution_request = ExecutionRequest(simulation_group=SimGroup(simulations=simulations))
+        group.setup_working_dir(execution_request)
+
+        group_url = self.live_server_url + ('/api/v1/sim-groups/%s/' % group.id)
+        simulations_url = self.live_server_url + '/api/v1/simulations/'
+        api_urls.write_for_group(group.working_dir, group_url, simulations_url)
+
+        # Each chunk of simulations is submitted as one job array.  The last job in the second array fails.
+        def submit_array(executable, working_dirs, args, script_dir):
+            array_id = Mocks.submit_jobs.call_count
+            job_ids = ['%d[%d]' % (array_id, i) for i in range(len(working_dirs))]
+            if array_id == 2:
+                job_ids[-1] = None
+            return job_ids
+        Mocks = test_utils.Mocks
+        Mocks.submit_job.reset_mock()
+        Mocks.submit_jobs.reset_mock()
+        Mocks.submit_jobs.side_effect = submit_array
+        self.callback_count = 0
+        group.working_dir.chdir()
+        self.initialize_output_dir()
+        stdout_path = self.get_output_dir() / 'stdout.txt'
+        try:
+            with stdout_path.open('w') as f:
+                exit_status = submit_group.main('foo', stdout=f, test_callback=self.count_callback)
+        finally:
+            Mocks.submit_jobs.side_effect = None
+        self.assertEqual(exit_status, 0)
+        self.assertFalse(Mocks.submit_job.called)
+        self.assertEqual(Mocks.submit_jobs.call_count, 3)  # chunks of 5, 5 and 2 simulations
+        self.assertEqual(self.callback_count, 2 + len(simulations))
+
+        db_simulations = list(group.simulation_set.order_by('id'))
+        for (args, kwargs), chunk_start in zip(Mocks.submit_jobs.call_args_list, (0, 5, 10)):
+            executable, working_dirs, cmd_args, script_dir = args
+            self.assertEqual(executable, sys.executable)
+            self.assertEqual(list(cmd_args), [self.simulation_script])
+            self.assertEqual(script_dir, group.working_dir)
+            self.assertEqual(working_dirs, [x.working_dir for x in db_simulations[chunk_start:chunk_start + 5]])
+            for working_dir in working_dirs:
+                self.assertTrue((working_dir / SIMULATION_DEFINITION_FILENAME).isfile())
+
+        expected_job_ids = ['1[%d]' % i for i in range(5)] + ['2[%d]' % i for i in range(4)] + [''] + \
+                           ['3[%d]' % i for i in range(2)]
+        self.assertEqual([x.batch_job_id for x in db_simulations], expected_job_ids)
+        self.assertEqual(db_simulations[9].status, sim_status.SCRIPT_ERROR)
+
+    @patch('sim_manager.scripts.submit_group.BATCH_SYSTEM', batch.MOCK)
+    @patch('sim_manager.scripts.submit_group.SIMULATION_CHUNK_SIZE', 2)
+    def test_simulations_created_with_group(self):
+        group = SimulationGroup.objects.create(submitter=self.test_user)
+        simulations = [Simulation(model=sim_model.MOCK, model_version='0.1', id_on_client=str(i)) for i in range(5)]
+        execution_request = ExecutionRequest(simulation_group=SimGroup(simulations=simulations))
+        group.setup_working_dir(execution_request)
+        created_simulations = list(group.create_simulations(simulations))
+        for simulation in created_simulations:
+            simulation.setup_working_dir()
+
+        group_url = self.live_server_url + ('/api/v1/sim-groups/%s/' % group.id)
+        simulations_url = self.live_server_url + '/api/v1/simulations/'
+        api_urls.write_for_group(group.working_dir, group_url, simulations_url)
+
+        test_utils.Mocks.submit_job.reset_mock()
+        test_utils.Mocks.submit_job.side_effect = lambda executable, working_dir, *args: 'job.' + working_dir.name
+        group.working_dir.chdir()
+        self.initialize_output_dir()
+        try:
+            with (self.get_output_dir() / 'stdout.txt').open('w') as f:
+                exit_status = submit_group.main('foo', stdout=f)
+        finally:
+            test_utils.Mocks.submit_job.side_effect = None
+        self.assertEqual(exit_status, 0)
+
+        # The script used the existing simulations rather than creating new ones
+        db_simulations = list(group.simulation_set.order_by('id'))
+        self.assertEqual([x.id for x in db_simulations], [x.id for x in created_simulations])
+        for simulation in db_simulations:
+            self.assertEqual(simulation.batch_job_id, 'job.%s' % simulation.id)
+            self.assertTrue((simulation.working_dir / SIMULATION_DEFINITION_FILENAME).isfile())
+
+    @patch('sim_manager.scripts.submit_group.BATCH_SYSTEM', batch.MOCK)
+    @patch('sim_manager.scripts.submit_group.SIMULATION_CHUNK_SIZE', 2)
+    def test_resume(self):
+        group = SimulationGroup.objects.create(submitter=self.test_user)
+        simulations = [Simulation(model=sim_model.MOCK, model_version='0.1', id_on_client=str(i)) for i in range(6)]
+        execution_request = ExecutionRequest(simulation_group=SimGroup(simulations=simulations))
+        group.setup_working_dir(execution_request)
+
+        group_url = self.live_server_url + ('/api/v1/sim-groups/%s/' % group.id)
+        simulations_url = self.live_server_url + '/api/v1/simulations/'
+        api_urls.write_for_group(group.working_dir, group_url, simulations_url)
+
+        test_utils.Mocks.submit_job.reset_mock()
+        test_utils.Mocks.submit_job.side_effect = lambda executable, working_dir, *args: 'job.' + working_dir.name
+        group.working_dir.chdir()
+        self.initialize_output_dir()
+
+        # The first run dies after the 2nd chunk of simulations was submitted (the callback is called once after the
+        # group starts, once after caching files, and once per simulation).
+        self.callback_count = 0
+
+        def die_in_3rd_simulation():
+            self.count_callback()
+            if self.callback_count == 2 + 3:
+                raise RuntimeError('script died')
+        try:
+            with (self.get_output_dir() / 'stdout-1.txt').open('w') as f:
+                self.assertRaises(RuntimeError, submit_group.main, 'foo', stdout=f,
+                                  test_callback=die_in_3rd_simulation)
+            self.assertEqual(test_utils.Mocks.submit_job.call_count, 4)
+            self.assertEqual(group.simulation_set.count(), 4)
+
+            with (self.get_output_dir() / 'stdout-2.txt').open('w') as f:
+                exit_status = submit_group.main('foo', '--resume', stdout=f)
+        finally:
+            test_utils.Mocks.submit_job.side_effect = None
+        self.assertEqual(exit_status, 0)
+        group = SimulationGroup.objects.get(id=group.id)
+        self.assertEqual(group.script_status, submission_status.SCRIPT_DONE)
+
+        # Only the remaining simulations were created and submitted by the second run
+        self.assertEqual(test_utils.Mocks.submit_job.call_count, len(simulations))
+        db_simulations = list(group.simulation_set.order_by('id'))
+        self.assertEqual([x.id_on_client for x in db_simulations], [x.id_on_client for x in simulations])
+        for simulation in db_simulations:
+            self.assertEqual(simulation.batch_job_id, 'job.%s' % simulation.id)
+
+    @patch('sim_manager.scripts.submit_group.BATCH_SYSTEM', batch.MOCK)
+    @patch('sim_manager.scripts.submit_group.SIMULATION_CHUNK_SIZE', 6)
+    @patch('sim_manager.scripts.submit_group.SUBMISSION_WORKERS', 1)
+    def test_resume_within_chunk(self):
+        """
+        Test that the jobs submitted before the script dies in the middle of a chunk aren't submitted again.
+        """
+        group = SimulationGroup.objects.create(submitter=self.test_user)
+        simulations = [Simulation(model=sim_model.MOCK, model_version='0.1', id_on_client=str(i)) for i in range(6)]
+        execution_request = ExecutionRequest(simulation_group=SimGroup(simulations=simulations))
+        group.setup_working_dir(execution_request)
+
+        group_url = self.live_server_url + ('/api/v1/sim-groups/%s/' % group.id)
+        simulations_url = self.live_server_url + '/api/v1/simulations/'
+        api_urls.write_for_group(group.working_dir, group_url, simulations_url)
+
+        test_utils.Mocks.submit_job.reset_mock()
+        self.die_in_submission = 3
+
+        def submit_job(executable, working_dir, *args):
+            if test_utils.Mocks.submit_job.call_count == self.die_in_submission:
+                raise RuntimeError('script died')
+            return 'job.' + working_dir.name
+        test_utils.Mocks.submit_job.side_effect = submit_job
+        group.working_dir.chdir()
+        self.initialize_output_dir()
+        try:
+            # The first run dies while submitting the 3rd simulation in the group's only chunk
+            with (self.get_output_dir() / 'stdout-1.txt').open('w') as f:
+                self.assertRaises(RuntimeError, submit_group.main, 'foo', stdout=f)
+            self.assertEqual(group.simulation_set.exclude(batch_job_id='').count(), 0)
+
+            self.die_in_submission = None
+            with (self.get_output_dir() / 'stdout-2.txt').open('w') as f:
+                exit_status = submit_group.main('foo', '--resume', stdout=f)
+        finally:
+            test_utils.Mocks.submit_job.side_effect = None
+        self.assertEqual(exit_status, 0)
+
+        # The first 2 jobs were journaled when they were submitted, so only the other 4 were submitted again (the 3rd
+        # simulation's submission failed, so it was attempted by both runs).
+        self.assertEqual(test_utils.Mocks.submit_job.call_count, 3 + 4)
+        submitted_dirs = [call[0][1].name for call in test_utils.Mocks.submit_job.call_args_list]
+        self.assertEqual(len(set(submitted_dirs)), len(simulations))
+        db_simulations = list(group.simulation_set.order_by('id'))
+        for simulation in db_simulations:
+            self.assertEqual(simulation.batch_job_id, 'job.%s' % simulation.id)
+
+    def count_callback(self):
+        self.callback_count += 1
+
+    def run_script(self):
         group = SimulationGroup.objects.create(submitter=self.test_user)
         self.group_id = group.id
         self.assertEqual(group.script_status, submission_status.READY_TO_RUN)
@@ -83,7 +318,8 @@ class MainTests(LiveServerTestCase, UsesDatabaseApi, WritesOutputFiles):
         self.initialize_output_dir()
         stdout = self.get_output_dir() / 'stdout.txt'
         with stdout.open('w') as f:
-            exit_status = submit_group.main('foo', 'bar', stdout=f, test_callback=self.callback)
+            with patch.object(input_files, 'add_to_cache', return_value={}) as self.add_to_cache_mock:
+                exit_status = submit_group.main('foo', 'bar', stdout=f, test_callback=self.callback)
         self.assertEqual(exit_status, 0)
         group = SimulationGroup.objects.get(id=group.id)
         self.assertEqual(group.script_status, submission_status.SCRIPT_DONE)
@@ -106,13 +342,14 @@ class MainTests(LiveServerTestCase, UsesDatabaseApi, WritesOutputFiles):
         Confirm that the submission script cached input files.
         """
         self.assertGroupScriptStatus(submission_status.CACHING_FILES)
-        self.assertTrue(input_files.TestingApi.add_to_cache_mock.called)
-        args, kwargs = input_files.TestingApi.add_to_cache_mock.call_args
+        self.assertTrue(self.add_to_cache_mock.called)
+        args, kwargs = self.add_to_cache_mock.call_args
         self.assertEqual((self.execution_request.input_files,), args)
         self.check_expected_state = self.expect_simulation_created
         self.simulations_created = 0
         test_utils.Mocks.submit_job.reset_mock()
-        test_utils.Mocks.submit_job.return_value = generate_job_id()
+        self.job_ids = dict()  # Key = working directory, value = batch job id
+        test_utils.Mocks.submit_job.side_effect = self.generate_job_id
 
     def expect_simulation_created(self):
         """
@@ -120,11 +357,12 @@ class MainTests(LiveServerTestCase, UsesDatabaseApi, WritesOutputFiles):
         """
         self.assertGroupScriptStatus(submission_status.SUBMITTING_JOBS)
         group = SimulationGroup.objects.get(id=self.group_id)
-        self.assertEqual(group.simulation_set.count(), self.simulations_created + 1)
+        # Simulations are created in chunks, so the records for later simulations in the chunk may already exist.
+        self.assertGreaterEqual(group.simulation_set.count(), self.simulations_created + 1)
         self.simulations_created += 1
 
-        # Check that the working directory is set up properly for the simulation that was just created
-        simulation = group.simulation_set.order_by('created_when').last()
+        # Check that the working directory is set up properly for the simulation that was just submitted
+        simulation = group.simulation_set.order_by('id')[self.simulations_created - 1]
         self.assertTrue(simulation.working_dir.isdir())
         sim_definition_path = simulation.working_dir / SIMULATION_DEFINITION_FILENAME
         self.assertTrue(sim_definition_path.isfile())
@@ -137,25 +375,26 @@ class MainTests(LiveServerTestCase, UsesDatabaseApi, WritesOutputFiles):
         self.assertEqual(sim_definition.id_on_client, expected_sim_definition.id_on_client)
         self.assertEqual(sim_definition.output_url, expected_sim_definition.output_url)
 
-        # Check that the simulation was submitted to the batch system.
-        self.assertTrue(test_utils.Mocks.submit_job.called)
-        args, kwargs = test_utils.Mocks.submit_job.call_args
-        executable, working_dir, cmd_args = args[0], args[1], args[2:]
+        # Check that the simulation was submitted to the batch system.  Simulations are submitted concurrently, so
+        # other simulations may have been submitted since this one.
+        submissions = [args for args, kwargs in test_utils.Mocks.submit_job.call_args_list
+                       if args[1] == simulation.working_dir]
+        self.assertEqual(len(submissions), 1)
+        args = submissions[0]
+        executable, cmd_args = args[0], args[2:]
         self.assertEqual(executable, sys.executable)
-        self.assertEqual(working_dir, simulation.working_dir)
         self.assertEqual(list(cmd_args), [self.simulation_script])
-        self.assertEqual(simulation.batch_job_id, test_utils.Mocks.submit_job.return_value)
-        test_utils.Mocks.submit_job.reset_mock()
+        self.assertEqual(simulation.batch_job_id, self.job_ids[simulation.working_dir])
 
-        if self.simulations_created < len(self.sim_group.simulations):
-            test_utils.Mocks.submit_job.return_value = generate_job_id()
-        else:
+        if self.simulations_created == len(self.sim_group.simulations):
+            test_utils.Mocks.submit_job.side_effect = None
             self.check_expected_state = None
 
+    def generate_job_id(self, executable, working_dir, *args):
+        job_id = str(random.randint(1, 100000))
+        self.job_ids[working_dir] = job_id
+        return job_id
+
     def assertGroupScriptStatus(self, expected_status):
         group = SimulationGroup.objects.get(id=self.group_id)
         self.assertEqual(group.script_status, expected_status)
-
-
-def generate_job_id():
-    return str(random.randint(1, 100000))
\ No newline at end of file
@@ -0,0 +1,101 @@
+# This file is part of the Simulation Manager project for VecNet.
+# For copyright and licensing information about this project, see the
+# NOTICE.txt and LICENSE.md files in its top-level directory; they are
+# available at https://github.com/vecnet/simulation-manager
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Tests for coalescing database writes and the SQLite configuration.
+"""
+
+import shutil
+import tempfile
+import threading
+
+from django.db import connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import TestCase
+from path import path
+
+from sim_manager.write_queue import WriteCoalescer
+
+
+class WriteCoalescerTests(TestCase):
+    """
+    Tests of the WriteCoalescer class.
+    """
+
+    def submit_concurrently(self, coalescer, writes):
+        """
+        Submit writes from separate threads at the same time.
+
+        :return list: The result of each write, or the exception it raised.
+        """
+        results = [None] * len(writes)
+        start = threading.Event()
+
+        def submit(index):
+            start.wait()
+            try:
+                results[index] = coalescer.submit(writes[index])
+            except Exception as exc:
+                results[index] = exc
+            finally:
+                connection.close()  # Each thread has its own database connection
+
+        threads = [threading.Thread(target=submit, args=(i,)) for i in range(len(writes))]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_single_write(self):
+        coalescer = WriteCoalescer(max_batch_size=10, max_delay=0)
+        self.assertEqual(coalescer.submit(lambda: 42), 42)
+        self.assertEqual((coalescer.writes, coalescer.batches), (1, 1))
+
+    def test_concurrent_writes_batched(self):
+        coalescer = WriteCoalescer(max_batch_size=8, max_delay=0.05)
+        results = self.submit_concurrently(coalescer, [(lambda i=i: i * i) for i in range(40)])
+        self.assertEqual(results, [i * i for i in range(40)])
+        self.assertEqual(coalescer.writes, 40)
+        self.assertGreaterEqual(coalescer.batches, 5)  # At most 8 writes per batch
+        self.assertLess(coalescer.batches, 40)
+
+    def test_failed_write(self):
+        def fail():
+            raise ValueError('bad write')
+
+        coalescer = WriteCoalescer(max_batch_size=10, max_delay=0.05)
+        results = self.submit_concurrently(coalescer, [lambda: 'ok', fail, lambda: 'ok'])
+        self.assertEqual(results[0], 'ok')
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(results[2], 'ok')
+        self.assertRaises(ValueError, coalescer.submit, fail)
+
+
+class SqliteConfigurationTests(TestCase):
+    """
+    Tests of the configuration of SQLite connections.
+    """
+
+    def setUp(self):
+        self.temp_dir = path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_wal_mode(self):
+        settings_dict = dict(connection.settings_dict, NAME=self.temp_dir / 'test.sqlite3')
+        file_connection = DatabaseWrapper(settings_dict, alias='wal-test')
+        try:
+            cursor = file_connection.cursor()
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+        finally:
+            file_connection.close()
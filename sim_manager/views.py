@@ -16,6 +16,12 @@ status_to_return = None
 
 captured_request = dict()
 
+# All the requests captured since the list was last cleared (the last one is also in captured_request).
+captured_requests = []
+
+# Statuses to return for the next requests, before status_to_return is used (e.g., to make an upload fail part way).
+statuses_to_return_first = []
+
 
 @csrf_exempt
 def test_output_url(request):
@@ -25,5 +31,10 @@ def test_output_url(request):
     captured_request.clear()
     captured_request['method'] = request.method
     captured_request['body'] = request.body
+    captured_request['headers'] = dict((name, value) for name, value in request.META.items()
+                                       if name.startswith('HTTP_') or name.startswith('CONTENT_'))
+    captured_requests.append(dict(captured_request))
 
-    return HttpResponse(status=status_to_return)
\ No newline at end of file
+    if statuses_to_return_first:
+        return HttpResponse(status=statuses_to_return_first.pop(0))
+    return HttpResponse(status=status_to_return)
@@ -16,6 +16,7 @@ import logging
 from crc_nd.utils.file_io import clean_out_dir
 from django.conf import settings
 
+from .scripts import execution_requests
 from .scripts.constants import EXECUTION_REQUEST_FILENAME
 from .tests.constants import TEST_OUTPUT_ROOT
 
@@ -38,18 +39,21 @@ def get_dir_for_group(group_id):
     return _group_working_dirs / str(group_id)
 
 
-def setup_for_group(group_id, execution_request):
+def setup_for_group(group_id, execution_request, simulations=None):
     """
     Set up a working directory for a simulation group.
 
     :param int group_id: The group's id (used to make a unique path for the working directory).
     :param execution_request: The request to execute the simulation group.
+    :param simulations: Iterable of the group's simulations.  If None, the simulations in the execution request are
+                        used.
     """
     working_dir = get_dir_for_group(group_id)
     _create_working_dir(working_dir)
 
+    # The file is written with the simulations last, so the submission script can read them one at a time.
     execution_request_file = working_dir / EXECUTION_REQUEST_FILENAME
-    execution_request.write_json_file(execution_request_file)
+    execution_requests.write(execution_request_file, execution_request, simulations)
 
 
 def _create_working_dir(working_dir):
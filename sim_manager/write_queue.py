@@ -0,0 +1,135 @@
+# This file is part of the Simulation Manager project for VecNet.
+# For copyright and licensing information about this project, see the
+# NOTICE.txt and LICENSE.md files in its top-level directory; they are
+# available at https://github.com/vecnet/simulation-manager
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0. If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Coalescing concurrent database writes from different requests into batched transactions ("group commit").
+
+SQLite allows only one writer at a time, and each transaction's commit is the expensive part.  When many cluster jobs
+update their simulations' statuses at the same time, each request's write is put in a queue.  One of the waiting
+requests (the leader) runs the queued writes together in a single transaction, each in its own savepoint so a failed
+write doesn't affect the others.  Each request returns after the transaction with its write has been committed, so a
+response still means the write is in the database.
+"""
+
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+
+class PendingWrite(object):
+    """
+    A write waiting in the queue.
+    """
+
+    def __init__(self, write):
+        self.write = write
+        self.result = None
+        self.exc_info = None   # Set if the write raised an exception (or its transaction failed)
+        self.is_finished = False
+        self.is_leader = False
+        self.event = threading.Event()
+
+
+class WriteCoalescer(object):
+    """
+    The queue of writes for a web process.
+    """
+
+    def __init__(self, max_batch_size, max_delay, using=None):
+        """
+        :param int max_batch_size: Maximum number of writes in a transaction.
+        :param float max_delay: Number of seconds that a new leader waits for more writes before starting a batch.
+        :param str using: Alias of the database.
+        """
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.using = using
+        self._lock = threading.Lock()
+        self._pending = []
+        self._has_leader = False
+        self.writes = 0
+        self.batches = 0
+
+    def submit(self, write):
+        """
+        Run a write in a batched transaction.
+
+        :param write: A function (with no arguments) that writes to the database.
+        :return: The function's result, after it has been committed.
+        :raises: Any exception raised by the function (or by the transaction's commit).
+        """
+        pending = PendingWrite(write)
+        with self._lock:
+            self._pending.append(pending)
+            if not self._has_leader:
+                self._has_leader = True
+                pending.is_leader = True
+        while not pending.is_finished:
+            if pending.is_leader:
+                self._lead(pending)
+            else:
+                pending.event.wait()
+                pending.event.clear()
+        if pending.exc_info is not None:
+            raise pending.exc_info[0], pending.exc_info[1], pending.exc_info[2]
+        return pending.result
+
+    def _lead(self, leader):
+        """
+        Run batches of queued writes until the leader's own write is finished, and then hand off the leadership to the
+        oldest write still waiting (if any).
+        """
+        if self.max_delay > 0:
+            time.sleep(self.max_delay)
+        while not leader.is_finished:
+            with self._lock:
+                batch = self._pending[:self.max_batch_size]
+                del self._pending[:len(batch)]
+            self._run_batch(batch)
+        with self._lock:
+            if self._pending:
+                next_leader = self._pending[0]
+                next_leader.is_leader = True
+                next_leader.event.set()
+            else:
+                self._has_leader = False
+
+    def _run_batch(self, batch):
+        try:
+            with transaction.atomic(using=self.using):
+                for pending in batch:
+                    savepoint = transaction.savepoint(using=self.using)
+                    try:
+                        pending.result = pending.write()
+                        transaction.savepoint_commit(savepoint, using=self.using)
+                    except Exception:
+                        transaction.savepoint_rollback(savepoint, using=self.using)
+                        pending.exc_info = sys.exc_info()
+        except Exception:
+            # The transaction couldn't be committed, so none of the writes happened.
+            exc_info = sys.exc_info()
+            for pending in batch:
+                pending.exc_info = pending.exc_info or exc_info
+        finally:
+            with self._lock:
+                self.writes += len(batch)
+                self.batches += 1
+            for pending in batch:
+                pending.is_finished = True
+                pending.event.set()
+
+
+# The queue for status updates in this web process (None if writes aren't coalesced)
+if settings.COALESCE_STATUS_WRITES:
+    status_writes = WriteCoalescer(settings.WRITE_BATCH_SIZE, settings.WRITE_BATCH_DELAY)
+else:
+    status_writes = None